@@ -1,43 +1,109 @@
-from pydoc import text
-from tkinter import YES
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-import pyodbc
-
-from scanner.scanner_interface import run_scanner_script
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response, stream_with_context, g
+from functools import wraps
+
+from scanner.scanner_interface import scan_document
+from scanner.agreement_ner_extractor_spacy import DOCUMENT_ERRORS
+from scanner.batch_ingest import collect_agreement_files, batch_status, run_job
+from scanner import job_queue, model_registry
+from scanner.extraction_cache import cache_stats
+from scanner.uploads import spool_upload
+import base64
+import json
 import os
+import shutil
+import tempfile
+import time
+from datetime import date
 
 from util.normalize import normalize_name
+from util.name_index import client_index
+from util import repository, party_registry, dedupe, analytics, metrics, auth, search_index
+from util.db import integrity_error
+from util.export import spool_agreement_rows, iter_csv, iter_xlsx
+from util.values import canonical_agreement, to_minor_units, to_rate_bps
 
 app = Flask(__name__)
 
-app.secret_key = "bears_eat_beats"
-
-conn_str = (
-    "Driver={SQL Server};"
-    "Server=TROY\\SQLEXPRESS;"
-    "Database=LoanOrg;"
-    "Trusted_Connection=yes;"
-    )
-## Login Page of Application
+## Signs the session cookie that carries the logged-in user; set LOANLENS_SECRET_KEY outside local runs
+app.secret_key = os.environ.get("LOANLENS_SECRET_KEY", "bears_eat_beats")
+
+## Larger request bodies are refused with 413 before they are read; zip archives are also capped on
+## what they expand to (scanner/batch_ingest.py)
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("LOANLENS_MAX_UPLOAD_MB", 200)) * 1024 * 1024
+
+## Database connections are pooled in util/db.py (LOANLENS_DB_BACKEND picks SQL Server or SQLite)
+
+## Every request is timed into util/metrics.py. Send "X-LoanLens-Trace: 1" to get a Server-Timing
+## header breaking the request down into DB calls and scanner stages
+TRACE_HEADER = "X-LoanLens-Trace"
+SLOW_REQUEST_SECONDS = float(os.environ.get("LOANLENS_SLOW_REQUEST_SECONDS", 2))
+METRICS_TOKEN = os.environ.get("LOANLENS_METRICS_TOKEN")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.trace_token = metrics.start_trace(request.headers.get(TRACE_HEADER) == "1")
+
+@app.after_request
+def record_request_time(response):
+    elapsed = time.perf_counter() - g.get("request_started", time.perf_counter())
+    endpoint = request.endpoint or "unmatched"
+    metrics.observe(metrics.HTTP_REQUEST_SECONDS, elapsed, error=response.status_code >= 500,
+                    endpoint=endpoint, method=request.method)
+    if "trace_token" in g:
+        trace = metrics.end_trace(g.pop("trace_token"))
+        if trace is not None:
+            response.headers["Server-Timing"] = metrics.server_timing(trace, elapsed)
+    if elapsed > SLOW_REQUEST_SECONDS:
+        app.logger.warning("Slow request: %s %s took %.0f ms", request.method, endpoint, elapsed * 1000)
+    return response
+
+## Prometheus scrape target. Set LOANLENS_METRICS_TOKEN to require "Authorization: Bearer <token>"
+@app.route("/metrics")
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Forbidden", 403
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+## Pages behind this send anonymous visitors to the login page. Identity comes from the signed session cookie
+def login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if auth.current_user(session) is None:
+            return redirect(url_for("login"))
+        return view(*args, **kwargs)
+    return wrapper
+
+## Same check for JSON endpoints, which answer 401 instead of redirecting
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if auth.current_user(session) is None:
+            return jsonify({"error": "login required"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+## Login Page of Application. Passwords are checked against their PBKDF2 hash (util/auth.py)
 @app.route("/", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
 
-        with pyodbc.connect(conn_str) as conn:
-            cursor=conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM users WHERE username = ? AND password = ?"
-           , (username, password))
-            
-            count=cursor.fetchone()[0]
-            
-            if count > 0:
-                return redirect(url_for("dashboard"))
-            return "Invalid username or password", 401
+        user = auth.authenticate(username, password)
+        if user is not None:
+            auth.log_in(session, user)
+            return redirect(url_for("dashboard"))
+        return "Invalid username or password", 401
 
 
     return render_template("home.html")
+
+@app.route("/logout")
+def logout():
+    session.clear()
+    return redirect(url_for("login"))
+
  ## Register New User for Login Page
 @app.route("/register", methods=["GET", "POST"])
 def register():
@@ -50,16 +116,10 @@ def register():
         if len(username) > 20 or len(password) > 20:
             return "Username or password is too long", 400
 
-        with pyodbc.connect(conn_str) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM users WHERE username=?", (username,))
-            count = cursor.fetchone()[0]
+        if repository.username_exists(username):
+            return "Username already exists", 400
 
-            if count > 0:
-                return "Username already exists", 400
-            
-            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
-            conn.commit()
+        repository.create_user(username, auth.hash_password(password))
 
         flash("User successfully registered")
         return redirect(url_for("login"))
@@ -67,16 +127,16 @@ def register():
     return render_template("register.html")
 
 ## Dashboard is where you can select clients or add a new client. Returns you back to dashboard.html
+## The client list is served from util/auth.py's cache, so this page normally makes no DB call
 @app.route("/dashboard")
+@login_required
 def dashboard():
-    with pyodbc.connect(conn_str) as conn:
-        cursor=conn.cursor()
-        cursor.execute("SELECT client_id,client_name FROM clients WHERE has_report = 'YES'")
-        clients = cursor.fetchall()
+    clients = auth.report_clients()
 
     return render_template("dashboard.html", clients=clients)
 ## Page allows you to add a new client and will redirect you back to dashboard if successful
 @app.route("/add-client", methods=["GET","POST"])
+@login_required
 def add_client():
     if request.method=="POST":
         raw_name = request.form["client_name"]
@@ -87,25 +147,42 @@ def add_client():
         if has_report not in ['YES', 'NO']:
             return "Incorrect Format", 400
 
-        if not raw_name or not has_report:
+        if not raw_name or not normal_name or not has_report:
             return "missing key data", 400
        
 
-        with pyodbc.connect(conn_str) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM clients WHERE LOWER(REPLACE(REPLACE(REPLACE(client_name, ' ', ''), '-', ''), '.','')) = ?", normal_name)
-            result = cursor.fetchone()
+        if repository.client_key_exists(normal_name):
+            return "client already exists"
 
-            if result[0]>0:
-                return "client already exists"
-            cursor.execute("INSERT INTO clients(client_name, has_report) VALUES(?,?)", raw_name, has_report)
-            conn.commit()
-            return redirect(url_for("dashboard"))
+        # Near-duplicates (e.g. "Ltd" vs "Limited") need a second, confirmed submit
+        similar = client_index(repository.list_clients).search(raw_name)
+        if similar and not request.form.get("confirm"):
+            return render_template("add_client.html", similar=similar,
+                                   client_name=raw_name, has_report=has_report)
+
+        client_id = repository.create_client(raw_name, normal_name, has_report)
+        if client_id is None:
+            return "client already exists"
+        client_index(repository.list_clients, refresh=True)
+        auth.invalidate_clients()
+        return redirect(url_for("dashboard"))
 
     return render_template("add_client.html")
 
+## Existing clients whose names look like the given one, for duplicate warnings
+@app.route("/api/clients/similar")
+@api_login_required
+def similar_clients():
+    name = request.args.get("name", "").strip()
+    if not name:
+        return jsonify([])
+    matches = client_index(repository.list_clients).search(name)
+    return jsonify([{"client_id": client_id, "client_name": client_name, "score": score}
+                    for client_id, client_name, score in matches])
+
 ## Page to add loan agreements for specific client selected. Redirects you back to client dashboard when finished
 @app.route("/add-agreement", methods=["GET", "POST"])
+@login_required
 def loan_form():
 
     client_id = session.get("client_id")
@@ -140,20 +217,36 @@ def loan_form():
         except ValueError:
             return "Invalid interest rate format", 400
 
-        #allows the python code to connect to the database you have already made
-        with pyodbc.connect(conn_str) as conn:
-            cursor = conn.cursor()
-            cursor.execute(""" 
-                INSERT INTO demo_loan_agreement ( client_id, lender, borrower, original_date, maturity_date, currency, principal, interest_rate)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, client_id, lender, borrower, original_date, maturity_date, currency, principal, interest_rate)
-            conn.commit()
+        _, matches = store_agreements(client_id, [{
+            "lender": lender,
+            "borrower": borrower,
+            "original_date": original_date,
+            "maturity_date": maturity_date,
+            "currency": currency,
+            "principal": principal,
+            "interest_rate": interest_rate,
+        }])
+        for match in matches[0]:
+            flash(f"Possible {match['kind']} of agreement {match['matches_id']}")
         return redirect(url_for("client_dashboard", client_id=client_id))
 
     return render_template("agreement_entry.html", client_id=client_id)
 
-##Scanning application connection
+## Every new agreement is saved through here so its lender/borrower are resolved to parties.
+## Scanned rows pass their provenance (scanner_interface.scan_document) so they can be re-extracted later.
+## Returns the inserted count and, per row, the existing agreements it duplicates or amends.
+## Rows are matched in canonical form, as they are stored, so scanned spans compare like stored values
+def store_agreements(client_id, rows, provenance=None):
+    rows = [canonical_agreement(party_registry.attach_party_ids(client_id, dict(row))) for row in rows]
+    matches = [dedupe.find_matches(client_id, row) for row in rows]
+    inserted = repository.insert_agreements(client_id, rows, provenance)
+    analytics.invalidate(client_id)
+    search_index.refresh()
+    return inserted, matches
+
+##Scanning application connection. The scan runs on a background worker so the upload returns right away
 @app.route("/scan-agreement", methods=["GET", "POST"])
+@login_required
 def scan_agreement():
     client_id = session.get("client_id")
     if not client_id:
@@ -164,51 +257,136 @@ def scan_agreement():
         if not uploaded_file or uploaded_file.filename == "":
             return "No file uploaded", 400
 
-        temp_path = os.path.join("temp_uploads", uploaded_file.filename)
-        os.makedirs("temp_uploads", exist_ok=True)
-        uploaded_file.save(temp_path)
-
-        data = run_scanner_script(temp_path)
-        os.remove(temp_path)
-
-        with pyodbc.connect(conn_str) as conn:
-            cursor  = conn.cursor()
-            cursor.execute("""
-            INSERT INTO demo_loan_agreement(
-                client_id,original_date, maturity_date, currency, principal, interest_rate, lender, borrower
-                )
-                VALUES (?,?,?,?,?,?,?,?)
-                """, client_id,
-                data.get("original_date"),
-                data.get("maturity_date"),
-                data.get("currency"),
-                data.get("principal"),
-                data.get("interest_rate"),
-                data.get("lender"),
-                data.get("borrower")
-                
-                                )
-            conn.commit()
+        job_queue.submit_job(client_id, uploaded_file.filename, uploaded_file.stream)
+        flash("Agreement queued for scanning")
         return redirect(url_for("client_dashboard", client_id=client_id))
 
+## Runs on a scan worker: scans the stored upload (bytes, or a path for large files) and saves the agreement it found.
+## The job id is stored with the agreement, so a job delivered again after it was saved returns that agreement
+def process_scan_job(job_id, client_id, source):
+    stored = repository.agreement_for_job(job_id)
+    if stored is None:
+        data, provenance = scan_document(source)
+        try:
+            _, matches = store_agreements(client_id, [data], [dict(provenance, job_id=job_id)])
+            return dict(data, matches=matches[0])
+        except integrity_error():
+            # an earlier delivery of the same job saved it first
+            stored = repository.agreement_for_job(job_id)
+            if stored is None:
+                raise
+    return dict(stored, matches=[])
+
+## Submit a single agreement for background scanning
+@app.route("/scan-jobs", methods=["POST"])
+@api_login_required
+def submit_scan_job():
+    client_id = session.get("client_id")
+    if not client_id:
+        return jsonify({"error": "missing client id"}), 400
+
+    uploaded_file = request.files.get("agreement_file")
+    if not uploaded_file or uploaded_file.filename == "":
+        return jsonify({"error": "No file uploaded"}), 400
+
+    job_id = job_queue.submit_job(client_id, uploaded_file.filename, uploaded_file.stream)
+    return jsonify({"job_id": job_id, "status_url": url_for("scan_job_status", job_id=job_id)}), 202
+
+## Status, attempts and timings of a scan job
+@app.route("/scan-jobs/<job_id>")
+@api_login_required
+def scan_job_status(job_id):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    job.pop("result", None)
+    return jsonify(job)
+
+## Extracted fields of a finished scan job
+@app.route("/scan-jobs/<job_id>/result")
+@api_login_required
+def scan_job_result(job_id):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] != "done":
+        return jsonify({"status": job["status"], "error": job["error"]}), 409
+    return jsonify(job["result"])
+
+## Bulk scanning for onboarding. Accepts several files or a zip and returns a job id to poll.
+## The batch is queued like single scans and runs on the scan workers, not in this web process
+@app.route("/scan-agreements/batch", methods=["POST"])
+@api_login_required
+def scan_agreements_batch():
+    client_id = session.get("client_id")
+    if not client_id:
+        return "missing client id", 400
+
+    uploaded_files = [f for f in request.files.getlist("agreement_files") if f and f.filename]
+    if not uploaded_files:
+        return "No file uploaded", 400
+
+    # a batch can wait a while for workers, so its uploads are written to job_dir rather than kept in memory
+    os.makedirs(job_queue.JOB_FILES_DIR, exist_ok=True)
+    job_dir = tempfile.mkdtemp(dir=job_queue.JOB_FILES_DIR, prefix="batch-")
+    try:
+        uploads = [(os.path.basename(f.filename), spool_upload(f.stream, job_dir, max_bytes=0)) for f in uploaded_files]
+        files = collect_agreement_files(uploads, job_dir)
+    except ValueError as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return str(e), 400
+    except Exception:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+    if not files:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return "No PDF or DOCX agreements found in upload", 400
+
+    try:
+        job_id = job_queue.submit_batch_job(client_id, files, job_dir)
+    except Exception:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+    return jsonify({"job_id": job_id, "total": len(files)}), 202
+
+## Runs on a scan worker for a batch job. Its agreements are stored in one transaction under per-file job ids,
+## so a batch delivered again after they were stored doesn't insert them twice
+def process_batch_job(job_id, client_id, files):
+    def store(rows, provenance):
+        if repository.agreement_for_job(provenance[0]["job_id"]) is not None:
+            return len(rows)
+        return store_agreements(client_id, rows, provenance)[0]
+    return run_job(job_id, files, store, lambda progress: job_queue.set_progress(job_id, progress))
+
+## Progress of a batch scan, per file
+@app.route("/scan-agreements/batch/<job_id>")
+@api_login_required
+def scan_agreements_batch_status(job_id):
+    job = batch_status(job_queue.get_job(job_id))
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+## Hit/miss counters and sizes of the scanner's text and entity caches
+@app.route("/api/scanner/cache")
+@api_login_required
+def scanner_cache_stats():
+    return jsonify(cache_stats())
 
 ## Takes the client number so that have that information for the Client Dashboard
 @app.route("/client/<int:client_id>")
+@login_required
 def client_dashboard(client_id):
 
-    with pyodbc.connect(conn_str) as conn:
-        cursor=conn.cursor()
-        cursor.execute("SELECT client_name FROM clients WHERE client_id = ?", client_id)
-        client = cursor.fetchone()
-        client_name = client[0]
-
-        if not client:
-            return "Client not found", 404
-        session['client_id'] = client_id
-    return render_template("client_dashboard.html", client_name=client_name)
+    client_name = auth.client_name(client_id)
+    if client_name is None:
+        return "Client not found", 404
+    session['client_id'] = client_id
+    return render_template("client_dashboard.html", client_name=client_name, client_id=client_id)
 
 ## Simply redirects me to the client_dashboard 
 @app.route("/go-to-client", methods=["POST"])
+@login_required
 def go_to_client():
     client_id = request.form.get("client")
     if not client_id:
@@ -216,36 +394,211 @@ def go_to_client():
 
     return redirect(url_for("client_dashboard", client_id=client_id))
 
-#Returns all loans for client for javascript usage
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv"),
+    "xlsx": (iter_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+def _export_response(client_id, filename, fmt):
+    if fmt not in EXPORT_FORMATS:
+        return "Unsupported export format", 400
+    writer, mimetype = EXPORT_FORMATS[fmt]
+    # rows are spooled first, so the DB connection is back in the pool before the download starts
+    body = stream_with_context(writer(spool_agreement_rows(client_id)))
+    return Response(body, mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'})
+
+## Streams one client's loan book as CSV or Excel. Like the client dashboards it is open to every logged-in
+## analyst: users have no per-client permissions, so any existing client can be exported
+@app.route("/client/<int:client_id>/export.<fmt>")
+@login_required
+def export_client_loans(client_id, fmt):
+    if auth.client_name(client_id) is None:
+        return "Client not found", 404
+    return _export_response(client_id, f"client_{client_id}_loans", fmt)
+
+## Streams every client's loans as CSV or Excel, for any logged-in analyst
+@app.route("/export/all.<fmt>")
+@login_required
+def export_all_loans(fmt):
+    return _export_response(None, "all_loans", fmt)
+
+LOAN_PAGE_SIZE = 100
+MAX_LOAN_PAGE_SIZE = 500
+
+def _encode_cursor(value, row_id) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, row_id], default=str).encode()).decode()
+
+def _decode_cursor(token: str):
+    value, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return value, int(row_id)
+
+def _optional(args, name, parse):
+    value = args.get(name, "").strip()
+    return parse(value) if value else None
+
+#Returns a page of loans for client for javascript usage.
+#Supports filters, sort=id|original_date|maturity_date|principal|interest_rate, order=asc|desc,
+#fields=comma separated columns, limit and the cursor returned as next_cursor
 @app.route('/api/loans')
+@api_login_required
 def api_loans():
     client_id = session.get('client_id')
     if not client_id:
         return jsonify([]), 400
 
+    args = request.args
     try:
-        with pyodbc.connect(conn_str) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT
-                    lender,
-                    borrower,
-                    original_date,
-                    currency,
-                    principal, 
-                    interest_rate,
-                    maturity_date 
-                FROM demo_loan_agreement
-                WHERE client_id = ?
-            """, client_id)
-         
-            cols = [col[0] for col in cursor.description]
-            rows = cursor.fetchall()
-            loans = [dict(zip(cols,row)) for row in rows]
-
+        page_size = int(args.get("limit", LOAN_PAGE_SIZE))
+        if page_size < 1 or page_size > MAX_LOAN_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_LOAN_PAGE_SIZE}")
+        fields = tuple(args["fields"].split(",")) if args.get("fields") else repository.AGREEMENT_COLUMNS
+        sort = args.get("sort", "id")
+        descending = args.get("order", "asc").lower() == "desc"
+        filters = {
+            "date_from": _optional(args, "date_from", date.fromisoformat),
+            "date_to": _optional(args, "date_to", date.fromisoformat),
+            "currency": _optional(args, "currency", str.upper),
+            "lender": _optional(args, "lender", str),
+            "borrower": _optional(args, "borrower", str),
+            "principal_min": _optional(args, "principal_min", float),
+            "principal_max": _optional(args, "principal_max", float),
+            "rate_min": _optional(args, "rate_min", float),
+            "rate_max": _optional(args, "rate_max", float),
+            "lender_party_id": _optional(args, "lender_party_id", int),
+            "borrower_party_id": _optional(args, "borrower_party_id", int),
+        }
+        after = _optional(args, "cursor", _decode_cursor)
+        rows = repository.page_agreements(client_id, filters, columns=fields, sort=sort,
+                                          descending=descending, after=after, page_size=page_size)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
     except Exception as e:
         app.logger.error("Error in /api/loans:", exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
-    return jsonify(loans)
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = _encode_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+    loans = [{col: row[col] for col in ("id",) + fields} for row in rows]
+
+    response = jsonify({"loans": loans, "next_cursor": next_cursor})
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+## Parties (canonical names and aliases) for the selected client, with agreement counts
+@app.route("/api/parties", methods=["GET", "POST"])
+@api_login_required
+def api_parties():
+    client_id = session.get("client_id")
+    if not client_id:
+        return jsonify({"error": "missing client id"}), 400
+
+    if request.method == "POST":
+        payload = request.get_json(silent=True) or {}
+        canonical_name = (payload.get("canonical_name") or "").strip()
+        if not canonical_name or len(canonical_name) > 255:
+            return jsonify({"error": "canonical_name is required"}), 400
+        party_id = party_registry.register_party(client_id, canonical_name, payload.get("aliases") or [])
+        return jsonify({"party_id": party_id}), 201
+
+    return jsonify(repository.list_parties(client_id))
+
+## Pairs of the selected client's parties with similar names. They are never merged automatically
+@app.route("/api/parties/suggestions")
+@api_login_required
+def api_party_suggestions():
+    client_id = session.get("client_id")
+    if not client_id:
+        return jsonify({"error": "missing client id"}), 400
+    return jsonify(party_registry.merge_suggestions(client_id))
+
+## Confirms a suggestion: {"into_party_id": id} takes over this party's aliases and agreements
+@app.route("/api/parties/<int:party_id>/merge", methods=["POST"])
+@api_login_required
+def api_merge_parties(party_id):
+    client_id = session.get("client_id")
+    if not client_id:
+        return jsonify({"error": "missing client id"}), 400
+    payload = request.get_json(silent=True) or {}
+    try:
+        into_party_id = party_registry.merge_parties(client_id, party_id, int(payload["into_party_id"]))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid merge: {e}"}), 400
+    return jsonify({"party_id": into_party_id})
+
+## Re-checks the selected client's whole book for duplicate and amended agreements
+@app.route("/api/duplicates")
+@api_login_required
+def api_duplicates():
+    client_id = session.get("client_id")
+    if not client_id:
+        return jsonify({"error": "missing client id"}), 400
+    return jsonify(dedupe.find_duplicates(client_id))
+
+## Maturity ladder, weighted rates and currency exposure for the selected client (?as_of=YYYY-MM-DD, default today)
+@app.route("/api/analytics")
+@api_login_required
+def api_analytics():
+    client_id = session.get("client_id")
+    if not client_id:
+        return jsonify({"error": "missing client id"}), 400
+    try:
+        as_of = date.fromisoformat(request.args["as_of"]) if request.args.get("as_of") else None
+    except ValueError:
+        return jsonify({"error": "as_of must be YYYY-MM-DD"}), 400
+    return jsonify(analytics.client_analytics(client_id, as_of))
+
+## Comparable transactions across all clients, from util/search_index.py's in-memory index.
+## e.g. ?currency=EUR&tenor_min=3&tenor_max=7&principal_min=10000000&principal_max=50000000&rate_min=4&rate_max=6
+## Also takes party= (lender or borrower name) and q= (words from parties or the scanned text)
+SEARCH_RANGES = {
+    "principal": ("principal_minor", to_minor_units),
+    "rate": ("rate_bps", to_rate_bps),
+    "tenor": ("tenor_days", lambda years: search_index.years_to_days(float(years))),
+}
+
+def _search_bound(args, name, convert):
+    value = _optional(args, name, convert)
+    if value is None and args.get(name, "").strip():
+        raise ValueError(f"{name} is not a valid value")
+    return value
+
+@app.route("/api/search")
+@api_login_required
+def api_search():
+    args = request.args
+    try:
+        page_size = int(args.get("limit", LOAN_PAGE_SIZE))
+        if page_size < 1 or page_size > MAX_LOAN_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_LOAN_PAGE_SIZE}")
+        ranges = {field: (_search_bound(args, f"{name}_min", convert), _search_bound(args, f"{name}_max", convert))
+                  for name, (field, convert) in SEARCH_RANGES.items()}
+        results = search_index.get_index().search(currency=_optional(args, "currency", str), party=_optional(args, "party", str),
+                                                  text=_optional(args, "q", str), ranges=ranges, limit=page_size)
+    except (ValueError, TypeError, OverflowError) as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    return jsonify(results)
+
+## The spaCy model loads on the first scan unless LOANLENS_MODEL_LOAD asks for background warm-up
+## or preloading (use preload with a forking server such as gunicorn --preload)
+model_registry.start()
+
+## Queued scans and batches are processed by a separate worker process: flask --app loanlens scan-workers.
+## Importing this module (e.g. under gunicorn) starts no workers
+def start_scan_workers():
+    return job_queue.start_workers({"scan": process_scan_job, "batch": process_batch_job},
+                                   permanent_errors=DOCUMENT_ERRORS)
+
+@app.cli.command("scan-workers")
+def scan_workers():
+    """Processes queued agreement scans and batches until interrupted."""
+    for worker in start_scan_workers():
+        worker.join()
+
 if __name__=="__main__":
+    # local runs scan in-process; with the debug reloader, only in the child that serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_scan_workers()
     app.run(debug=True)
\ No newline at end of file
@@ -3,41 +3,232 @@
 ner_extractor_spacy.py
 
 Extracts structured fields from loan agreements using a spaCy NER model trained in Doccano.
-Supports PDF (native or OCR) and DOCX input formats with a Tkinter GUI for testing.
+Supports PDF (native or OCR) and DOCX input formats. Run as a module with file
+paths to print their fields, or without arguments for a Tkinter file dialog.
 """
 
+import io
+import logging
 import os
 import re
-import spacy
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from itertools import repeat
 import pdfplumber
 import pytesseract
 from docx import Document
 from pdf2image import convert_from_path
-from tkinter import Tk, filedialog
+try:
+    # pdfplumber 0.11+ wraps pdfminer's parse errors
+    from pdfplumber.utils.exceptions import PdfminerException
+except ImportError:
+    from pdfminer.pdfparser import PDFSyntaxError as PdfminerException
+
+from util.metrics import SCANNER_STAGE_SECONDS, observe, timed
+from .extraction_cache import text_cache, entity_cache, file_sha256, entity_key, model_version
+from .model_registry import get_nlp, SPACY_MODEL_PATH
+
+logger = logging.getLogger(__name__)
 
 # === CONFIGURATION ===
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 POPPLER_PATH = r"C:\poppler\Library\bin"
-SPACY_MODEL_PATH = r"./scanner/trained_transfer_model"
+OCR_DPI = 300
+OCR_WORKERS = int(os.environ.get("LOANLENS_OCR_WORKERS", os.cpu_count() or 1))
+# pages with fewer native characters than this are treated as scanned
+OCR_MIN_PAGE_CHARS = int(os.environ.get("LOANLENS_OCR_MIN_PAGE_CHARS", 10))
+EARLY_EXIT_MAX_PAGES = int(os.environ.get("LOANLENS_EARLY_EXIT_MAX_PAGES", 20))
+DOCX_PARAGRAPHS_PER_PAGE = 40
+
+# Fields the web app stores for each agreement; early-exit extraction stops once all are found
+AGREEMENT_FIELDS = ("original_date", "lender", "borrower", "principal", "currency", "interest_rate", "maturity_date")
+
+# === spaCy NER Model ===
+# The pipeline itself is loaded on first use by model_registry.get_nlp()
+MODEL_VERSION = model_version(SPACY_MODEL_PATH)
+
+# === Document Sources ===
+# A document can be a path, bytes, or a seekable binary stream such as an
+# upload's spooled file. Its type is sniffed from the content, not the name.
+PDF_MAGIC = b"%PDF-"
+ZIP_MAGIC = b"PK\x03\x04"
+# PDF readers accept a header anywhere in the first 1024 bytes
+SNIFF_BYTES = 1024
 
-# === Load spaCy NER Model ===
-print(f"Loading spaCy NER model from '{SPACY_MODEL_PATH}'...")
-nlp = spacy.load(SPACY_MODEL_PATH)
-print("NER model loaded. Labels:", nlp.get_pipe('ner').labels)
+class UnsupportedDocument(ValueError):
+    """The upload is neither a PDF nor a DOCX."""
+
+# Errors a document raises on every attempt (wrong type, corrupt file), so retrying it is pointless
+DOCUMENT_ERRORS = (UnsupportedDocument, zipfile.BadZipFile, PdfminerException)
+
+def open_source(source):
+    """Returns something pdfplumber, python-docx and zipfile can open, rewound to the start."""
+    if isinstance(source, str):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+def sniff_format(source) -> str:
+    """Returns "pdf", "docx", "zip" (any other archive) or None."""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    elif isinstance(source, (bytes, bytearray)):
+        head = bytes(source[:SNIFF_BYTES])
+    else:
+        source.seek(0)
+        head = source.read(SNIFF_BYTES)
+        source.seek(0)
+    if not head.startswith(ZIP_MAGIC):
+        return "pdf" if PDF_MAGIC in head else None
+    try:
+        with zipfile.ZipFile(open_source(source)) as archive:
+            is_docx = "word/document.xml" in archive.namelist()
+    except zipfile.BadZipFile:
+        return None
+    return "docx" if is_docx else "zip"
+
+@contextmanager
+def source_path(source, suffix: str = ".pdf"):
+    """
+    Yields a file path for tools that only take paths (poppler). In-memory
+    sources are written once to a uniquely named temp file, removed on exit.
+    """
+    if isinstance(source, str):
+        yield source
+        return
+    f = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        with f:
+            if isinstance(source, (bytes, bytearray)):
+                f.write(source)
+            else:
+                source.seek(0)
+                for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                    f.write(chunk)
+                source.seek(0)
+        yield f.name
+    finally:
+        os.remove(f.name)
 
 # === Text Extraction ===
-def extract_text_from_pdf(path: str) -> str:
-    with pdfplumber.open(path) as pdf:
-        return "\n".join(page.extract_text() or '' for page in pdf.pages)
+@timed(SCANNER_STAGE_SECONDS, stage="pdf_text")
+def extract_pdf_pages(source) -> list:
+    with pdfplumber.open(open_source(source)) as pdf:
+        return [page.extract_text() or '' for page in pdf.pages]
 
-def ocr_pdf_to_text(path: str) -> str:
-    images = convert_from_path(path, dpi=300, poppler_path=POPPLER_PATH)
+def ocr_pdf_page(path: str, page_number: int) -> str:
+    # Rasterize a single page so only one page image is in memory per worker
+    images = convert_from_path(path, dpi=OCR_DPI, first_page=page_number, last_page=page_number,
+                               poppler_path=POPPLER_PATH)
     return "\n".join(pytesseract.image_to_string(img, config='--psm 6') for img in images)
 
-def extract_text_from_docx(path: str) -> str:
-    doc = Document(path)
+def iter_ocr_pages(path: str, page_numbers: list):
+    """
+    OCRs the given 1-based pages on a process pool and yields
+    (page_number, text) in page order as results become available.
+    """
+    workers = min(OCR_WORKERS, len(page_numbers))
+    if workers <= 1:
+        for page_number in page_numbers:
+            yield page_number, ocr_pdf_page(path, page_number)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from zip(page_numbers, pool.map(ocr_pdf_page, repeat(path), page_numbers))
+
+def serial_ocr_initializer() -> None:
+    """
+    ProcessPoolExecutor initializer for pools that already run one document
+    per process (batch_ingest, batch_extract): OCR runs in the worker itself
+    instead of each worker starting its own OCR pool (up to cpu_count² processes).
+    """
+    global OCR_WORKERS
+    OCR_WORKERS = 1
+
+def needs_ocr(page_text: str) -> bool:
+    return len(page_text.strip()) < OCR_MIN_PAGE_CHARS
+
+def iter_pdf_page_texts(source):
+    """
+    Yields the text of each PDF page in order, using the native text layer
+    where there is one and OCR only for the pages that lack it.
+    """
+    native_pages = extract_pdf_pages(source)
+    scanned = [n for n, text in enumerate(native_pages, start=1) if needs_ocr(text)]
+    if not scanned:
+        yield from native_pages
+        return
+    logger.info("OCR needed for %d of %d pages", len(scanned), len(native_pages))
+    with source_path(source) as path:
+        ocr_pages = iter_ocr_pages(path, scanned)
+        try:
+            for text in native_pages:
+                if needs_ocr(text):
+                    with timed(SCANNER_STAGE_SECONDS, stage="ocr_page"):
+                        _, text = next(ocr_pages)
+                yield text
+        finally:
+            ocr_pages.close()
+
+@timed(SCANNER_STAGE_SECONDS, stage="docx_text")
+def extract_text_from_docx(source) -> str:
+    doc = Document(open_source(source))
     return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
 
+# === Lazy Page Streams ===
+def iter_pdf_pages_lazy(source):
+    # Reads one page at a time and OCRs a page only when it has no text layer;
+    # an in-memory source is written out for poppler only if a page needs OCR.
+    # Time spent on text layers is summed and recorded once per document as
+    # pdf_text, like extract_pdf_pages, when the stream is exhausted or closed
+    text_seconds = 0.0
+    try:
+        with ExitStack() as stack:
+            started = time.perf_counter()
+            pdf = stack.enter_context(pdfplumber.open(open_source(source)))
+            text_seconds += time.perf_counter() - started
+            path = None
+            for page_number, page in enumerate(pdf.pages, start=1):
+                started = time.perf_counter()
+                text = page.extract_text() or ''
+                text_seconds += time.perf_counter() - started
+                if needs_ocr(text):
+                    if path is None:
+                        path = stack.enter_context(source_path(source))
+                    with timed(SCANNER_STAGE_SECONDS, stage="ocr_page"):
+                        text = ocr_pdf_page(path, page_number)
+                yield text
+    finally:
+        observe(SCANNER_STAGE_SECONDS, text_seconds, stage="pdf_text")
+
+def iter_docx_pages(source):
+    # DOCX has no fixed pages, so paragraphs are grouped into page-sized chunks.
+    # Parsing the document is the docx_text cost; chunking it is negligible
+    with timed(SCANNER_STAGE_SECONDS, stage="docx_text"):
+        doc = Document(open_source(source))
+    chunk = []
+    for p in doc.paragraphs:
+        if p.text.strip():
+            chunk.append(p.text)
+        if len(chunk) == DOCX_PARAGRAPHS_PER_PAGE:
+            yield "\n".join(chunk)
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk)
+
+def iter_document_pages(source):
+    kind = sniff_format(source)
+    if kind == "pdf":
+        return iter_pdf_pages_lazy(source)
+    elif kind == "docx":
+        return iter_docx_pages(source)
+    raise UnsupportedDocument(f"Unsupported file type: {kind or 'unknown'}")
+
 # === Trimming & Normalization ===
 def trim_entity_text(label: str, text: str) -> str:
     text = text.strip()
@@ -79,22 +270,24 @@ def normalize_value(raw: str, label: str) -> str:
         return m.group(0) if m else text
 
     elif "principal" in lbl:
-        digits = re.sub(r"[^\d]", "", text)
-        return digits
+        # decimals and scale words ("3.4 million") matter, so the amount is parsed by util.values
+        return text
 
     return text
 
 # === Entity Extraction ===
-def extract_entities(text: str) -> dict:
+def collect_entities(doc, text: str) -> dict:
     results = {}
-    doc = nlp(text)
 
+    # start/end are character offsets of the span in text, kept as provenance
     for ent in doc.ents:
         if ent.label_ not in results:
             clean = trim_entity_text(ent.label_, ent.text)
             results[ent.label_] = {
                 "raw": ent.text.strip(),
-                "value": normalize_value(clean, ent.label_)
+                "value": normalize_value(clean, ent.label_),
+                "start": ent.start_char,
+                "end": ent.end_char,
             }
 
     # Attempt to recover borrower from nearby text if missing
@@ -107,39 +300,133 @@ def extract_entities(text: str) -> dict:
             borrower_name = borrower_match.group(1).strip()
             results["borrower"] = {
                 "raw": borrower_match.group(0),
-                "value": trim_entity_text("borrower", borrower_name)
+                "value": trim_entity_text("borrower", borrower_name),
+                "start": lender_end + borrower_match.start(),
+                "end": lender_end + borrower_match.end(),
             }
 
     return results
 
+@timed(SCANNER_STAGE_SECONDS, stage="ner")
+def extract_entities(text: str) -> dict:
+    return collect_entities(get_nlp()(text), text)
+
+def extract_entities_early_exit(pages, max_pages: int = EARLY_EXIT_MAX_PAGES) -> dict:
+    """
+    Runs NER page by page and stops as soon as every field in AGREEMENT_FIELDS
+    has been found or max_pages have been read. Each page is scanned together
+    with the previous one so entities split over a page break are not missed.
+    Span offsets are into the pages read, joined with newlines.
+    """
+    results = {}
+    previous_page = ""
+    previous_start = page_start = 0
+    for page_number, page_text in enumerate(pages, start=1):
+        window = f"{previous_page}\n{page_text}" if previous_page else page_text
+        window_start = previous_start if previous_page else page_start
+        for label, info in extract_entities(window).items():
+            if label not in results and "start" in info:
+                info = dict(info, start=info["start"] + window_start, end=info["end"] + window_start)
+            results.setdefault(label, info)
+        if all(field in results for field in AGREEMENT_FIELDS) or page_number >= max_pages:
+            break
+        previous_page = page_text
+        previous_start = page_start
+        page_start += len(page_text) + 1
+    return results
+
+@timed(SCANNER_STAGE_SECONDS, stage="ner_batch")
+def extract_entities_batch(texts: list, batch_size: int = None) -> list:
+    """
+    Runs NER over many documents with nlp.pipe. When batch_size is not given
+    spaCy uses the batch_size declared in the model config.
+    """
+    docs = get_nlp().pipe(texts, batch_size=batch_size)
+    return [collect_entities(doc, text) for doc, text in zip(docs, texts)]
+
 # === Main Processing ===
-def extract_agreement_data(path: str) -> dict:
-    ext = os.path.splitext(path)[1].lower()
-    if ext == ".pdf":
-        text = extract_text_from_pdf(path)
-        if not text.strip():
-            print("No native PDF text found; using OCR.")
-            text = ocr_pdf_to_text(path)
-    elif ext == ".docx":
-        text = extract_text_from_docx(path)
+def extract_text(source) -> str:
+    """Text of a PDF or DOCX given as a path, bytes or a seekable binary stream."""
+    kind = sniff_format(source)
+    if kind == "pdf":
+        text = "\n".join(iter_pdf_page_texts(source))
+    elif kind == "docx":
+        text = extract_text_from_docx(source)
     else:
-        raise ValueError(f"Unsupported file type: {ext}")
-    return extract_entities(text)
+        raise UnsupportedDocument(f"Unsupported file type: {kind or 'unknown'}")
+    return text
+
+def extract_entities_cached(text: str) -> dict:
+    key = entity_key(text, MODEL_VERSION)
+    results = entity_cache.get(key)
+    if results is None:
+        results = extract_entities(text)
+        entity_cache.put(key, results)
+    return results
+
+def _recording(pages, read: list):
+    for page_text in pages:
+        read.append(page_text)
+        yield page_text
+
+def extract_document(source, early_exit: bool = False, max_pages: int = EARLY_EXIT_MAX_PAGES) -> dict:
+    """
+    Extracts a document's entities together with what produced them:
+    {"source_hash", "text", "entities", "model_version"}. The text is what
+    NER ran on (with early_exit, only the pages that were read), so the
+    entities can be recomputed from it by a later model without OCR.
+    """
+    file_hash = file_sha256(source)
+    text = text_cache.get(file_hash)
+    if text is None and early_exit:
+        text_key = f"{file_hash}:first-{max_pages}-pages"
+        text = text_cache.get(text_key)
+        results = entity_cache.get(f"{text_key}:{MODEL_VERSION}") if text is not None else None
+        if results is None:
+            read = []
+            pages = iter_document_pages(source)
+            try:
+                results = extract_entities_early_exit(_recording(pages, read), max_pages)
+            finally:
+                pages.close()
+            text = "\n".join(read)
+            text_cache.put(text_key, text)
+            entity_cache.put(f"{text_key}:{MODEL_VERSION}", results)
+    else:
+        if text is None:
+            text = extract_text(source)
+            text_cache.put(file_hash, text)
+        results = extract_entities_cached(text)
+    return {"source_hash": file_hash, "text": text, "entities": results, "model_version": MODEL_VERSION}
+
+def extract_agreement_data(source, early_exit: bool = False) -> dict:
+    return extract_document(source, early_exit=early_exit)["entities"]
+
+# === Entry Point ===
+def print_agreement_data(file_path: str) -> None:
+    print(f"Processing: {file_path}")
+    data = extract_agreement_data(file_path)
+    print("\n=== Extracted Fields ===")
+    if not data:
+        print("No fields extracted.")
+    for label, info in data.items():
+        print(f"{label}: {info['value']} (raw: '{info['raw']}')")
 
-# === GUI Entry Point ===
 if __name__ == "__main__":
-    Tk().withdraw()
-    file_path = filedialog.askopenfilename(
-        title="Select Agreement (.pdf/.docx)",
-        filetypes=[("PDF and DOCX files", "*.pdf *.docx")]
-    )
-    if not file_path:
-        print("No file selected.")
+    # python -m scanner.agreement_ner_extractor_spacy file.pdf [file.docx ...] runs headless;
+    # with no arguments a file dialog opens. Use scanner.batch_extract for bulk runs.
+    import sys
+    if len(sys.argv) > 1:
+        for file_path in sys.argv[1:]:
+            print_agreement_data(file_path)
     else:
-        print(f"Processing: {file_path}")
-        data = extract_agreement_data(file_path)
-        print("\n=== Extracted Fields ===")
-        if not data:
-            print("No fields extracted.")
-        for label, info in data.items():
-            print(f"{label}: {info['value']} (raw: '{info['raw']}')")
+        from tkinter import Tk, filedialog
+        Tk().withdraw()
+        file_path = filedialog.askopenfilename(
+            title="Select Agreement (.pdf/.docx)",
+            filetypes=[("PDF and DOCX files", "*.pdf *.docx")]
+        )
+        if not file_path:
+            print("No file selected.")
+        else:
+            print_agreement_data(file_path)
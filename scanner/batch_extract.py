@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+batch_extract.py
+
+Headless bulk extraction for nightly backfills. Takes PDF/DOCX files,
+directories, glob patterns or JSONL files of {"id", "text"} records, and
+writes one JSON line per document as results come in:
+
+    python -m scanner.batch_extract "agreements/**/*.pdf" texts.jsonl --out results.jsonl --processes 4
+
+Text extraction runs on a process pool and NER on a multiprocess nlp.pipe,
+both in input order with a bounded number of documents in flight, so memory
+stays flat however many inputs there are. Every written line is recorded in
+a checkpoint file (<out>.checkpoint by default); re-running the same command
+skips documents already done and appends to the output.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .agreement_ner_extractor_spacy import extract_text, collect_entities, serial_ocr_initializer
+from .batch_ingest import SUPPORTED_EXTENSIONS, EXTRACT_WORKERS
+from .model_registry import get_nlp
+from .scanner_interface import to_agreement_row
+
+# === CONFIGURATION ===
+NER_PROCESSES = int(os.environ.get("LOANLENS_NER_PROCESSES", 1))
+NER_BATCH_SIZE = 32
+# documents submitted to the extraction pool ahead of the one being written
+EXTRACT_WINDOW_PER_WORKER = 4
+
+# === Inputs ===
+def expand_inputs(inputs: list):
+    """Yields ("file", path) and ("jsonl", path) for each input in a stable order."""
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = (os.path.join(root, name) for root, _, names in os.walk(item) for name in names)
+        elif glob.has_magic(item):
+            paths = glob.iglob(item, recursive=True)
+        else:
+            paths = [item]
+        for path in sorted(paths):
+            ext = os.path.splitext(path)[1].lower()
+            if ext == ".jsonl":
+                yield "jsonl", path
+            elif ext in SUPPORTED_EXTENSIONS and os.path.isfile(path):
+                yield "file", path
+
+def iter_sources(inputs: list, done: set):
+    """
+    Yields (source_id, path, text) for every document not in done. Files
+    have text None (it is extracted later); JSONL records carry their text.
+    """
+    for kind, path in expand_inputs(inputs):
+        if kind == "file":
+            source_id = os.path.normpath(path)
+            if source_id not in done:
+                yield source_id, path, None
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                source_id = str(record.get("id") or f"{path}:{line_number}")
+                if source_id not in done:
+                    yield source_id, path, record.get("text", "")
+
+# === Pipeline ===
+def _extract(path: str):
+    try:
+        return extract_text(path), None
+    except Exception as e:
+        return "", f"{type(e).__name__}: {e}"
+
+def iter_texts(sources, workers: int):
+    """
+    Yields (source_id, path, text, error) in source order. File texts are
+    extracted on a process pool with at most workers * EXTRACT_WINDOW_PER_WORKER
+    documents in flight.
+    """
+    window = max(1, workers * EXTRACT_WINDOW_PER_WORKER)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=serial_ocr_initializer) as pool:
+        for source_id, path, text in sources:
+            pending.append((source_id, path, text if text is not None else pool.submit(_extract, path)))
+            if len(pending) >= window:
+                yield _resolve(pending.popleft())
+        while pending:
+            yield _resolve(pending.popleft())
+
+def _resolve(item):
+    source_id, path, text = item
+    if isinstance(text, str):
+        return source_id, path, text, None
+    text, error = text.result()
+    return source_id, path, text, error
+
+def iter_results(sources, processes: int = NER_PROCESSES, workers: int = EXTRACT_WORKERS,
+                 batch_size: int = NER_BATCH_SIZE):
+    """Yields one result dict per source, in order."""
+    texts = ((text, (source_id, path, error)) for source_id, path, text, error in iter_texts(sources, workers))
+    for doc, (source_id, path, error) in get_nlp().pipe(texts, as_tuples=True, n_process=processes,
+                                                         batch_size=batch_size):
+        result = {"id": source_id, "source": path}
+        if error:
+            result["error"] = error
+        else:
+            entities = collect_entities(doc, doc.text)
+            result["fields"] = to_agreement_row(entities)
+            result["raw"] = {label: info["raw"] for label, info in entities.items()}
+        yield result
+
+# === Checkpointing ===
+def load_checkpoint(checkpoint_path: str, out_path: str) -> set:
+    """
+    Returns the ids already written and cuts the output back to the last
+    checkpointed line, dropping anything written after it (e.g. a partial
+    line from a crash). A partial last checkpoint line is dropped too.
+    """
+    done = set()
+    offset = 0
+    if not os.path.isfile(checkpoint_path):
+        if os.path.isfile(out_path) and os.path.getsize(out_path):
+            raise SystemExit(f"{out_path} exists but has no checkpoint; use --restart or another --out")
+        return done
+    checkpoint_size = 0
+    with open(checkpoint_path, "rb") as f:
+        for line in f:
+            try:
+                source_id, offset = json.loads(line)
+            except ValueError:
+                break  # partial last line
+            done.add(source_id)
+            checkpoint_size += len(line)
+    with open(checkpoint_path, "r+b") as f:
+        f.truncate(checkpoint_size)
+    if os.path.isfile(out_path):
+        with open(out_path, "r+b") as f:
+            f.truncate(offset)
+    return done
+
+def run(inputs: list, out_path: str, checkpoint_path: str, processes: int, workers: int, batch_size: int) -> dict:
+    done = load_checkpoint(checkpoint_path, out_path)
+    counts = {"skipped": len(done), "written": 0, "failed": 0}
+    with open(out_path, "ab") as out, open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for result in iter_results(iter_sources(inputs, done), processes, workers, batch_size):
+            out.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+            out.flush()
+            # id and output size after its line
+            checkpoint.write(json.dumps([result["id"], out.tell()]) + "\n")
+            checkpoint.flush()
+            counts["written"] += 1
+            counts["failed"] += "error" in result
+            if counts["written"] % 100 == 0:
+                print(f"{counts['written']} documents written ({counts['failed']} failed)", file=sys.stderr)
+    return counts
+
+# === CLI Entry Point ===
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Extract agreement fields from many documents into JSONL.")
+    parser.add_argument("inputs", nargs="+", help="PDF/DOCX files, directories, glob patterns or JSONL text files")
+    parser.add_argument("--out", required=True, help="JSONL file to append results to")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <out>.checkpoint)")
+    parser.add_argument("--processes", type=int, default=NER_PROCESSES, help="nlp.pipe processes")
+    parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS, help="text extraction processes")
+    parser.add_argument("--batch-size", type=int, default=NER_BATCH_SIZE, help="nlp.pipe batch size")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    checkpoint_path = args.checkpoint or args.out + ".checkpoint"
+    if args.restart:
+        for path in (checkpoint_path, args.out):
+            if os.path.isfile(path):
+                os.remove(path)
+    counts = run(args.inputs, args.out, checkpoint_path, args.processes, args.extract_workers, args.batch_size)
+    print(f"Done: {counts['written']} written ({counts['failed']} failed), "
+          f"{counts['skipped']} already done.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+batch_ingest.py
+
+Bulk ingestion of loan agreements for client onboarding. Text extraction is
+fanned out to a process pool, then NER runs once over every extracted text
+through nlp.pipe. Batches run as "batch" jobs on the scan workers
+(scanner/job_queue.py), which store their progress for the web app to poll.
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .agreement_ner_extractor_spacy import (extract_text, extract_entities_batch, open_source, sniff_format,
+                                            serial_ocr_initializer, MODEL_VERSION)
+from .extraction_cache import text_cache, entity_cache, file_sha256, entity_key
+from .scanner_interface import to_agreement_row
+from .uploads import COPY_CHUNK_BYTES, discard_upload
+
+# === CONFIGURATION ===
+SUPPORTED_EXTENSIONS = {".pdf", ".docx"}
+EXTRACT_WORKERS = int(os.environ.get("LOANLENS_EXTRACT_WORKERS", os.cpu_count() or 1))
+# corrupt, truncated, encrypted or oddly compressed archives
+ARCHIVE_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError)
+# limits on what the zip archives of one upload may expand to, checked before anything is extracted
+MAX_ARCHIVE_MEMBERS = int(os.environ.get("LOANLENS_MAX_ARCHIVE_MEMBERS", 1000))
+MAX_EXTRACTED_BYTES = int(os.environ.get("LOANLENS_MAX_EXTRACTED_MB", 1024)) * 1024 * 1024
+
+# === Upload Handling ===
+def collect_agreement_files(uploads: list, dest_dir: str) -> list:
+    """
+    Takes (name, source) pairs from spool_upload, expands any zip archives
+    and returns (name, source) pairs for every PDF or DOCX, recognised by
+    content rather than extension. Archive members are written to dest_dir,
+    so a job holds none of them in memory while it waits for a worker.
+    Raises ValueError for an archive that can't be read, or whose members
+    would take the upload past MAX_ARCHIVE_MEMBERS or MAX_EXTRACTED_BYTES.
+    """
+    files = []
+    member_count = extracted_bytes = 0
+    for name, source in uploads:
+        kind = sniff_format(source)
+        if kind == "zip":
+            try:
+                with zipfile.ZipFile(open_source(source)) as archive:
+                    members = [(i, member) for i, member in enumerate(archive.infolist())
+                               if not member.is_dir() and os.path.basename(member.filename)]
+                    # declared sizes bound what is extracted: zipfile reads no more than file_size per member
+                    member_count += len(members)
+                    extracted_bytes += sum(member.file_size for _, member in members)
+                    if member_count > MAX_ARCHIVE_MEMBERS:
+                        raise ValueError(f"{name} has more than {MAX_ARCHIVE_MEMBERS} files")
+                    if extracted_bytes > MAX_EXTRACTED_BYTES:
+                        raise ValueError(f"{name} expands to more than {MAX_EXTRACTED_BYTES // (1024 * 1024)} MB")
+                    for i, member in members:
+                        member_name = os.path.basename(member.filename)
+                        member_path = _extract_member(archive, member, dest_dir, i)
+                        if sniff_format(member_path) in ("pdf", "docx"):
+                            files.append((member_name, member_path))
+                        else:
+                            discard_upload(member_path)
+            except ARCHIVE_ERRORS as e:
+                raise ValueError(f"{name} is not a readable zip archive: {e}") from e
+            discard_upload(source)
+        elif kind in ("pdf", "docx"):
+            files.append((name, source))
+        else:
+            discard_upload(source)
+    return files
+
+def _extract_member(archive: zipfile.ZipFile, member: zipfile.ZipInfo, dest_dir: str, index: int) -> str:
+    # members are flattened so a crafted archive can't write outside dest_dir
+    with archive.open(member) as src, tempfile.NamedTemporaryFile(
+            dir=dest_dir, prefix=f"{index}_", delete=False) as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+    return dst.name
+
+# === Progress ===
+# a running batch reports the stage it is in; the queue's own status covers the rest
+QUEUE_STATUSES = {"queued": "queued", "done": "complete", "failed": "failed"}
+
+def batch_job_id(job_id: str, index: int) -> str:
+    """
+    The id stored with the provenance of a batch's index-th agreement, so a
+    batch delivered again after its agreements were stored is recognised.
+    """
+    return uuid.uuid5(uuid.UUID(job_id), str(index)).hex
+
+def batch_status(job: dict):
+    """A batch job from job_queue.get_job as the progress the web app reports, or None for other jobs."""
+    if job is None or job["kind"] != "batch":
+        return None
+    progress = job["progress"]
+    files = progress["files"]
+    status = QUEUE_STATUSES.get(job["status"]) or progress.get("stage", "extracting")
+    return {
+        "job_id": job["job_id"],
+        "status": status,
+        "created_at": job["submitted_at"],
+        "finished_at": job["finished_at"],
+        "attempts": job["attempts"],
+        "total": len(files),
+        "processed": sum(f.get("status") in ("done", "failed") for f in files),
+        "inserted": (job["result"] or {}).get("inserted", 0),
+        "error": job["error"],
+        "files": [{"name": f["name"], "status": f.get("status", "queued"), "error": f.get("error")} for f in files],
+    }
+
+# === Processing ===
+def run_job(job_id: str, files: list, on_complete, report) -> dict:
+    """
+    Runs on a scan worker for a batch job of (name, path) pairs. Extracts
+    text from every file on a process pool, runs NER in one nlp.pipe pass and
+    hands the agreement rows and their provenance (see
+    scanner_interface.scan_document) to on_complete, which stores them and
+    returns how many were inserted. report(progress) is called as files move
+    through the stages. Returns the job's result, {"inserted": count}.
+    """
+    progress = {"stage": "extracting",
+                "files": [{"name": name, "path": path, "status": "queued", "error": None} for name, path in files]}
+
+    def update_file(index, **fields):
+        progress["files"][index].update(fields)
+        report(progress)
+
+    report(progress)
+    texts = {}
+    hashes = {}
+    workers = max(1, min(EXTRACT_WORKERS, len(files)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=serial_ocr_initializer) as pool:
+        futures = {}
+        for index, (_, path) in enumerate(files):
+            file_hash = hashes[index] = file_sha256(path)
+            cached = text_cache.get(file_hash)
+            if cached is not None:
+                texts[index] = cached
+                update_file(index, status="extracted")
+                continue
+            futures[pool.submit(extract_text, path)] = (index, file_hash)
+            update_file(index, status="extracting")
+        for future in as_completed(futures):
+            index, file_hash = futures[future]
+            try:
+                texts[index] = future.result()
+                text_cache.put(file_hash, texts[index])
+                update_file(index, status="extracted")
+            except Exception as e:
+                update_file(index, status="failed", error=str(e))
+
+    progress["stage"] = "extracting entities"
+    report(progress)
+    order = sorted(texts)
+    entities = {}
+    for index in order:
+        cached = entity_cache.get(entity_key(texts[index], MODEL_VERSION))
+        if cached is not None:
+            entities[index] = cached
+    pending = [index for index in order if index not in entities]
+    for index, raw_data in zip(pending, extract_entities_batch([texts[i] for i in pending])):
+        entity_cache.put(entity_key(texts[index], MODEL_VERSION), raw_data)
+        entities[index] = raw_data
+    rows = [to_agreement_row(entities[index]) for index in order]
+    provenance = [{"source_hash": hashes[index], "text": texts[index], "entities": entities[index],
+                   "model_version": MODEL_VERSION, "job_id": batch_job_id(job_id, index)} for index in order]
+
+    progress["stage"] = "storing"
+    report(progress)
+    inserted = on_complete(rows, provenance) if rows else 0
+    for index in order:
+        progress["files"][index]["status"] = "done"
+    report(progress)
+    return {"inserted": inserted}
@@ -0,0 +1,357 @@
+"""
+Benchmark and accuracy suite for the scanning pipeline.
+
+Generates synthetic agreements (text PDF, DOCX and image-only PDF) from the
+annotated Doccano texts, runs them through the same functions the scanner
+uses, and reports as JSON:
+
+  throughput  docs/sec and pages/sec per format
+  stages      latency of text extraction, OCR, NER and normalization
+  memory      peak RSS of this process and of the OCR workers
+  accuracy    per-label span precision/recall of the model on the dev set,
+              and per-field precision/recall of the normalized values per format
+
+Run from the repository root:
+
+    python -m scanner.benchmark --docs 20 --out benchmark.json
+
+Commit the JSON (or keep it per commit in CI) and diff it to spot regressions.
+Nothing is read from or written to the extraction cache.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from docx import Document
+
+from .agreement_ner_extractor_spacy import (
+    AGREEMENT_FIELDS, MODEL_VERSION, collect_entities, extract_pdf_pages, iter_docx_pages, iter_ocr_pages,
+    needs_ocr, normalize_value, trim_entity_text)
+from .extract_criteria import load_doccano
+from .model_registry import get_nlp
+
+# === CONFIGURATION ===
+SCANNER_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAIN_FILE = os.path.join(SCANNER_DIR, "Troy_train_spacy.jsonl")
+DEV_FILE = os.path.join(SCANNER_DIR, "Troy_dev_spacy.jsonl")
+FORMATS = ("pdf", "docx", "scanned_pdf")
+# Boilerplate appended after the annotated text so documents span several pages
+FILLER_PARAGRAPH = (
+    "Each party shall bear its own costs in connection with the negotiation, preparation and execution "
+    "of this Agreement. No amendment of this Agreement shall be effective unless made in writing and "
+    "signed by both parties. If any provision of this Agreement is held invalid, the remaining provisions "
+    "shall continue in full force and effect.")
+PDF_LINES_PER_PAGE = 54
+PDF_CHARS_PER_LINE = 95
+SCAN_DPI = 200
+SCAN_FONT_SIZE = 28
+
+# === Synthetic Agreements ===
+def gold_fields(text: str, annotations: dict) -> dict:
+    """Normalized value of each labelled field, as the scanner would store it."""
+    fields = {}
+    for start, end, label in annotations["entities"]:
+        if label not in fields:
+            fields[label] = normalize_value(trim_entity_text(label, text[start:end]), label)
+    return fields
+
+def document_lines(text: str, filler_paragraphs: int) -> list:
+    return [line for line in text.split("\n") if line.strip()] + [FILLER_PARAGRAPH] * filler_paragraphs
+
+def _pdf_string(line: str) -> str:
+    data = line.encode("cp1252", errors="replace").decode("latin-1")
+    return "(" + data.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+def write_text_pdf(path: str, lines: list) -> None:
+    """Minimal PDF writer: Helvetica text on Letter pages, enough for pdfplumber."""
+    wrapped = [w for line in lines for w in (textwrap.wrap(line, PDF_CHARS_PER_LINE) or [""])]
+    pages = [wrapped[i:i + PDF_LINES_PER_PAGE] for i in range(0, len(wrapped), PDF_LINES_PER_PAGE)] or [[]]
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    page_ids = []
+    for page_lines in pages:
+        body = "BT /F1 10 Tf 13 TL 54 740 Td " + " ".join(f"{_pdf_string(l)} Tj T*" for l in page_lines) + " ET"
+        objects.append(f"<< /Length {len(body.encode('latin-1'))} >>\nstream\n{body}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{n} 0 R' for n in page_ids)}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+def write_docx(path: str, lines: list) -> None:
+    doc = Document()
+    for line in lines:
+        doc.add_paragraph(line)
+    doc.save(path)
+
+def _scan_font():
+    from PIL import ImageFont
+    for name in ("DejaVuSans.ttf", "arial.ttf"):
+        try:
+            return ImageFont.truetype(name, SCAN_FONT_SIZE)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=SCAN_FONT_SIZE)
+
+def write_scanned_pdf(path: str, lines: list) -> None:
+    """Renders the text to page images and saves them as a PDF with no text layer."""
+    from PIL import Image, ImageDraw
+
+    width, height, margin = int(8.5 * SCAN_DPI), 11 * SCAN_DPI, SCAN_DPI
+    line_height = int(SCAN_FONT_SIZE * 1.4)
+    lines_per_page = (height - 2 * margin) // line_height
+    wrapped = [w for line in lines for w in (textwrap.wrap(line, 80) or [""])]
+    font = _scan_font()
+    images = []
+    for i in range(0, len(wrapped), lines_per_page):
+        image = Image.new("L", (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        for n, line in enumerate(wrapped[i:i + lines_per_page]):
+            draw.text((margin, margin + n * line_height), line, fill=0, font=font)
+        images.append(image)
+    images[0].save(path, "PDF", resolution=SCAN_DPI, save_all=True, append_images=images[1:])
+
+WRITERS = {"pdf": (".pdf", write_text_pdf), "docx": (".docx", write_docx), "scanned_pdf": (".pdf", write_scanned_pdf)}
+
+def generate_corpus(samples: list, count: int, formats, filler_paragraphs: int, out_dir: str) -> list:
+    """Writes count documents per format, cycling through the annotated samples."""
+    corpus = []
+    for fmt in formats:
+        ext, writer = WRITERS[fmt]
+        for i in range(count):
+            text, annotations = samples[i % len(samples)]
+            path = os.path.join(out_dir, f"{fmt}_{i:04d}{ext}")
+            writer(path, document_lines(text, filler_paragraphs))
+            corpus.append({"format": fmt, "path": path, "gold": gold_fields(text, annotations)})
+    return corpus
+
+# === Measurement ===
+def peak_rss_mb() -> dict:
+    try:
+        import resource
+    except ImportError:
+        return {"self": _windows_peak_working_set_mb(), "children": None}
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)}
+
+def _windows_peak_working_set_mb():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+
+def latency_summary(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return {"count": len(ordered), "total_s": round(sum(ordered), 3),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+            "p50_ms": round(percentile(0.5), 2), "p95_ms": round(percentile(0.95), 2),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+def document_pages(path: str, fmt: str, timings: dict) -> list:
+    """Page texts of one document, timing text-layer extraction and OCR separately."""
+    start = time.perf_counter()
+    if fmt == "docx":
+        pages = list(iter_docx_pages(path))
+        timings["text_extraction"].append(time.perf_counter() - start)
+        return pages
+    pages = extract_pdf_pages(path)
+    timings["text_extraction"].append(time.perf_counter() - start)
+    scanned = [n for n, text in enumerate(pages, start=1) if needs_ocr(text)]
+    if scanned:
+        start = time.perf_counter()
+        for page_number, text in iter_ocr_pages(path, scanned):
+            pages[page_number - 1] = text
+        timings["ocr"].append(time.perf_counter() - start)
+    return pages
+
+def _same_value(predicted: str, expected: str) -> bool:
+    return " ".join(predicted.split()).lower() == " ".join(expected.split()).lower()
+
+def run_pipeline(corpus: list, nlp) -> dict:
+    timings = defaultdict(list)
+    per_format = defaultdict(lambda: {"docs": 0, "pages": 0, "seconds": 0.0})
+    counts = defaultdict(lambda: defaultdict(lambda: {"tp": 0, "predicted": 0, "expected": 0}))
+
+    for item in corpus:
+        fmt = item["format"]
+        started = time.perf_counter()
+        pages = document_pages(item["path"], fmt, timings)
+        text = "\n".join(pages)
+
+        start = time.perf_counter()
+        doc = nlp(text)
+        timings["ner"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        fields = collect_entities(doc, text)
+        timings["normalization"].append(time.perf_counter() - start)
+
+        stats = per_format[fmt]
+        stats["docs"] += 1
+        stats["pages"] += len(pages)
+        stats["seconds"] += time.perf_counter() - started
+
+        for label in AGREEMENT_FIELDS:
+            predicted = fields.get(label, {}).get("value")
+            expected = item["gold"].get(label)
+            label_counts = counts[fmt][label]
+            label_counts["predicted"] += predicted is not None
+            label_counts["expected"] += expected is not None
+            label_counts["tp"] += predicted is not None and expected is not None and _same_value(predicted, expected)
+
+    throughput = {fmt: {"docs": s["docs"], "pages": s["pages"], "seconds": round(s["seconds"], 3),
+                        "docs_per_sec": round(s["docs"] / s["seconds"], 3) if s["seconds"] else None,
+                        "pages_per_sec": round(s["pages"] / s["seconds"], 3) if s["seconds"] else None}
+                  for fmt, s in per_format.items()}
+    field_accuracy = {fmt: {label: _precision_recall(c["tp"], c["predicted"], c["expected"])
+                            for label, c in labels.items()}
+                      for fmt, labels in counts.items()}
+    return {"throughput": throughput,
+            "stages": {stage: latency_summary(samples) for stage, samples in timings.items()},
+            "field_accuracy": field_accuracy}
+
+def _precision_recall(tp: int, predicted: int, expected: int) -> dict:
+    precision = tp / predicted if predicted else None
+    recall = tp / expected if expected else None
+    f1 = 2 * precision * recall / (precision + recall) if precision and recall else 0.0
+    return {"precision": None if precision is None else round(precision, 4),
+            "recall": None if recall is None else round(recall, 4),
+            "f1": round(f1, 4), "support": expected}
+
+def ner_span_scores(nlp, samples: list) -> dict:
+    """Exact-span precision/recall per label, as spaCy's scorer computes them."""
+    from spacy.scorer import get_ner_prf
+    from spacy.training import Example
+
+    texts = [text for text, _ in samples]
+    examples = [Example.from_dict(doc, annotations)
+                for doc, (_, annotations) in zip(nlp.pipe(texts), samples)]
+    scores = get_ner_prf(examples)
+    return {
+        "overall": {"precision": round(scores["ents_p"], 4), "recall": round(scores["ents_r"], 4),
+                    "f1": round(scores["ents_f"], 4)},
+        "per_label": {label: {"precision": round(s["p"], 4), "recall": round(s["r"], 4), "f1": round(s["f"], 4)}
+                      for label, s in sorted(scores["ents_per_type"].items())},
+    }
+
+def ner_batch_throughput(nlp, texts: list) -> dict:
+    start = time.perf_counter()
+    for _ in nlp.pipe(texts):
+        pass
+    seconds = time.perf_counter() - start
+    return {"docs": len(texts), "seconds": round(seconds, 3),
+            "docs_per_sec": round(len(texts) / seconds, 3) if seconds else None}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCANNER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(docs_per_format: int, formats, filler_paragraphs: int, eval_file: str, work_dir: str) -> dict:
+    import spacy
+
+    samples = load_doccano(TRAIN_FILE) + load_doccano(DEV_FILE)
+    start = time.perf_counter()
+    nlp = get_nlp()
+    model_load_seconds = time.perf_counter() - start
+
+    corpus = generate_corpus(samples, docs_per_format, formats, filler_paragraphs, work_dir)
+    pipeline = run_pipeline(corpus, nlp)
+    eval_samples = load_doccano(eval_file)
+
+    return {
+        "run": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "spacy": spacy.__version__,
+            "model_version": MODEL_VERSION,
+            "docs_per_format": docs_per_format,
+            "filler_paragraphs": filler_paragraphs,
+            "eval_file": os.path.basename(eval_file),
+        },
+        "model_load_seconds": round(model_load_seconds, 3),
+        "throughput": pipeline["throughput"],
+        "ner_batch": ner_batch_throughput(nlp, [text for text, _ in samples]),
+        "stages": pipeline["stages"],
+        "memory_peak_rss_mb": peak_rss_mb(),
+        "accuracy": {
+            "ner_spans": ner_span_scores(nlp, eval_samples),
+            "fields": pipeline["field_accuracy"],
+        },
+    }
+
+# === CLI Entry Point ===
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark throughput, latency, memory and accuracy of the scanner.")
+    parser.add_argument("--docs", type=int, default=10, help="synthetic documents per format")
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"comma separated subset of {','.join(FORMATS)}")
+    parser.add_argument("--filler", type=int, default=20, help="boilerplate paragraphs appended to each document")
+    parser.add_argument("--eval-file", default=DEV_FILE, help="Doccano JSONL used for span precision/recall")
+    parser.add_argument("--keep-docs", metavar="DIR", help="write the synthetic documents here and keep them")
+    parser.add_argument("--out", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"unknown formats: {', '.join(sorted(unknown))}")
+
+    if args.keep_docs:
+        os.makedirs(args.keep_docs, exist_ok=True)
+        results = run_benchmark(args.docs, formats, args.filler, args.eval_file, args.keep_docs)
+    else:
+        with tempfile.TemporaryDirectory(prefix="loanlens-bench-") as work_dir:
+            results = run_benchmark(args.docs, formats, args.filler, args.eval_file, work_dir)
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,27 @@ import os
 import sys
 import json
 import random
+import shutil
+import time
+from datetime import datetime
 import spacy
 from spacy.training import Example
-from spacy.scorer import Scorer
+from spacy.scorer import get_ner_prf
+from spacy.util import minibatch, compounding, fix_random_seed
 
 # ----------------------------
 # Configuration
 # ----------------------------
 OUTPUT_MODEL = "trained_transfer_model"
+CHECKPOINT_DIR = OUTPUT_MODEL + ".checkpoint"
+TRAINING_STATE_FILE = "training_state.json"
+MAX_EPOCHS = 20
+PATIENCE = 3            # epochs without a better dev F before stopping
+MIN_IMPROVEMENT = 0.001
+DROPOUT = 0.2
+BATCH_START, BATCH_STOP, BATCH_COMPOUND = 4.0, 32.0, 1.001
+EVAL_BATCH_SIZE = 64
+SEED = 0
 
 # ----------------------------
 # Utility: Load Doccano JSONL
@@ -67,48 +80,121 @@ def get_labels(data):
 # Training function
 # ----------------------------
 
-def train_spacy(train_data, dev_data, n_iter=20):
-    # DEBUG: Print how many examples and labels we loaded
+def build_examples(nlp, data):
+    """Builds the Example objects once; they are reused every epoch."""
+    return [Example.from_dict(nlp.make_doc(text), ann) for text, ann in data]
+
+def evaluate(nlp, examples, batch_size=EVAL_BATCH_SIZE):
+    """Scores the NER predictions for examples in memory, without saving the model."""
+    texts = (eg.reference.text for eg in examples)
+    predicted = [Example(doc, eg.reference)
+                 for doc, eg in zip(nlp.pipe(texts, batch_size=batch_size), examples)]
+    return get_ner_prf(predicted)
+
+def save_atomically(nlp, path, state=None):
+    """
+    Writes the pipeline to a temporary directory next to path and swaps it
+    in, so a crash mid-save never leaves a half-written model behind.
+    """
+    tmp_path, old_path = path + ".tmp", path + ".old"
+    for leftover in (tmp_path, old_path):
+        shutil.rmtree(leftover, ignore_errors=True)
+    nlp.to_disk(tmp_path)
+    if state is not None:
+        with open(os.path.join(tmp_path, TRAINING_STATE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+    if os.path.isdir(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def train_spacy(train_data, dev_data, n_iter=MAX_EPOCHS, resume=False):
+    """
+    Trains with compounding minibatches and scores the dev set in memory
+    after every epoch. The best model (by entity F) is saved to OUTPUT_MODEL;
+    training stops after PATIENCE epochs without improvement. The state after
+    each epoch is kept in CHECKPOINT_DIR so resume=True carries on from there.
+    """
     print(f"Loaded {len(train_data)} training examples; {len(dev_data)} dev examples.")
     labels = get_labels(train_data)
     print("Labels extracted from training data:", labels)
-
-    nlp = spacy.blank("en")
-    ner = nlp.add_pipe('ner', last=True)
-    for label in labels:
-        ner.add_label(label)
-
-    optimizer = nlp.initialize()
-    for itn in range(n_iter):
-        random.shuffle(train_data)
+    fix_random_seed(SEED)
+    if spacy.prefer_gpu():
+        print("Training on GPU.")
+
+    state = {"epoch": 0, "best_f": -1.0, "bad_epochs": 0}
+    if resume and os.path.isfile(os.path.join(CHECKPOINT_DIR, TRAINING_STATE_FILE)):
+        nlp = spacy.load(CHECKPOINT_DIR)
+        with open(os.path.join(CHECKPOINT_DIR, TRAINING_STATE_FILE), encoding='utf-8') as f:
+            state = json.load(f)
+        train_examples = build_examples(nlp, train_data)
+        optimizer = nlp.resume_training()
+        print(f"Resuming after epoch {state['epoch']} (best F {state['best_f']:.3f}).")
+    else:
+        nlp = spacy.blank("en")
+        ner = nlp.add_pipe('ner', last=True)
+        for label in labels:
+            ner.add_label(label)
+        train_examples = build_examples(nlp, train_data)
+        optimizer = nlp.initialize(get_examples=lambda: train_examples)
+    dev_examples = build_examples(nlp, dev_data)
+
+    while state["epoch"] < n_iter and state["bad_epochs"] < PATIENCE:
+        started = time.perf_counter()
+        random.shuffle(train_examples)
         losses = {}
-        for text, ann in train_data:
-            doc = nlp.make_doc(text)
-            example = Example.from_dict(doc, ann)
-            nlp.update([example], sgd=optimizer, drop=0.2, losses=losses)
-        print(f"Iteration {itn+1}/{n_iter} - Losses: {losses}")
-
-    os.makedirs(OUTPUT_MODEL, exist_ok=True)
-    nlp.to_disk(OUTPUT_MODEL)
-    print(f"Saved model to {OUTPUT_MODEL}")
-
-    scorer = Scorer()
-    eval_nlp = spacy.load(OUTPUT_MODEL)
-    examples = []
-    for text, ann in dev_data:
-        doc = eval_nlp(text)
-        examples.append(Example.from_dict(doc, ann))
-    dev_scores = scorer.score(examples)
-    print("Dev set scores:", dev_scores)
+        for batch in minibatch(train_examples, size=compounding(BATCH_START, BATCH_STOP, BATCH_COMPOUND)):
+            nlp.update(batch, sgd=optimizer, drop=DROPOUT, losses=losses)
+        state["epoch"] += 1
+
+        scores = evaluate(nlp, dev_examples)
+        f_score = scores["ents_f"]
+        print(f"Epoch {state['epoch']}/{n_iter} - Losses: {losses} - dev P/R/F "
+              f"{scores['ents_p']:.3f}/{scores['ents_r']:.3f}/{f_score:.3f} ({time.perf_counter() - started:.1f}s)")
+        if f_score > state["best_f"] + MIN_IMPROVEMENT:
+            state["best_f"], state["bad_epochs"] = f_score, 0
+            # A new version invalidates cached entities extracted with the previous model
+            nlp.meta["version"] = datetime.now().strftime("%Y.%m.%d-%H%M%S")
+            nlp.meta["performance"] = {k: v for k, v in scores.items() if k != "ents_per_type"}
+            save_atomically(nlp, OUTPUT_MODEL)
+            print(f"Saved best model to {OUTPUT_MODEL}")
+        else:
+            state["bad_epochs"] += 1
+        save_atomically(nlp, CHECKPOINT_DIR, state)
+
+    if state["bad_epochs"] >= PATIENCE:
+        print(f"Stopped early: no improvement for {PATIENCE} epochs.")
+    print(f"Best dev F: {state['best_f']:.3f}")
 
 # ----------------------------
 # Extraction function
 # ----------------------------
 
+def load_docs(fname):
+    """
+    Yields {'id', 'text'} records from a JSONL file (one per line) or a JSON
+    file holding a list of them.
+    """
+    if not os.path.isfile(fname):
+        raise FileNotFoundError(f"Agreements file not found: {fname}")
+    with open(fname, 'r', encoding='utf-8') as f:
+        if fname.lower().endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
 def extract_entities(text, nlp):
     doc = nlp(text)
     return [(ent.label_, ent.text) for ent in doc.ents]
 
+def extract_entities_stream(records, nlp, batch_size=EVAL_BATCH_SIZE):
+    """Yields (record, [(label, text), ...]) using nlp.pipe; records are read lazily."""
+    texts = ((rec.get('text', ''), rec) for rec in records)
+    for doc, rec in nlp.pipe(texts, as_tuples=True, batch_size=batch_size):
+        yield rec, [(ent.label_, ent.text) for ent in doc.ents]
+
 # ----------------------------
 # CLI entrypoint
 # ----------------------------
@@ -116,30 +202,30 @@ def extract_entities(text, nlp):
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage:")
-        print("  python extract_criteria.py train <train.jsonl> <dev.jsonl>")
+        print("  python extract_criteria.py train <train.jsonl> <dev.jsonl> [--resume]")
         print("  python extract_criteria.py extract <agreements.json(.jsonl)>")
         sys.exit(1)
 
     mode = sys.argv[1].lower()
     if mode == 'train':
-        if len(sys.argv) != 4:
+        args = [arg for arg in sys.argv[2:] if arg != '--resume']
+        if len(args) != 2:
             print("Provide both train and dev JSONL files:")
-            print("  python extract_criteria.py train <train.jsonl> <dev.jsonl>")
+            print("  python extract_criteria.py train <train.jsonl> <dev.jsonl> [--resume]")
             sys.exit(1)
-        train_file, dev_file = sys.argv[2], sys.argv[3]
+        train_file, dev_file = args
         train_data = load_doccano(train_file)
         dev_data = load_doccano(dev_file)
-        train_spacy(train_data, dev_data)
+        train_spacy(train_data, dev_data, resume='--resume' in sys.argv)
     elif mode == 'extract':
         if len(sys.argv) != 3:
             print("Provide the agreements file:")
             print("  python extract_criteria.py extract <agreements.json(.jsonl)>")
             sys.exit(1)
         input_path = sys.argv[2]
-        docs = load_docs(input_path) if input_path.lower().endswith('.jsonl') else []
         nlp = spacy.load(OUTPUT_MODEL)
-        for rec in docs:
-            ents = extract_entities(rec['text'], nlp)
+        # For large files, PDFs/DOCX and resumable JSONL output use: python -m scanner.batch_extract
+        for rec, ents in extract_entities_stream(load_docs(input_path), nlp):
             print(f"\n--- Document ID: {rec.get('id','N/A')} ---")
             for lbl, txt in ents:
                 print(f"{lbl}: {txt}")
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+extraction_cache.py
+
+Persistent, content-addressed cache for the scanning pipeline.
+
+Two layers live in one SQLite file:
+  - text:     extracted document text, keyed by the SHA-256 of the file bytes
+  - entities: NER results, keyed by the SHA-256 of the text plus the model version
+
+Retraining the model changes the version in meta.json, so only the entity
+layer misses afterwards. Each layer is size bounded and evicts least recently
+used entries first.
+
+A lookup is a single read on the thread's own connection. Access times and
+hit/miss counts are kept in memory and written in one transaction every
+FLUSH_EVERY lookups or FLUSH_SECONDS, and before a put evicts, so hits don't
+take the database's write lock.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# === CONFIGURATION ===
+CACHE_DB_PATH = os.environ.get("LOANLENS_CACHE_DB", "scanner_cache.sqlite3")
+TEXT_CACHE_MAX_BYTES = int(os.environ.get("LOANLENS_TEXT_CACHE_MB", 512)) * 1024 * 1024
+ENTITY_CACHE_MAX_BYTES = int(os.environ.get("LOANLENS_ENTITY_CACHE_MB", 64)) * 1024 * 1024
+FLUSH_EVERY = 64
+FLUSH_SECONDS = 5.0
+
+_init_lock = threading.Lock()
+# cache databases whose schema this process has already created
+_initialized = set()
+_local = threading.local()
+
+# === Storage ===
+def _connection() -> sqlite3.Connection:
+    """
+    The calling thread's connection, opened on first use. A process forked
+    from this one (extraction pools) opens its own instead of sharing it.
+    """
+    key = (os.getpid(), CACHE_DB_PATH)
+    if getattr(_local, "key", None) != key:
+        _local.conn = _connect()
+        _local.key = key
+    return _local.conn
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=30, isolation_level=None)
+    if CACHE_DB_PATH not in _initialized:
+        with _init_lock:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    layer       TEXT NOT NULL,
+                    key         TEXT NOT NULL,
+                    value       BLOB NOT NULL,
+                    size        INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (layer, key)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_lru ON cache_entries(layer, last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_stats (
+                    layer     TEXT PRIMARY KEY,
+                    hits      INTEGER NOT NULL DEFAULT 0,
+                    misses    INTEGER NOT NULL DEFAULT 0,
+                    evictions INTEGER NOT NULL DEFAULT 0
+                )""")
+            _initialized.add(CACHE_DB_PATH)
+    return conn
+
+class LRUDiskCache:
+    """
+    One size-bounded layer of the cache. Values are JSON-serializable and
+    stored zlib-compressed; size is measured on the compressed bytes.
+    """
+
+    def __init__(self, layer: str, max_bytes: int):
+        self.layer = layer
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._hits = 0
+        self._misses = 0
+        self._flushed_at = time.monotonic()
+
+    def _count(self, conn, column: str, n: int = 1) -> None:
+        conn.execute("INSERT OR IGNORE INTO cache_stats (layer) VALUES (?)", (self.layer,))
+        conn.execute(f"UPDATE cache_stats SET {column} = {column} + ? WHERE layer = ?", (n, self.layer))
+
+    def get(self, key: str):
+        row = _connection().execute(
+            "SELECT value FROM cache_entries WHERE layer = ? AND key = ?", (self.layer, key)).fetchone()
+        with self._lock:
+            if row is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._accessed[key] = time.time()
+            due = (self._hits + self._misses >= FLUSH_EVERY
+                   or time.monotonic() - self._flushed_at > FLUSH_SECONDS)
+        if due:
+            self.flush()
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+    def _take_pending(self) -> tuple:
+        with self._lock:
+            pending = (self._accessed, self._hits, self._misses)
+            self._accessed, self._hits, self._misses = {}, 0, 0
+            self._flushed_at = time.monotonic()
+        return pending
+
+    def _write_pending(self, conn, pending: tuple) -> None:
+        accessed, hits, misses = pending
+        conn.executemany(
+            "UPDATE cache_entries SET last_access = MAX(last_access, ?) WHERE layer = ? AND key = ?",
+            [(at, self.layer, key) for key, at in accessed.items()])
+        if hits:
+            self._count(conn, "hits", hits)
+        if misses:
+            self._count(conn, "misses", misses)
+
+    def flush(self) -> None:
+        """Writes the access times and hit/miss counts gathered since the last flush."""
+        pending = self._take_pending()
+        if not any(pending):
+            return
+        conn = _connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._write_pending(conn, pending)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put(self, key: str, value) -> None:
+        blob = zlib.compress(json.dumps(value).encode("utf-8"))
+        if len(blob) > self.max_bytes:
+            return
+        conn = _connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # eviction should see this process's recent hits
+            self._write_pending(conn, self._take_pending())
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (layer, key, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (self.layer, key, blob, len(blob), time.time()))
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn) -> None:
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE layer = ?", (self.layer,)).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute(
+                "SELECT key, size FROM cache_entries WHERE layer = ? ORDER BY last_access",
+                (self.layer,)).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM cache_entries WHERE layer = ? AND key = ?", (self.layer, key))
+            total -= size
+            evicted += 1
+        self._count(conn, "evictions", evicted)
+
+    def stats(self) -> dict:
+        self.flush()
+        conn = _connection()
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE layer = ?",
+            (self.layer,)).fetchone()
+        row = conn.execute(
+            "SELECT hits, misses, evictions FROM cache_stats WHERE layer = ?", (self.layer,)).fetchone()
+        hits, misses, evictions = row if row else (0, 0, 0)
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes,
+                "hits": hits, "misses": misses, "evictions": evictions}
+
+text_cache = LRUDiskCache("text", TEXT_CACHE_MAX_BYTES)
+entity_cache = LRUDiskCache("entities", ENTITY_CACHE_MAX_BYTES)
+
+@atexit.register
+def _flush_on_exit() -> None:
+    for cache in (text_cache, entity_cache):
+        try:
+            cache.flush()
+        except sqlite3.Error:
+            pass
+
+# === Keys ===
+def file_sha256(source) -> str:
+    """Hash of a document given as a path, bytes or a seekable binary stream."""
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    else:
+        source.seek(0)
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+        source.seek(0)
+    return digest.hexdigest()
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def model_version(model_path: str) -> str:
+    with open(os.path.join(model_path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    return f"{meta.get('name', 'model')}-{meta.get('version', '0.0.0')}"
+
+def entity_key(text: str, version: str) -> str:
+    return f"{text_sha256(text)}:{version}"
+
+def cache_stats() -> dict:
+    return {"text": text_cache.stats(), "entities": entity_cache.stats()}
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+job_queue.py
+
+SQLite-backed queue for agreement scans so uploads don't block web workers.
+Each job keeps its upload until it finishes (inline in the queue database,
+or in JOB_FILES_DIR when it is over the spool limit), so a job whose worker
+crashed is picked up again once its lease expires, without a re-upload.
+
+Jobs have a kind: "scan" for one upload, "batch" for an onboarding batch
+(scanner/batch_ingest.py), whose files wait in a directory under
+JOB_FILES_DIR. Batch handlers report progress, which is stored with the job
+so any web process can answer a poll. Finished jobs are deleted after
+JOB_RETENTION_SECONDS.
+
+Delivery is at-least-once: a job can run again after its handler finished
+its work (e.g. the worker died before recording the result), so handlers get
+the job id to make their writes idempotent. Errors listed as permanent (a
+corrupt or unsupported document) fail the job at once instead of retrying.
+
+Workers run only where start_workers is called, normally a dedicated
+process (`flask --app loanlens scan-workers`), not in every web process.
+The queue's schema is created by whichever process opens it first, so
+uploads can be queued before any worker has started.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from .uploads import spool_upload, discard_upload
+
+# === CONFIGURATION ===
+QUEUE_DB_PATH = os.environ.get("LOANLENS_JOB_DB", "scan_jobs.sqlite3")
+JOB_FILES_DIR = os.environ.get("LOANLENS_JOB_FILES", "scan_jobs")
+SCAN_WORKERS = int(os.environ.get("LOANLENS_SCAN_WORKERS", 2))
+MAX_ATTEMPTS = int(os.environ.get("LOANLENS_SCAN_MAX_ATTEMPTS", 3))
+LEASE_SECONDS = float(os.environ.get("LOANLENS_SCAN_LEASE_SECONDS", 60))
+JOB_RETENTION_SECONDS = float(os.environ.get("LOANLENS_JOB_RETENTION_SECONDS", 24 * 3600))
+POLL_SECONDS = 2.0
+PRUNE_SECONDS = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    job_id           TEXT PRIMARY KEY,
+    kind             TEXT NOT NULL DEFAULT 'scan',
+    client_id        INTEGER,
+    filename         TEXT,
+    file_path        TEXT,
+    upload           BLOB,
+    status           TEXT NOT NULL,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    submitted_at     REAL NOT NULL,
+    started_at       REAL,
+    finished_at      REAL,
+    lease_expires_at REAL,
+    result           TEXT,
+    progress         TEXT,
+    error            TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_scan_jobs_status ON scan_jobs(status, submitted_at);
+"""
+
+# columns added since the first queue databases were created
+_ADDED_COLUMNS = {
+    "upload": "BLOB",
+    "kind": "TEXT NOT NULL DEFAULT 'scan'",
+    "progress": "TEXT",
+}
+
+_wakeup = threading.Event()
+_workers = []
+_pruned_at = 0.0
+# queue databases whose schema this process has already created
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+# === Storage ===
+def _connect() -> sqlite3.Connection:
+    """Opens the queue database, creating its schema on first use in this process."""
+    conn = sqlite3.connect(QUEUE_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    if QUEUE_DB_PATH not in _schema_ready:
+        try:
+            _create_schema(conn)
+        except Exception:
+            conn.close()
+            raise
+    return conn
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    with _schema_lock:
+        if QUEUE_DB_PATH in _schema_ready:
+            return
+        conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(scan_jobs)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE scan_jobs ADD COLUMN {column} {definition}")
+        _schema_ready.add(QUEUE_DB_PATH)
+
+def init_queue() -> None:
+    os.makedirs(JOB_FILES_DIR, exist_ok=True)
+    _connect().close()
+
+def _job_to_dict(row) -> dict:
+    job = dict(row)
+    job.pop("file_path", None)
+    job.pop("upload", None)
+    job.pop("lease_expires_at", None)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+    if job["started_at"] and job["finished_at"]:
+        job["duration_seconds"] = round(job["finished_at"] - job["started_at"], 3)
+    if job["started_at"]:
+        job["queued_seconds"] = round(job["started_at"] - job["submitted_at"], 3)
+    return job
+
+# === Public API ===
+def submit_job(client_id: int, filename: str, stream) -> str:
+    """
+    Registers a scan job for the upload read from stream. Its bytes are kept
+    with the job so they outlive the request that sent them.
+    """
+    job_id = uuid.uuid4().hex
+    source = spool_upload(stream, JOB_FILES_DIR, suffix=os.path.splitext(filename)[1].lower())
+    file_path = source if isinstance(source, str) else None
+    upload = None if file_path else sqlite3.Binary(source)
+
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO scan_jobs (job_id, client_id, filename, file_path, upload, status, submitted_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, client_id, filename, file_path, upload, time.time()))
+    except Exception:
+        discard_upload(file_path)
+        raise
+    finally:
+        conn.close()
+    _wakeup.set()
+    return job_id
+
+def submit_batch_job(client_id: int, files: list, work_dir: str) -> str:
+    """
+    Registers a batch job for (name, path) pairs of files in work_dir, a
+    directory the job owns: it is deleted once the job finishes.
+    """
+    job_id = uuid.uuid4().hex
+    progress = {"files": [{"name": name, "path": path} for name, path in files]}
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO scan_jobs (job_id, kind, client_id, file_path, progress, status, submitted_at) "
+            "VALUES (?, 'batch', ?, ?, ?, 'queued', ?)",
+            (job_id, client_id, work_dir, json.dumps(progress), time.time()))
+    finally:
+        conn.close()
+    _wakeup.set()
+    return job_id
+
+def set_progress(job_id: str, progress: dict) -> None:
+    conn = _connect()
+    try:
+        conn.execute("UPDATE scan_jobs SET progress = ? WHERE job_id = ?", (json.dumps(progress), job_id))
+    finally:
+        conn.close()
+
+def get_job(job_id: str):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM scan_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _job_to_dict(row) if row else None
+
+def _claim_job():
+    """
+    Atomically moves the oldest runnable job to 'running'. Jobs whose lease
+    ran out (their worker died) are runnable again until MAX_ATTEMPTS.
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE scan_jobs SET status = 'failed', finished_at = ?, "
+            "error = COALESCE(error, 'worker stopped responding') "
+            "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+            (now, now, MAX_ATTEMPTS))
+        row = conn.execute(
+            "SELECT * FROM scan_jobs "
+            "WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?) "
+            "ORDER BY submitted_at LIMIT 1", (now,)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE scan_jobs SET status = 'running', attempts = attempts + 1, "
+            "started_at = ?, finished_at = NULL, lease_expires_at = ? WHERE job_id = ?",
+            (now, now + LEASE_SECONDS, row["job_id"]))
+        conn.execute("COMMIT")
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def _renew_lease(job_id: str, stop: threading.Event) -> None:
+    while not stop.wait(LEASE_SECONDS / 3):
+        conn = _connect()
+        try:
+            conn.execute(
+                "UPDATE scan_jobs SET lease_expires_at = ? WHERE job_id = ? AND status = 'running'",
+                (time.time() + LEASE_SECONDS, job_id))
+        finally:
+            conn.close()
+
+def _finish_job(job: dict, result=None, error=None, retry: bool = True) -> None:
+    now = time.time()
+    if error is None:
+        status = "done"
+    elif retry and job["attempts"] < MAX_ATTEMPTS:
+        status = "queued"
+    else:
+        status = "failed"
+
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE scan_jobs SET status = ?, finished_at = ?, lease_expires_at = NULL, "
+            "result = ?, error = ?, upload = CASE WHEN ? = 'queued' THEN upload END WHERE job_id = ?",
+            (status, now, json.dumps(result) if result is not None else None, error, status, job["job_id"]))
+    finally:
+        conn.close()
+
+    if status != "queued":
+        _discard_files(job["file_path"])
+
+def _discard_files(path) -> None:
+    if path and os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        discard_upload(path)
+
+def prune_jobs(retention_seconds: float = JOB_RETENTION_SECONDS) -> int:
+    """Deletes jobs that finished more than retention_seconds ago; returns how many."""
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "DELETE FROM scan_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - retention_seconds,))
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+# === Workers ===
+def _worker_loop(handlers: dict, permanent_errors: tuple) -> None:
+    global _pruned_at
+    while True:
+        try:
+            job = _claim_job()
+            if job is None and time.monotonic() - _pruned_at > PRUNE_SECONDS:
+                _pruned_at = time.monotonic()
+                prune_jobs()
+        except sqlite3.OperationalError:
+            job = None
+        if job is None:
+            _wakeup.wait(POLL_SECONDS)
+            _wakeup.clear()
+            continue
+
+        handler = handlers.get(job["kind"])
+        if handler is None:
+            _finish_job(job, error=f"no handler for {job['kind']} jobs", retry=False)
+            continue
+        _run_job(job, handler, permanent_errors)
+
+def _job_source(job: dict):
+    if job["kind"] == "batch":
+        return [(f["name"], f["path"]) for f in json.loads(job["progress"])["files"]]
+    return job["upload"] if job["upload"] is not None else job["file_path"]
+
+def _run_job(job: dict, handler, permanent_errors: tuple) -> None:
+    stop = threading.Event()
+    threading.Thread(target=_renew_lease, args=(job["job_id"], stop), daemon=True).start()
+    try:
+        result = handler(job["job_id"], job["client_id"], _job_source(job))
+        _finish_job(job, result=result)
+    except permanent_errors as e:
+        _finish_job(job, error=f"{type(e).__name__}: {e}", retry=False)
+    except Exception as e:
+        _finish_job(job, error=f"{type(e).__name__}: {e}")
+    finally:
+        stop.set()
+
+def start_workers(handlers: dict, count: int = SCAN_WORKERS, permanent_errors: tuple = ()) -> list:
+    """
+    Starts count daemon threads that run handlers[kind](job_id, client_id,
+    source) for each queued job. For a scan job source is the upload's bytes
+    or, for uploads over the spool limit, its path; for a batch job it is
+    the list of (name, path) pairs it was submitted with. The handler's
+    return value is stored as the result. A job whose handler raises one of
+    permanent_errors fails without being retried.
+    """
+    init_queue()
+    for i in range(count):
+        worker = threading.Thread(target=_worker_loop, args=(dict(handlers), tuple(permanent_errors)),
+                                  name=f"scan-worker-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    return _workers
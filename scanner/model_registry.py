@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+model_registry.py
+
+Holds the single spaCy pipeline shared by every thread in the process.
+The model is loaded on first use instead of at import, so the web tier
+starts without it. It can also be warmed in a background thread, or
+preloaded in the parent of a forking server (e.g. gunicorn --preload) so
+worker processes share its pages copy-on-write.
+"""
+
+import gc
+import os
+import threading
+
+# === CONFIGURATION ===
+SPACY_MODEL_PATH = r"./scanner/trained_transfer_model"
+# lazy: load on first scan, background: warm in a thread at startup, preload: load now (before forking)
+MODEL_LOAD_MODE = os.environ.get("LOANLENS_MODEL_LOAD", "lazy")
+
+_nlp = None
+_lock = threading.Lock()
+
+def get_nlp():
+    global _nlp
+    if _nlp is None:
+        with _lock:
+            if _nlp is None:
+                import spacy
+                print(f"Loading spaCy NER model from '{SPACY_MODEL_PATH}'...")
+                nlp = spacy.load(SPACY_MODEL_PATH)
+                print("NER model loaded. Labels:", nlp.get_pipe('ner').labels)
+                _nlp = nlp
+    return _nlp
+
+def warm_in_background() -> threading.Thread:
+    worker = threading.Thread(target=get_nlp, name="spacy-warmup", daemon=True)
+    worker.start()
+    return worker
+
+def preload() -> None:
+    """
+    Loads the model in the current (parent) process. gc.freeze() keeps the
+    collector from touching the model's objects afterwards, so forked
+    workers don't dirty and copy the shared pages.
+    """
+    get_nlp()
+    gc.collect()
+    gc.freeze()
+
+def start(mode: str = MODEL_LOAD_MODE) -> None:
+    if mode == "preload":
+        preload()
+    elif mode == "background":
+        warm_in_background()
+    elif mode != "lazy":
+        raise ValueError(f"Unknown model load mode: {mode}")
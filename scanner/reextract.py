@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+reextract.py
+
+Refreshes scanned agreements after trained_transfer_model is retrained:
+
+    python -m scanner.reextract [--batch-size 64] [--dry-run]
+
+Agreements whose provenance names another model version are re-run through
+NER and normalize_value over the text stored with them, so no document is
+opened or OCR'd again. Only the fields whose extracted value changed are
+written back; the others, including any corrected by hand since the scan,
+are left alone. Batches are committed one at a time, so the job can be
+stopped and re-run.
+"""
+
+import argparse
+
+from util import party_registry, repository
+from util.values import canonical_agreement
+from .agreement_ner_extractor_spacy import extract_entities_batch, AGREEMENT_FIELDS, MODEL_VERSION
+from .scanner_interface import to_agreement_row
+
+# === CONFIGURATION ===
+BATCH_SIZE = 64
+# agreement columns derived from each extracted field
+FIELD_COLUMNS = {
+    "original_date": ("original_date",),
+    "maturity_date": ("maturity_date",),
+    "currency": ("currency",),
+    "principal": ("principal", "principal_minor"),
+    "interest_rate": ("interest_rate", "rate_bps"),
+    "lender": ("lender", "lender_party_id"),
+    "borrower": ("borrower", "borrower_party_id"),
+}
+
+def changed_fields(old_entities: dict, new_entities: dict) -> list:
+    old_row, new_row = to_agreement_row(old_entities), to_agreement_row(new_entities)
+    return [field for field in AGREEMENT_FIELDS if old_row[field] != new_row[field]]
+
+def column_values(client_id: int, entities: dict, fields: list) -> dict:
+    """New values of the columns behind fields, in stored (canonical) form."""
+    row = to_agreement_row(entities)
+    if "lender" in fields or "borrower" in fields:
+        party_registry.attach_party_ids(client_id, row)
+    row = canonical_agreement(row)
+    return {column: row[column] for field in fields for column in FIELD_COLUMNS[field]}
+
+def reextract(batch_size: int = BATCH_SIZE, dry_run: bool = False) -> dict:
+    counts = {"checked": 0, "changed": 0, "fields": {}}
+    after_id = 0
+    while True:
+        batch = repository.stale_provenance(MODEL_VERSION, after_id, batch_size)
+        if not batch:
+            break
+        new_entities = extract_entities_batch([text for _, _, text, _ in batch])
+        results = []
+        for (agreement_id, client_id, _, old), new in zip(batch, new_entities):
+            fields = changed_fields(old, new)
+            for field in fields:
+                counts["fields"][field] = counts["fields"].get(field, 0) + 1
+            counts["changed"] += bool(fields)
+            values = column_values(client_id, new, fields) if fields and not dry_run else {}
+            results.append((agreement_id, new, values))
+        if not dry_run:
+            repository.apply_reextraction(MODEL_VERSION, results)
+        counts["checked"] += len(batch)
+        after_id = batch[-1][0]
+        print(f"{counts['checked']} agreements checked, {counts['changed']} changed")
+    return counts
+
+# === CLI Entry Point ===
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=f"Re-extract scanned agreements with model {MODEL_VERSION}.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="agreements per nlp.pipe batch and transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args(argv)
+
+    counts = reextract(args.batch_size, args.dry_run)
+    verb = "would change" if args.dry_run else "changed"
+    print(f"Done: {counts['checked']} agreements checked, {counts['changed']} {verb}.")
+    for field, count in sorted(counts["fields"].items()):
+        print(f"  {field}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,25 @@
-from locale import currency
-from .agreement_ner_extractor_spacy import extract_agreement_data
-
-def run_scanner_script(file_path: str) -> dict:
-    raw_data = extract_agreement_data(file_path)
-
-    return {
-        "original_date": raw_data.get("original_date", {}).get("value",""),
-        "lender": raw_data.get("lender", {}).get("value",""),
-        "borrower": raw_data.get("borrower", {}).get("value",""),
-        "principal": raw_data.get("principal", {}).get("value",""),
-        "currency": raw_data.get("currency", {}).get("value",""),
-        "interest_rate": raw_data.get("interest_rate",{}).get("value",""),
-        "maturity_date": raw_data.get("maturity_date",{}).get("value", "")
-    }
+import os
+from util.metrics import SCANNER_STAGE_SECONDS, timed
+from .agreement_ner_extractor_spacy import extract_document, AGREEMENT_FIELDS
+
+# Opt-in (LOANLENS_EARLY_EXIT=1): stop reading a document once every field has been found (see
+# extract_entities_early_exit). Off by default because the lazy page path OCRs scanned pages one
+# at a time, while the full path OCRs them in parallel
+EARLY_EXIT = os.environ.get("LOANLENS_EARLY_EXIT", "0") == "1"
+
+# Fields stored from the model's raw span, which util.values parses itself ("USD 3.4 million")
+RAW_SPAN_FIELDS = ("principal",)
+
+def to_agreement_row(raw_data: dict) -> dict:
+    return {field: raw_data.get(field, {}).get("raw" if field in RAW_SPAN_FIELDS else "value", "")
+            for field in AGREEMENT_FIELDS}
+
+@timed(SCANNER_STAGE_SECONDS, stage="scan")
+def scan_document(source, early_exit: bool = EARLY_EXIT) -> tuple:
+    """
+    Returns (agreement row, provenance). The provenance (source hash, the
+    text NER ran on, model version and entity spans) is stored next to the
+    agreement so it can be re-extracted when the model is retrained.
+    """
+    extracted = extract_document(source, early_exit=early_exit)
+    return to_agreement_row(extracted["entities"]), extracted
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+uploads.py
+
+Keeps uploaded agreements in memory instead of copying each one to a named
+file before it is scanned. An upload up to SPOOL_MAX_BYTES becomes bytes the
+scanner reads directly; a larger one is streamed to a uniquely named file so
+it never sits in memory whole. Either way the result is a scanner source.
+"""
+
+import os
+import shutil
+import tempfile
+
+# === CONFIGURATION ===
+SPOOL_MAX_BYTES = int(os.environ.get("LOANLENS_UPLOAD_SPOOL_BYTES", 8 * 1024 * 1024))
+COPY_CHUNK_BYTES = 1024 * 1024
+
+def spool_upload(stream, spill_dir: str, suffix: str = "", max_bytes: int = SPOOL_MAX_BYTES):
+    """
+    Reads an upload stream (e.g. FileStorage.stream) and returns its bytes,
+    or the path of a file in spill_dir holding it when it is over max_bytes.
+    max_bytes=0 always writes a file, for uploads that wait a while before
+    they are scanned.
+    """
+    head = stream.read(max_bytes + 1)
+    if len(head) <= max_bytes:
+        return head
+    os.makedirs(spill_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=spill_dir, prefix="upload-", suffix=suffix, delete=False) as f:
+        f.write(head)
+        shutil.copyfileobj(stream, f, COPY_CHUNK_BYTES)
+    return f.name
+
+def discard_upload(source) -> None:
+    """Removes a spilled upload; in-memory uploads need nothing."""
+    if isinstance(source, str):
+        try:
+            os.remove(source)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,17 @@
+-- Indexes for /api/loans: keyset pagination on id within a client,
+-- plus the columns it can sort and filter on.
+
+CREATE NONCLUSTERED INDEX ix_loan_client_id
+    ON [dbo].[demo_loan_agreement](client_id, id);
+
+CREATE NONCLUSTERED INDEX ix_loan_client_original_date
+    ON [dbo].[demo_loan_agreement](client_id, original_date, id);
+
+CREATE NONCLUSTERED INDEX ix_loan_client_maturity_date
+    ON [dbo].[demo_loan_agreement](client_id, maturity_date, id);
+
+CREATE NONCLUSTERED INDEX ix_loan_client_principal
+    ON [dbo].[demo_loan_agreement](client_id, principal, id);
+
+CREATE NONCLUSTERED INDEX ix_loan_client_currency
+    ON [dbo].[demo_loan_agreement](client_id, currency, id);
@@ -0,0 +1,4 @@
+-- Normalized client name (util.normalize.normalize_name) used for duplicate checks.
+-- After running this, fill it with: python -m util.backfill_client_keys
+
+ALTER TABLE [dbo].[clients] ADD [client_key] VARCHAR(100) NULL;
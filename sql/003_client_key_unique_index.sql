@@ -0,0 +1,5 @@
+-- Run after util.backfill_client_keys. Clients left without a key are duplicates to merge.
+
+CREATE UNIQUE NONCLUSTERED INDEX ux_clients_client_key
+    ON [dbo].[clients](client_key)
+    WHERE client_key IS NOT NULL;
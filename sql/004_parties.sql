@@ -0,0 +1,30 @@
+-- Per-client party registry: canonical names plus aliases, and party ids on agreements.
+-- Afterwards resolve existing agreements with: python -m util.party_registry
+
+CREATE TABLE [dbo].[parties](
+    [party_id] INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+    [client_id] INT NOT NULL FOREIGN KEY REFERENCES clients(client_id),
+    [canonical_name] VARCHAR(255) NOT NULL,
+    [party_key] VARCHAR(255) NOT NULL,
+    CONSTRAINT uq_parties_client_key UNIQUE (client_id, party_key)
+);
+
+CREATE TABLE [dbo].[party_aliases](
+    [alias_id] INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+    [party_id] INT NOT NULL FOREIGN KEY REFERENCES parties(party_id),
+    [client_id] INT NOT NULL FOREIGN KEY REFERENCES clients(client_id),
+    [alias] VARCHAR(255) NOT NULL,
+    [alias_key] VARCHAR(255) NOT NULL,
+    CONSTRAINT uq_party_aliases_client_key UNIQUE (client_id, alias_key)
+);
+
+ALTER TABLE [dbo].[demo_loan_agreement] ADD
+    [lender_party_id] INT NULL FOREIGN KEY REFERENCES parties(party_id),
+    [borrower_party_id] INT NULL FOREIGN KEY REFERENCES parties(party_id);
+GO
+
+CREATE NONCLUSTERED INDEX ix_loan_client_lender_party
+    ON [dbo].[demo_loan_agreement](client_id, lender_party_id, id);
+
+CREATE NONCLUSTERED INDEX ix_loan_client_borrower_party
+    ON [dbo].[demo_loan_agreement](client_id, borrower_party_id, id);
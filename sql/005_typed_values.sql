@@ -0,0 +1,15 @@
+-- Typed copies of the rate and principal (util/values.py) and indexes for range queries on them.
+-- After running this, convert existing rows with: python -m util.backfill_typed_values
+
+ALTER TABLE [dbo].[demo_loan_agreement] ADD
+    [rate_bps] DECIMAL(9,2) NULL,
+    [principal_minor] BIGINT NULL;
+GO
+
+DROP INDEX ix_loan_client_principal ON [dbo].[demo_loan_agreement];
+
+CREATE NONCLUSTERED INDEX ix_loan_client_principal_minor
+    ON [dbo].[demo_loan_agreement](client_id, principal_minor, id);
+
+CREATE NONCLUSTERED INDEX ix_loan_client_rate_bps
+    ON [dbo].[demo_loan_agreement](client_id, rate_bps, id);
@@ -0,0 +1,4 @@
+-- Room for PBKDF2 password hashes (util/auth.py). Existing plaintext passwords
+-- keep working and are replaced by a hash the next time each user logs in.
+
+ALTER TABLE [dbo].[users] ALTER COLUMN [password] VARCHAR(255) NOT NULL;
@@ -0,0 +1,14 @@
+-- Where each scanned agreement came from: the source document's hash, the text NER ran on,
+-- the model version and the extracted entity spans (JSON). Used by python -m scanner.reextract.
+
+CREATE TABLE [dbo].[agreement_provenance](
+    [agreement_id] INT NOT NULL PRIMARY KEY FOREIGN KEY REFERENCES demo_loan_agreement(id),
+    [source_hash] CHAR(64) NOT NULL,
+    [model_version] VARCHAR(100) NOT NULL,
+    [extracted_text] NVARCHAR(MAX) NOT NULL,
+    [entities] NVARCHAR(MAX) NOT NULL,
+    [extracted_at] DATETIME2 NOT NULL
+);
+
+CREATE NONCLUSTERED INDEX ix_provenance_model_version
+    ON [dbo].[agreement_provenance](model_version, agreement_id);
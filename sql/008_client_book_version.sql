@@ -0,0 +1,5 @@
+-- Bumped for each agreement changed in place (python -m scanner.reextract, util.backfill_typed_values),
+-- so the analytics cache stamp (count, max id, book version) changes even when no row is added.
+
+ALTER TABLE [dbo].[clients] ADD
+    [book_version] INT NOT NULL CONSTRAINT df_clients_book_version DEFAULT 0;
@@ -0,0 +1,10 @@
+-- The scan job that inserted each agreement. Jobs are delivered at least once, so a retried job
+-- finds its agreement here instead of inserting it again.
+
+ALTER TABLE [dbo].[agreement_provenance] ADD
+    [job_id] CHAR(32) NULL;
+GO
+
+CREATE UNIQUE NONCLUSTERED INDEX ux_provenance_job_id
+    ON [dbo].[agreement_provenance](job_id)
+    WHERE job_id IS NOT NULL;
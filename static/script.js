@@ -1,25 +1,44 @@
 // static/script.js
 
+const LOANS_PAGE_SIZE = 200;
+
 document.addEventListener('DOMContentLoaded', () => {
     console.log('script.js: DOMContentLoaded');
+    loadLoans();
+});
 
-    fetch('/api/loans')
-        .then(response => {
+/**
+ * Fetch the client's loans one page at a time, following next_cursor,
+ * and append each page to the table as soon as it arrives.
+ */
+async function loadLoans() {
+    let cursor = null;
+    let firstPage = true;
+    try {
+        do {
+            const params = new URLSearchParams({ limit: LOANS_PAGE_SIZE, fields: columnOrder.join(',') });
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            const response = await fetch(`/api/loans?${params}`);
             console.log('script.js: fetch response', response);
             if (!response.ok) {
                 throw new Error(`Server returned HTTP ${response.status}`);
             }
-            return response.json();
-        })
-        .then(loans => {
-            console.log('script.js: loans data', loans);
-            renderTable(loans);
-        })
-        .catch(err => {
-            console.error('script.js error:', err);
-            showError(err.message);
-        });
-});
+            const page = await response.json();
+            if (firstPage) {
+                renderTable(page.loans);
+                firstPage = false;
+            } else {
+                appendRows(page.loans);
+            }
+            cursor = page.next_cursor;
+        } while (cursor);
+    } catch (err) {
+        console.error('script.js error:', err);
+        showError(err.message);
+    }
+}
 
 /**
  * Populate the #loans-table tbody with loan rows,
@@ -39,15 +58,23 @@ function renderTable(loans) {
         return;
     }
 
-    const columnOrder = [
-        "lender",
-        "borrower",
-        "original_date",
-        "currency",
-        "principal",
-        "interest_rate",
-        "maturity_date"
-    ];
+    appendRows(loans);
+}
+
+const columnOrder = [
+    "lender",
+    "borrower",
+    "original_date",
+    "currency",
+    "principal",
+    "interest_rate",
+    "maturity_date"
+];
+
+/** Append loan rows to the table in one DOM update */
+function appendRows(loans) {
+    const tbody = document.querySelector('#loans-table tbody');
+    const fragment = document.createDocumentFragment();
 
     loans.forEach(loan => {
         const row = document.createElement('tr');
@@ -56,8 +83,9 @@ function renderTable(loans) {
             cell.textContent = loan[col] || "";  // fallback if key is missing
             row.appendChild(cell);
         });
-        tbody.appendChild(row);
+        fragment.appendChild(row);
     });
+    tbody.appendChild(fragment);
 }
 
 /** Show an error message in the table if something breaks */
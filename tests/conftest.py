@@ -0,0 +1,22 @@
+"""
+Shared fixtures. Tests run against the SQLite backend of util.db, so no
+SQL Server is needed: python -m pytest from the repository root.
+"""
+
+import pytest
+
+from util import db, name_index, party_registry, repository, search_index
+
+@pytest.fixture
+def database(tmp_path):
+    """A fresh SQLite database behind util.db's pool, with no cached registries or index."""
+    pool = db.configure(db.SqliteBackend(str(tmp_path / "loanlens.sqlite3")))
+    name_index._client_index = None
+    party_registry._registries.clear()
+    search_index._index = None
+    yield pool
+    pool.close_all()
+
+@pytest.fixture
+def client_id(database):
+    return repository.create_client("Acme Lending", "acmelending", "NO")
@@ -0,0 +1,55 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from util import analytics, db, repository
+from util.frames import FRAME_COLUMNS, agreement_frame
+
+AS_OF = date(2024, 1, 1)
+
+@pytest.fixture
+def book(client_id):
+    analytics._cache.clear()
+    repository.insert_agreements(client_id, [
+        {"currency": "EUR", "principal": "EUR 10,000,000", "interest_rate": "4%", "maturity_date": "June 30, 2024"},
+        {"currency": "eur", "principal": "30 million", "interest_rate": "6%", "maturity_date": "2027-01-01"},
+        {"currency": "USD", "principal": "5,000,000", "interest_rate": None, "maturity_date": "2020-01-01"},
+        {"currency": None, "principal": "1000", "interest_rate": "5%", "maturity_date": None},
+    ])
+    yield client_id
+    analytics._cache.clear()
+
+def test_frame_is_built_from_the_typed_columns(book):
+    # the text columns are only for display; the frame never reads them
+    with db.connection() as conn:
+        conn.execute("UPDATE demo_loan_agreement SET principal = NULL, interest_rate = 'n/a'")
+        conn.commit()
+    frame = agreement_frame(repository.agreement_rows(book, FRAME_COLUMNS))
+    assert frame["principal"].tolist() == [10_000_000.0, 30_000_000.0, 5_000_000.0, 1000.0]
+    assert frame["interest_rate"].tolist()[:2] == [4.0, 6.0]
+    assert frame["currency"].tolist() == ["EUR", "EUR", "USD", ""]
+    assert str(frame["maturity_date"].iloc[0].date()) == "2024-06-30"
+
+def test_maturity_ladder(book):
+    ladder = analytics.client_analytics(book, AS_OF)["maturity_ladder"]
+    assert [(b["bucket"], b["count"], b["principal"]) for b in ladder] == [
+        ("matured", 1, 5_000_000.0), ("0-1y", 1, 10_000_000.0), ("3-5y", 1, 30_000_000.0),
+        ("no maturity date", 1, 1000.0)]
+
+def test_currency_exposure_and_weighted_rates(book):
+    result = analytics.client_analytics(book, AS_OF)
+    exposure = {c["currency"]: c for c in result["currency_exposure"]}
+    assert (exposure["EUR"]["principal"], exposure["EUR"]["outstanding_principal"]) == (40_000_000.0, 40_000_000.0)
+    assert (exposure["USD"]["principal"], exposure["USD"]["outstanding_principal"]) == (5_000_000.0, 0.0)
+    # (10m * 4% + 30m * 6%) / 40m; USD has a principal but no rate
+    assert result["weighted_rates"] == {"EUR": 5.5, "USD": None, "unknown": 5.0}
+    assert result["agreements"] == 4
+
+def test_results_are_cached_until_the_book_changes(book):
+    first = analytics.client_analytics(book, AS_OF)
+    assert analytics.client_analytics(book, AS_OF) is first
+    # inserted by another process: no invalidate() here, but the stamp moves
+    repository.insert_agreements(book, [{"currency": "GBP", "principal": "100"}])
+    assert analytics.client_analytics(book, AS_OF)["agreements"] == 5
@@ -0,0 +1,51 @@
+import pytest
+
+from util import auth, repository
+
+@pytest.fixture(autouse=True)
+def fast_hashes(monkeypatch):
+    monkeypatch.setattr(auth, "PBKDF2_ITERATIONS", 1000)
+    auth.invalidate_clients()
+    yield
+    auth.invalidate_clients()
+
+def test_hashes_verify_and_are_salted():
+    stored = auth.hash_password("s3cret")
+    assert stored.startswith("pbkdf2_sha256$1000$")
+    assert auth.verify_password(stored, "s3cret") == (True, False)
+    assert auth.verify_password(stored, "wrong") == (False, False)
+    assert auth.hash_password("s3cret") != stored
+
+def test_login_checks_the_hash(database):
+    repository.create_user("alice", auth.hash_password("s3cret"))
+    user = auth.authenticate("alice", "s3cret")
+    assert user["username"] == "alice"
+    assert auth.authenticate("alice", "wrong") is None
+    assert auth.authenticate("bob", "s3cret") is None
+
+def test_plaintext_and_old_hashes_are_rehashed_at_login(database, monkeypatch):
+    repository.create_user("alice", "s3cret")
+    assert auth.authenticate("alice", "s3cret") is not None
+    assert repository.get_user("alice")["password"].startswith("pbkdf2_sha256$1000$")
+
+    monkeypatch.setattr(auth, "PBKDF2_ITERATIONS", 2000)
+    assert auth.authenticate("alice", "s3cret") is not None
+    assert repository.get_user("alice")["password"].startswith("pbkdf2_sha256$2000$")
+
+def test_session_holds_the_logged_in_user():
+    session = {"client_id": 3}
+    assert auth.current_user(session) is None
+    auth.log_in(session, {"id": 1, "username": "alice"})
+    assert session == {"user_id": 1, "username": "alice"}
+    assert auth.current_user(session) == {"id": 1, "username": "alice"}
+
+def test_client_list_is_cached_until_invalidated(client_id, monkeypatch):
+    assert auth.report_clients() == []
+    other = repository.create_client("Other Lending", "otherlending", "YES")
+    # cached: the new client isn't listed yet, but can still be looked up by id
+    assert auth.report_clients() == []
+    assert auth.client_name(other) == "Other Lending"
+    auth.invalidate_clients()
+    assert auth.report_clients() == [{"client_id": other, "client_name": "Other Lending"}]
+    assert auth.client_name(client_id) == "Acme Lending"
+    assert auth.client_name(999) is None
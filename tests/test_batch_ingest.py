@@ -0,0 +1,54 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+for module in ("pdfplumber", "pytesseract", "pdf2image", "docx"):
+    pytest.importorskip(module)
+
+from scanner import batch_ingest
+
+PDF = b"%PDF-1.4\n%agreement\n"
+
+def _zip(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+def test_archives_are_expanded_to_files_on_disk(tmp_path):
+    upload = _zip({"loans/a.pdf": PDF, "../../b.pdf": PDF, "notes.txt": b"not an agreement", "empty/": b""})
+    files = batch_ingest.collect_agreement_files([("batch.zip", upload), ("c.pdf", PDF)], str(tmp_path))
+    assert [name for name, _ in files] == ["a.pdf", "b.pdf", "c.pdf"]
+    # members are flattened into dest_dir; the non-agreement member is removed
+    paths = [source for _, source in files[:2]]
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+    assert all(os.path.dirname(path) == str(tmp_path) for path in paths)
+
+def test_unreadable_archives_are_rejected(tmp_path):
+    upload = bytearray(_zip({"a.pdf": PDF * 1000}))
+    # corrupt the compressed data of the member
+    upload[40:60] = b"\xff" * 20
+    with pytest.raises(ValueError, match="not a readable zip archive"):
+        batch_ingest.collect_agreement_files([("batch.zip", bytes(upload))], str(tmp_path))
+
+def test_archive_limits_are_checked_before_extracting(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_ingest, "MAX_EXTRACTED_BYTES", 1024 * 1024)
+    bomb = _zip({"a.pdf": PDF + b"\0" * (2 * 1024 * 1024)})
+    assert len(bomb) < 10 * 1024
+    with pytest.raises(ValueError, match="expands to more than 1 MB"):
+        batch_ingest.collect_agreement_files([("bomb.zip", bomb)], str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+    monkeypatch.setattr(batch_ingest, "MAX_ARCHIVE_MEMBERS", 2)
+    with pytest.raises(ValueError, match="more than 2 files"):
+        batch_ingest.collect_agreement_files([("a.zip", _zip({"a.pdf": PDF, "b.pdf": PDF})),
+                                              ("b.zip", _zip({"c.pdf": PDF}))], str(tmp_path))
+
+def test_batch_job_ids_are_stable_per_file():
+    job_id = "0" * 32
+    assert batch_ingest.batch_job_id(job_id, 0) == batch_ingest.batch_job_id(job_id, 0)
+    assert batch_ingest.batch_job_id(job_id, 0) != batch_ingest.batch_job_id(job_id, 1)
+    assert len(batch_ingest.batch_job_id(job_id, 0)) == 32
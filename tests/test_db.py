@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from util import db
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = db.ConnectionPool(db.SqliteBackend(str(tmp_path / "pool.sqlite3")), size=2, timeout=0.05)
+    yield pool
+    pool.close_all()
+
+def test_released_connection_is_reused(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+
+def test_acquire_times_out_when_every_connection_is_in_use(pool):
+    pool.acquire()
+    pool.acquire()
+    with pytest.raises(db.PoolTimeout):
+        pool.acquire()
+
+def test_acquire_waits_for_a_release(pool):
+    pool.timeout = 5
+    first, second = pool.acquire(), pool.acquire()
+    releaser = threading.Timer(0.05, pool.release, args=(second,))
+    releaser.start()
+    assert pool.acquire() is second
+    releaser.join()
+    pool.release(first)
+
+def test_release_rolls_back_uncommitted_work(pool):
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", ("alice", "x"))
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+def test_failed_connect_frees_its_slot(pool, monkeypatch):
+    def refuse():
+        raise OSError("database unavailable")
+    monkeypatch.setattr(pool.backend, "connect", refuse)
+    for _ in range(pool.size + 1):
+        with pytest.raises(OSError):
+            pool.acquire()
+    monkeypatch.undo()
+    assert pool.acquire() is not None
+
+def test_execute_returns_every_row_and_can_run_again(pool):
+    with pool.connection() as conn:
+        sql = "SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3"
+        result = conn.execute(sql)
+        assert tuple(result.fetchone()) == (1,)
+        # the statement's cursor is free again even though rows were left unread
+        assert [tuple(row) for row in conn.execute(sql)] == [(1,), (2,), (3,)]
+        assert [tuple(row) for row in result.fetchall()] == [(2,), (3,)]
+        assert result.fetchone() is None
+
+def test_statement_cache_is_bounded(pool, monkeypatch):
+    monkeypatch.setattr(db, "STATEMENT_CACHE_SIZE", 2)
+    with pool.connection() as conn:
+        for n in range(5):
+            conn.execute(f"SELECT {n}")
+        assert len(conn._statements) == 2
+
+def test_returning_gives_the_inserted_id(database):
+    with db.connection() as conn:
+        insert = db.returning("INSERT INTO users (username, password) VALUES (?, ?)", "id")
+        first = conn.execute(insert, ("alice", "x")).fetchone()[0]
+        second = conn.execute(insert, ("bob", "y")).fetchone()[0]
+        conn.commit()
+    assert second == first + 1
+
+def test_sqlserver_returning_uses_output_inserted():
+    sql = db.SqlServerBackend.returning(None, "INSERT INTO parties (client_id) VALUES (?)", "party_id")
+    assert sql == "INSERT INTO parties (client_id) OUTPUT INSERTED.party_id VALUES (?)"
@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("pandas")
+
+from util import dedupe, party_registry, repository
+from util.values import canonical_agreement
+
+# a row as the scanner returns it: raw principal span and a long-form date
+SCANNED = {"lender": "Acme Bank plc", "borrower": "Widget Co Ltd", "original_date": "October 27, 2017",
+           "maturity_date": "October 27, 2022", "currency": "USD", "principal": "USD 3,400,000",
+           "interest_rate": "5.25%"}
+
+def _store(client_id, row):
+    """What loanlens.store_agreements does: match the stored form of the row, then insert it."""
+    row = canonical_agreement(party_registry.attach_party_ids(client_id, dict(row)))
+    matches = dedupe.find_matches(client_id, row)
+    repository.insert_agreements(client_id, [row])
+    return matches
+
+def test_storing_a_scanned_agreement_twice_is_a_duplicate(client_id):
+    assert _store(client_id, SCANNED) == []
+    assert _store(client_id, SCANNED) == [{"matches_id": 1, "kind": "duplicate", "differs": []}]
+    assert dedupe.find_duplicates(client_id) == [
+        {"agreement_id": 2, "matches_id": 1, "kind": "duplicate", "differs": []}]
+
+def test_a_changed_term_is_an_amendment(client_id):
+    _store(client_id, SCANNED)
+    amended = dict(SCANNED, principal="USD 4,000,000", maturity_date="27 October 2023")
+    assert _store(client_id, amended) == [
+        {"matches_id": 1, "kind": "amendment", "differs": ["principal", "maturity_date"]}]
+    assert [m["differs"] for m in dedupe.find_duplicates(client_id)] == [["principal", "maturity_date"]]
+
+def test_rounding_and_formatting_differences_still_match(client_id):
+    _store(client_id, SCANNED)
+    retyped = dict(SCANNED, original_date="2017-10-27", principal="3400000.40", interest_rate="5.250 %")
+    assert _store(client_id, retyped)[0]["kind"] == "duplicate"
+
+def test_other_dates_and_parties_dont_match(client_id):
+    _store(client_id, SCANNED)
+    assert _store(client_id, dict(SCANNED, original_date="October 28, 2017")) == []
+    assert _store(client_id, dict(SCANNED, borrower="Gadget GmbH")) == []
+    # unknown dates can't be blocked on
+    assert _store(client_id, dict(SCANNED, original_date=None)) == []
+    assert dedupe.find_duplicates(client_id) == []
@@ -0,0 +1,78 @@
+import csv
+import io
+import zipfile
+from datetime import date
+from xml.etree import ElementTree
+
+import pytest
+
+from util import db, export, repository
+
+NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+@pytest.fixture
+def book(client_id):
+    repository.insert_agreements(client_id, [
+        {"lender": "Acme Bank & Trust", "borrower": "Widget <Co>", "original_date": "2020-01-01",
+         "maturity_date": "2025-01-01", "currency": "EUR", "principal": "10,000,000", "interest_rate": "4.5%"},
+        {"lender": "Northern\x0bTrust", "borrower": None, "currency": "USD", "principal": "250"},
+    ])
+    return client_id
+
+def _sheet_rows(data: bytes) -> list:
+    """The worksheet's rows as lists of cell values, the way a spreadsheet reader sees them."""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        names = set(archive.namelist())
+        assert {"[Content_Types].xml", "xl/workbook.xml", "xl/styles.xml", "xl/worksheets/sheet1.xml"} <= names
+        sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+    rows = []
+    for row in sheet.iterfind("s:sheetData/s:row", NS):
+        cells = {}
+        for cell in row.iterfind("s:c", NS):
+            column = cell.get("r").rstrip("0123456789")
+            if cell.get("t") == "inlineStr":
+                cells[column] = cell.findtext("s:is/s:t", namespaces=NS)
+            else:
+                cells[column] = float(cell.findtext("s:v", namespaces=NS))
+        rows.append([cells.get(column) for column in "ABCDEFGH"])
+    return rows
+
+def test_rows_are_spooled_and_the_connection_released(book):
+    rows = export.spool_agreement_rows(book)
+    # every pooled connection is idle again before the first row is read
+    assert db._pool._idle.qsize() == db._pool._created
+    rows = list(rows)
+    assert [row[:3] for row in rows] == [("Acme Lending", "Acme Bank & Trust", "Widget <Co>"),
+                                         ("Acme Lending", "Northern\x0bTrust", None)]
+
+def test_spool_filters_by_client(book):
+    other = repository.create_client("Other Lending", "otherlending", "NO")
+    repository.insert_agreements(other, [{"lender": "Other Bank"}])
+    assert len(list(export.spool_agreement_rows(book))) == 2
+    assert len(list(export.spool_agreement_rows(None))) == 3
+
+def test_csv_export(book):
+    text = "".join(export.iter_csv(export.spool_agreement_rows(book)))
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == list(export.EXPORT_COLUMNS)
+    assert rows[1] == ["Acme Lending", "Acme Bank & Trust", "Widget <Co>", "2020-01-01", "2025-01-01",
+                       "EUR", "10000000.0", "4.5%"]
+
+def test_xlsx_export_round_trips(book, monkeypatch):
+    # several chunks, so the zip is assembled from partial writes
+    monkeypatch.setattr(export, "XLSX_CHUNK_BYTES", 1)
+    chunks = list(export.iter_xlsx(export.spool_agreement_rows(book)))
+    assert len(chunks) > 1
+    rows = _sheet_rows(b"".join(chunks))
+    assert rows[0] == list(export.EXPORT_COLUMNS)
+    assert rows[1] == ["Acme Lending", "Acme Bank & Trust", "Widget <Co>", "2020-01-01", "2025-01-01",
+                       "EUR", 10000000.0, "4.5%"]
+    # characters XML can't hold are dropped; empty values leave no cell
+    assert rows[2][:3] == ["Acme Lending", "NorthernTrust", None]
+
+def test_xlsx_cells():
+    assert export._cell("D2", date(2020, 1, 1)) == '<c r="D2" s="1"><v>43831</v></c>'
+    assert export._cell("G2", 1500) == '<c r="G2"><v>1500</v></c>'
+    assert export._cell("G2", None) == ""
+    assert [export._column_letter(i) for i in (0, 25, 26, 701, 702)] == ["A", "Z", "AA", "ZZ", "AAA"]
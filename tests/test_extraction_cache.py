@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+
+import pytest
+
+from scanner import extraction_cache
+from scanner.extraction_cache import LRUDiskCache
+
+@pytest.fixture
+def cache_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "scanner_cache.sqlite3")
+    monkeypatch.setattr(extraction_cache, "CACHE_DB_PATH", path)
+    return path
+
+def _stored_stats(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT hits, misses FROM cache_stats WHERE layer = 'text'").fetchone()
+    finally:
+        conn.close()
+
+def test_values_round_trip_and_hits_are_counted(cache_db):
+    cache = LRUDiskCache("text", 1024 * 1024)
+    assert cache.get("missing") is None
+    cache.put("a", {"text": "Loan agreement"})
+    assert cache.get("a") == {"text": "Loan agreement"}
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+def test_lookups_write_nothing_until_a_flush(cache_db):
+    cache = LRUDiskCache("text", 1024 * 1024)
+    cache.put("a", "text")
+    before = _stored_stats(cache_db)
+    for _ in range(extraction_cache.FLUSH_EVERY - 1):
+        cache.get("a")
+    assert _stored_stats(cache_db) == before
+    cache.get("a")
+    assert _stored_stats(cache_db) == (extraction_cache.FLUSH_EVERY, 0)
+
+def test_eviction_keeps_recently_read_entries(cache_db):
+    cache = LRUDiskCache("text", 1024 * 1024)
+    for key in ("old", "stale", "newer"):
+        cache.put(key, "x" * 1000)
+    cache.get("old")
+    # room for two compressed entries
+    cache.max_bytes = 2 * len(extraction_cache.zlib.compress(b'"' + b"x" * 1000 + b'"')) + 1
+    cache.put("newest", "x" * 1000)
+    assert cache.get("stale") is None and cache.get("newer") is None
+    assert cache.get("old") == "x" * 1000
+    assert cache.stats()["evictions"] == 2
+
+def test_each_thread_reuses_its_own_connection(cache_db):
+    conn = extraction_cache._connection()
+    assert extraction_cache._connection() is conn
+    other = []
+    thread = threading.Thread(target=lambda: other.append(extraction_cache._connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
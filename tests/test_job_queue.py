@@ -0,0 +1,83 @@
+import io
+
+import pytest
+
+from scanner import job_queue
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    """A queue database that doesn't exist yet, as on a fresh deployment."""
+    monkeypatch.setattr(job_queue, "QUEUE_DB_PATH", str(tmp_path / "scan_jobs.sqlite3"))
+    monkeypatch.setattr(job_queue, "JOB_FILES_DIR", str(tmp_path / "scan_jobs"))
+
+def _submit(data=b"%PDF-1.4 agreement"):
+    return job_queue.submit_job(7, "agreement.pdf", io.BytesIO(data))
+
+def _work_one(handler, permanent_errors=()):
+    job = job_queue._claim_job()
+    job_queue._run_job(job, handler, permanent_errors)
+    return job_queue.get_job(job["job_id"])
+
+def test_a_fresh_queue_accepts_and_reports_jobs_without_workers(queue):
+    job_id = _submit()
+    job = job_queue.get_job(job_id)
+    assert (job["status"], job["client_id"], job["filename"], job["attempts"]) == ("queued", 7, "agreement.pdf", 0)
+    assert job_queue.get_job("0" * 32) is None
+
+def test_handler_gets_the_upload_and_its_result_is_stored(queue):
+    job_id = _submit()
+    seen = []
+    def handler(job_id, client_id, source):
+        seen.append((job_id, client_id, source))
+        return {"agreement_id": 1}
+    job = _work_one(handler)
+    assert seen == [(job_id, 7, b"%PDF-1.4 agreement")]
+    assert (job["status"], job["result"], job["attempts"]) == ("done", {"agreement_id": 1}, 1)
+    assert job_queue._claim_job() is None
+
+def test_failed_jobs_are_retried_up_to_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(job_queue, "MAX_ATTEMPTS", 2)
+    job_id = _submit()
+    def handler(job_id, client_id, source):
+        raise OSError("OCR crashed")
+    assert _work_one(handler)["status"] == "queued"
+    job = _work_one(handler)
+    assert (job["job_id"], job["status"], job["attempts"]) == (job_id, "failed", 2)
+    assert job["error"] == "OSError: OCR crashed"
+
+def test_permanent_errors_fail_without_a_retry(queue):
+    _submit()
+    def handler(job_id, client_id, source):
+        raise ValueError("not a PDF or DOCX")
+    job = _work_one(handler, permanent_errors=(ValueError,))
+    assert (job["status"], job["attempts"]) == ("failed", 1)
+    assert job_queue._claim_job() is None
+
+def test_batch_jobs_hand_over_their_files_and_keep_progress(queue, tmp_path):
+    work_dir = tmp_path / "scan_jobs" / "batch-1"
+    work_dir.mkdir(parents=True)
+    (work_dir / "0_a").write_bytes(b"%PDF")
+    files = [("a.pdf", str(work_dir / "0_a"))]
+    job_id = job_queue.submit_batch_job(7, files, str(work_dir))
+    assert job_queue.get_job(job_id)["kind"] == "batch"
+
+    def handler(job_id, client_id, source):
+        assert source == files
+        job_queue.set_progress(job_id, {"stage": "extracting", "files": [{"name": "a.pdf", "path": files[0][1]}]})
+        assert job_queue.get_job(job_id)["progress"]["stage"] == "extracting"
+        return {"inserted": 1}
+    job = _work_one(handler)
+    assert (job["status"], job["result"]) == ("done", {"inserted": 1})
+    # the batch's directory goes once it has finished
+    assert not work_dir.exists()
+
+def test_finished_jobs_are_pruned_after_the_retention_period(queue):
+    submitted = {_submit(), _submit()}
+    job = job_queue._claim_job()
+    job_queue._finish_job(job, result={})
+    finished, = submitted & {job["job_id"]}
+    waiting, = submitted - {finished}
+    assert job_queue.prune_jobs(retention_seconds=3600) == 0
+    assert job_queue.prune_jobs(retention_seconds=-1) == 1
+    assert job_queue.get_job(finished) is None
+    assert job_queue.get_job(waiting)["status"] == "queued"
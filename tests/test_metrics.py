@@ -0,0 +1,57 @@
+import pytest
+
+from util import metrics
+
+@pytest.fixture(autouse=True)
+def series(monkeypatch):
+    monkeypatch.setattr(metrics, "_series", {})
+
+def _lines(text):
+    return [line for line in text.splitlines() if not line.startswith("#")]
+
+def test_render_reports_quantiles_sum_count_and_errors():
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        metrics.observe(metrics.DB_CALL_SECONDS, seconds, call="list_clients")
+    metrics.observe(metrics.DB_CALL_SECONDS, 1.0, error=True, call="list_clients")
+    assert _lines(metrics.render()) == [
+        'loanlens_db_call_seconds{call="list_clients",quantile="0.5"} 0.300000',
+        'loanlens_db_call_seconds{call="list_clients",quantile="0.95"} 1.000000',
+        'loanlens_db_call_seconds{call="list_clients",quantile="0.99"} 1.000000',
+        'loanlens_db_call_seconds_sum{call="list_clients"} 2.000000',
+        'loanlens_db_call_seconds_count{call="list_clients"} 5',
+        'loanlens_db_call_errors_total{call="list_clients"} 1',
+    ]
+    assert "# TYPE loanlens_db_call_seconds summary" in metrics.render()
+
+def test_label_values_are_escaped():
+    metrics.observe(metrics.HTTP_REQUEST_SECONDS, 0.5, endpoint='say "hi"\\\n')
+    assert 'endpoint="say \\"hi\\"\\\\\\n"' in metrics.render()
+
+def test_timers_record_failures_and_name_decorated_calls():
+    @metrics.timed_call(metrics.DB_CALL_SECONDS)
+    def get_client_name():
+        raise RuntimeError("connection lost")
+    with pytest.raises(RuntimeError):
+        get_client_name()
+    with metrics.timed(metrics.SCANNER_STAGE_SECONDS, stage="ocr"):
+        pass
+    counts = {key: (series.count, series.errors) for key, series in metrics._series.items()}
+    assert counts == {(metrics.DB_CALL_SECONDS, (("call", "get_client_name"),)): (1, 1),
+                      (metrics.SCANNER_STAGE_SECONDS, (("stage", "ocr"),)): (1, 0)}
+
+def test_traces_collect_db_and_scanner_time():
+    token = metrics.start_trace()
+    metrics.observe(metrics.DB_CALL_SECONDS, 0.010, call="page_agreements")
+    metrics.observe(metrics.DB_CALL_SECONDS, 0.005, call="page_agreements")
+    metrics.observe(metrics.SCANNER_STAGE_SECONDS, 0.5, stage="ocr")
+    # request timings aren't part of their own breakdown
+    metrics.observe(metrics.HTTP_REQUEST_SECONDS, 1.0, endpoint="api_loans")
+    trace = metrics.end_trace(token)
+    assert trace == {"db.page_agreements": (2, pytest.approx(0.015)), "scan.ocr": (1, 0.5)}
+    assert metrics.server_timing(trace, 1.0) == ('db.page_agreements;desc="calls=2";dur=15.0, '
+                                                 'scan.ocr;desc="calls=1";dur=500.0, total;dur=1000.0')
+
+def test_no_trace_unless_started():
+    token = metrics.start_trace(enabled=False)
+    metrics.observe(metrics.DB_CALL_SECONDS, 0.1, call="list_clients")
+    assert metrics.end_trace(token) is None
@@ -0,0 +1,56 @@
+from util import name_index, repository
+from util.name_index import TrigramIndex, similarity_key
+
+def test_similarity_key_drops_legal_forms_and_folds_spellings():
+    assert similarity_key("ACME Holdings Ltd.") == "acme holding"
+    assert similarity_key("Acme Intl Grp & Co") == "acme international group and"
+    # a name that is nothing but a legal form keeps it
+    assert similarity_key("Limited") == "limited"
+
+def _index(*names):
+    index = TrigramIndex()
+    for item_id, name in enumerate(names, start=1):
+        index.add(item_id, name)
+    return index
+
+def test_search_returns_best_match_first():
+    index = _index("Acme Holdings Ltd", "Acme Holding Limited Partners", "Widget Co", "Acme Holding GmbH")
+    results = index.search("ACME Holding Limited")
+    assert [item_id for item_id, _, _ in results][:2] in ([1, 4], [4, 1])
+    assert results[0][2] == 1.0
+    assert [score for _, _, score in results] == sorted((score for _, _, score in results), reverse=True)
+    assert 3 not in [item_id for item_id, _, _ in results]
+
+def test_search_respects_limit_and_threshold():
+    index = _index("Acme Holding", "Acme Holdings Inc", "Acme Holding SA", "Acme Hold")
+    assert len(index.search("Acme Holding", limit=2)) == 2
+    assert all(score >= 0.9 for _, _, score in index.search("Acme Holding", threshold=0.9))
+    assert index.search("Zebra Finance") == []
+    assert index.search("") == []
+
+def test_remove_and_readd():
+    index = _index("Acme Holding", "Widget Co")
+    index.remove(1)
+    assert len(index) == 1
+    assert index.items() == [(2, "Widget Co")]
+    assert index.search("Acme Holding") == []
+    index.add(2, "Acme Holding")
+    assert [item_id for item_id, _, _ in index.search("Acme Holding")] == [2]
+    assert index.search("Widget") == []
+
+def test_client_index_picks_up_clients_created_elsewhere(client_id, monkeypatch):
+    monkeypatch.setattr(name_index, "REFRESH_SECONDS", 3600)
+    index = name_index.client_index(repository.list_clients)
+    assert [item_id for item_id, _, _ in index.search("Acme Lending")] == [client_id]
+    # as if created by another web worker: this process never saw the insert
+    other = repository.create_client("Acme Lending Ltd", "acmelendingltd", "NO")
+    assert len(index.search("Acme Lending")) == 1
+    monkeypatch.setattr(name_index, "REFRESH_SECONDS", 0)
+    found = name_index.client_index(repository.list_clients).search("Acme Lending")
+    assert {item_id for item_id, _, _ in found} == {client_id, other}
+    assert name_index.client_index(repository.list_clients).refresh() == 0
+
+def test_list_clients_after_an_id(client_id):
+    other = repository.create_client("Other Lending", "otherlending", "NO")
+    assert repository.list_clients() == [(client_id, "Acme Lending"), (other, "Other Lending")]
+    assert repository.list_clients(client_id) == [(other, "Other Lending")]
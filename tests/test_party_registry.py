@@ -0,0 +1,40 @@
+import pytest
+
+from util import party_registry, repository
+
+def test_names_resolve_on_their_exact_key_only(client_id):
+    us = party_registry.client_parties(client_id).resolve("Acme Holdings (US) Inc")
+    uk = party_registry.client_parties(client_id).resolve("Acme Holdings (UK) Ltd")
+    assert us != uk
+    assert party_registry.client_parties(client_id).resolve("ACME HOLDINGS (US) INC") == us
+
+def test_registered_aliases_resolve_to_their_party(client_id):
+    party_id = party_registry.register_party(client_id, "Acme Bank plc", ["Acme Banking Group"])
+    assert party_registry.client_parties(client_id).resolve("Acme Banking Group") == party_id
+
+def test_similar_parties_are_suggested_not_merged(client_id):
+    registry = party_registry.client_parties(client_id)
+    first = registry.resolve("Acme Holdings Ltd")
+    second = registry.resolve("ACME Holding Limited")
+    assert first != second
+    assert [party_id for party_id, _, _ in registry.suggestions("Acme Holdings Ltd")] == [second]
+    pairs = party_registry.merge_suggestions(client_id)
+    assert len(pairs) == 1
+    assert {pairs[0]["party_id"], pairs[0]["similar_party_id"]} == {first, second}
+
+def test_merge_moves_aliases_and_agreements(client_id):
+    registry = party_registry.client_parties(client_id)
+    first = registry.resolve("Acme Holdings Ltd")
+    second = registry.resolve("ACME Holding Limited")
+    repository.insert_agreements(client_id, [party_registry.attach_party_ids(
+        client_id, {"lender": "ACME Holding Limited", "borrower": "Widget Co"})])
+    assert party_registry.merge_parties(client_id, second, first) == first
+    assert registry.resolve("ACME Holding Limited") == first
+    assert party_registry.merge_suggestions(client_id) == []
+    row = repository.page_agreements(client_id, {}, columns=("lender_party_id",))[0]
+    assert row["lender_party_id"] == first
+
+def test_merge_rejects_a_party_into_itself(client_id):
+    party_id = party_registry.client_parties(client_id).resolve("Acme Bank")
+    with pytest.raises(ValueError):
+        party_registry.merge_parties(client_id, party_id, party_id)
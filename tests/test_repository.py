@@ -0,0 +1,113 @@
+import pytest
+
+from util import db, repository
+
+# original_date, principal and rate with ties and NULLs at several page boundaries
+BOOK = [
+    ("2020-01-01", "1000", "5%"),
+    (None, "2000", None),
+    ("2019-05-05", None, "4.5%"),
+    ("2020-01-01", "1000", "5%"),
+    (None, None, None),
+    ("2021-03-03", "3000", "6%"),
+    ("2019-05-05", "2000", "4.5%"),
+    (None, "500", "3%"),
+]
+SORT_FIELDS = {"original_date": 0, "principal": 1, "interest_rate": 2}
+
+@pytest.fixture
+def book(client_id):
+    repository.insert_agreements(client_id, [
+        {"lender": "Acme Bank", "borrower": "Widget Co", "original_date": original_date,
+         "principal": principal, "interest_rate": rate, "currency": "EUR"}
+        for original_date, principal, rate in BOOK])
+    ids = [row[0] for row in repository.agreement_rows(client_id, ("id",))]
+    return client_id, ids
+
+def _page_through(client_id, sort, descending, page_size):
+    seen, after = [], None
+    while True:
+        rows = repository.page_agreements(client_id, {}, sort=sort, descending=descending,
+                                          after=after, page_size=page_size)
+        page = rows[:page_size]
+        seen.extend(row["id"] for row in page)
+        if len(rows) <= page_size:
+            return seen
+        after = (page[-1]["sort_key"], page[-1]["id"])
+
+def _expected(ids, sort, descending):
+    if sort == "id":
+        order = sorted(ids)
+    else:
+        field = SORT_FIELDS[sort]
+        # NULLs first ascending, ties broken by id; descending is the exact reverse
+        order = sorted(ids, key=lambda i: (BOOK[ids.index(i)][field] is not None,
+                                           _sortable(BOOK[ids.index(i)][field]), i))
+    return order[::-1] if descending else order
+
+def _sortable(value):
+    if value is None:
+        return 0
+    return float(value.rstrip("%")) if value[0].isdigit() and "-" not in value else value
+
+@pytest.mark.parametrize("sort", ["id", "original_date", "principal", "interest_rate"])
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("page_size", [1, 2, 3, 8])
+def test_keyset_pages_cover_the_book_once(book, sort, descending, page_size):
+    client_id, ids = book
+    assert _page_through(client_id, sort, descending, page_size) == _expected(ids, sort, descending)
+
+def test_page_flags_more_rows_with_one_extra(book):
+    client_id, _ = book
+    assert len(repository.page_agreements(client_id, {}, page_size=3)) == 4
+    assert len(repository.page_agreements(client_id, {}, page_size=len(BOOK))) == len(BOOK)
+
+def test_page_filters_on_typed_columns(book):
+    client_id, _ = book
+    rows = repository.page_agreements(client_id, {"principal_min": 1000, "principal_max": 2000, "rate_min": 4.5})
+    assert sorted((row["principal"], row["rate_bps"]) for row in rows) == [(1000.0, 500.0), (1000.0, 500.0),
+                                                                           (2000.0, 450.0)]
+
+def test_page_rejects_unknown_sort_and_columns(book):
+    client_id, _ = book
+    with pytest.raises(ValueError):
+        repository.page_agreements(client_id, {}, sort="lender; DROP TABLE clients")
+    with pytest.raises(ValueError):
+        repository.page_agreements(client_id, {}, columns=("password",))
+
+def test_create_client_returns_its_id_and_rejects_duplicate_keys(client_id):
+    other = repository.create_client("Other Lending", "otherlending", "YES")
+    assert other == client_id + 1
+    assert repository.create_client("Acme Lending Ltd", "acmelending", "NO") is None
+    assert repository.client_key_exists("acmelending")
+
+def test_scanned_rows_store_provenance_under_their_own_ids(client_id):
+    provenance = [{"source_hash": "a" * 64, "model_version": "m1", "text": f"text {n}",
+                   "entities": {"lender": {"raw": f"Bank {n}"}}, "job_id": f"{n:032d}"} for n in range(3)]
+    repository.insert_agreements(client_id, [{"lender": f"Bank {n}"} for n in range(3)], provenance)
+    stale = repository.stale_provenance("m2", 0, 10)
+    assert [(text, entities["lender"]["raw"]) for _, _, text, entities in stale] == \
+        [(f"text {n}", f"Bank {n}") for n in range(3)]
+    assert repository.agreement_for_job(f"{1:032d}")["lender"] == "Bank 1"
+
+def test_a_job_id_is_only_stored_once(client_id):
+    provenance = [{"source_hash": "a" * 64, "model_version": "m1", "text": "", "entities": {}, "job_id": "j" * 32}]
+    repository.insert_agreements(client_id, [{"lender": "Acme Bank"}], provenance)
+    with pytest.raises(db.integrity_error()):
+        repository.insert_agreements(client_id, [{"lender": "Acme Bank"}], provenance)
+    assert repository.agreement_stamp(client_id)[0] == 1
+
+def test_stamp_changes_when_rows_are_reextracted(client_id):
+    provenance = [{"source_hash": "a" * 64, "model_version": "m1", "text": "", "entities": {}}]
+    repository.insert_agreements(client_id, [{"lender": "Acme Bank", "principal": "100"}], provenance)
+    before = repository.agreement_stamp(client_id)
+    agreement_id = repository.agreement_rows(client_id, ("id",))[0][0]
+    repository.apply_reextraction("m2", [(agreement_id, {}, {"principal": 200.0, "principal_minor": 20000})])
+    assert repository.agreement_stamp(client_id) != before
+
+def test_stamp_changes_when_typed_values_are_backfilled(client_id):
+    repository.insert_agreements(client_id, [{"lender": "Acme Bank", "principal": "100"}])
+    before = repository.agreement_stamp(client_id)
+    agreement_id = repository.agreement_rows(client_id, ("id",))[0][0]
+    repository.set_agreement_values([("2020-01-01", None, "EUR", 100.0, None, 10000, None, agreement_id)])
+    assert repository.agreement_stamp(client_id) == (before[0], before[1], before[2] + 1)
@@ -0,0 +1,100 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+for module in ("flask", "pandas", "pdfplumber", "pytesseract", "pdf2image", "docx"):
+    pytest.importorskip(module)
+
+import loanlens
+from scanner import batch_ingest, job_queue
+from util import auth, repository
+
+PUBLIC_ENDPOINTS = {"static", "login", "logout", "register", "prometheus_metrics"}
+PDF = b"%PDF-1.4\n%agreement\n"
+URL_VALUES = {"client_id": 1, "job_id": "0" * 32, "fmt": "csv", "party_id": 1}
+
+@pytest.fixture
+def web(client_id, tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(job_queue, "QUEUE_DB_PATH", str(tmp_path / "scan_jobs.sqlite3"))
+    monkeypatch.setattr(job_queue, "JOB_FILES_DIR", str(tmp_path / "scan_jobs"))
+    auth.invalidate_clients()
+    repository.create_user("alice", auth.hash_password("s3cret"))
+    return loanlens.app.test_client()
+
+@pytest.fixture
+def logged_in(web, client_id):
+    response = web.post("/", data={"username": "alice", "password": "s3cret"})
+    assert response.status_code == 302 and response.location.endswith("/dashboard")
+    with web.session_transaction() as session:
+        session["client_id"] = client_id
+    return web
+
+def _protected_rules():
+    for rule in loanlens.app.url_map.iter_rules():
+        if rule.endpoint not in PUBLIC_ENDPOINTS:
+            yield rule
+
+@pytest.mark.parametrize("rule", list(_protected_rules()), ids=lambda rule: rule.endpoint)
+def test_every_data_route_requires_login(web, rule):
+    url = rule.build({name: URL_VALUES[name] for name in rule.arguments})[1]
+    method = "GET" if "GET" in rule.methods else "POST"
+    response = web.open(url, method=method)
+    if rule.rule.startswith(("/api/", "/scan-jobs", "/scan-agreements/")):
+        assert (response.status_code, response.get_json()) == (401, {"error": "login required"})
+    else:
+        assert response.status_code == 302 and response.location.endswith("/")
+
+def test_wrong_password_is_refused(web):
+    assert web.post("/", data={"username": "alice", "password": "wrong"}).status_code == 401
+    assert web.get("/api/loans").status_code == 401
+
+def test_loans_and_exports(logged_in, client_id):
+    repository.insert_agreements(client_id, [{"lender": "Acme Bank", "principal": "1,000", "currency": "EUR"}])
+    loans = logged_in.get("/api/loans").get_json()
+    assert [loan["lender"] for loan in loans["loans"]] == ["Acme Bank"]
+    csv_text = logged_in.get(f"/client/{client_id}/export.csv").get_data(as_text=True)
+    assert csv_text.splitlines()[1].startswith("Acme Lending,Acme Bank,")
+    assert logged_in.get("/client/999/export.csv").status_code == 404
+    assert logged_in.get(f"/client/{client_id}/export.pdf").status_code == 400
+
+def test_scan_jobs_queue_without_workers(logged_in):
+    response = logged_in.post("/scan-jobs", data={"agreement_file": (io.BytesIO(PDF), "a.pdf")})
+    assert response.status_code == 202
+    status = logged_in.get(response.get_json()["status_url"]).get_json()
+    assert (status["status"], status["filename"]) == ("queued", "a.pdf")
+    assert logged_in.get(f"/scan-jobs/{status['job_id']}/result").status_code == 409
+
+def test_batches_are_queued_for_the_scan_workers(logged_in):
+    response = logged_in.post("/scan-agreements/batch", data={"agreement_files": [
+        (io.BytesIO(PDF), "a.pdf"), (io.BytesIO(PDF), "b.pdf")]})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    status = logged_in.get(f"/scan-agreements/batch/{job_id}").get_json()
+    assert (status["status"], status["total"]) == ("queued", 2)
+    assert [f["name"] for f in status["files"]] == ["a.pdf", "b.pdf"]
+    assert job_queue.get_job(job_id)["kind"] == "batch"
+
+def test_oversized_batches_are_refused(logged_in, monkeypatch):
+    monkeypatch.setattr(batch_ingest, "MAX_EXTRACTED_BYTES", 1024)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("a.pdf", PDF + b"\0" * 4096)
+    response = logged_in.post("/scan-agreements/batch", data={"agreement_files": [
+        (io.BytesIO(buffer.getvalue()), "batch.zip")]})
+    assert response.status_code == 400
+    # the batch's upload directory is gone
+    assert os.listdir(job_queue.JOB_FILES_DIR) == []
+
+    monkeypatch.setitem(loanlens.app.config, "MAX_CONTENT_LENGTH", 1024)
+    response = logged_in.post("/scan-agreements/batch", data={"agreement_files": [
+        (io.BytesIO(PDF + b"\0" * 4096), "a.pdf")]})
+    assert response.status_code == 413
+
+def test_metrics_are_exposed(web):
+    web.get("/api/loans")
+    response = web.get("/metrics")
+    assert response.status_code == 200
+    assert 'endpoint="api_loans"' in response.get_data(as_text=True)
@@ -0,0 +1,76 @@
+import pytest
+
+from util import repository
+from util.search_index import SearchIndex, tenor_days
+
+@pytest.fixture
+def book(client_id):
+    rows = [
+        {"lender": "Acme Bank", "borrower": "Widget Co", "currency": "EUR", "principal": "10,000,000",
+         "interest_rate": "4.5%", "original_date": "2020-01-01", "maturity_date": "2025-01-01"},
+        {"lender": "Acme Bank", "borrower": "Gadget GmbH", "currency": "USD", "principal": "50,000,000",
+         "interest_rate": "6%", "original_date": "2020-01-01", "maturity_date": "2030-01-01"},
+        {"lender": "Northern Trust", "borrower": "Widget Co", "currency": "EUR", "principal": "25,000,000",
+         "interest_rate": "5.25%", "original_date": "2021-06-01", "maturity_date": "2024-06-01"},
+    ]
+    provenance = [{"source_hash": str(n) * 64, "model_version": "m1", "entities": {},
+                   "text": text} for n, text in enumerate(["senior secured term facility",
+                                                           "revolving credit facility",
+                                                           "bridge loan"])]
+    repository.insert_agreements(client_id, rows, provenance)
+    index = SearchIndex()
+    index.refresh()
+    return index
+
+def _ids(result):
+    return [agreement["borrower"] for agreement in result["agreements"]]
+
+def test_tenor_days():
+    assert tenor_days("2020-01-01", "2021-01-01") == 366
+    assert tenor_days("2021-01-01", "2020-01-01") is None
+    assert tenor_days(None, "2020-01-01") is None
+
+def test_keyword_filters(book):
+    assert _ids(book.search(currency="eur")) == ["Widget Co", "Widget Co"]
+    assert _ids(book.search(party="Acme Bank Ltd")) == ["Gadget GmbH", "Widget Co"]
+    assert _ids(book.search(text="facility")) == ["Gadget GmbH", "Widget Co"]
+    # a text word can also match a party name
+    assert _ids(book.search(text="northern")) == ["Widget Co"]
+    assert book.search(currency="GBP") == {"total": 0, "agreements": []}
+
+def test_range_filters(book):
+    assert _ids(book.search(ranges={"principal_minor": (2_000_000_000, None)})) == ["Widget Co", "Gadget GmbH"]
+    assert _ids(book.search(ranges={"rate_bps": (450, 525)})) == ["Widget Co", "Widget Co"]
+    assert book.search(ranges={"tenor_days": (4 * 365, 6 * 365)})["agreements"][0]["interest_rate"] == "4.5%"
+    assert book.search(ranges={"principal_minor": (None, None)})["total"] == 3
+
+def test_conditions_combine_newest_first_within_limit(book):
+    result = book.search(currency="EUR", ranges={"rate_bps": (None, 500)})
+    assert result["total"] == 1
+    assert result["agreements"][0]["principal"] == 10000000.0
+    result = book.search(limit=2)
+    assert result["total"] == 3
+    ids = [agreement["id"] for agreement in result["agreements"]]
+    assert ids == sorted(ids, reverse=True) and len(ids) == 2
+
+def test_refresh_indexes_only_new_rows(book, client_id):
+    assert book.refresh() == 0
+    repository.insert_agreements(client_id, [{"lender": "Acme Bank", "borrower": "Sprocket SA", "currency": "EUR"}])
+    assert book.refresh() == 1
+    assert len(book) == 4
+    assert _ids(book.search(party="Sprocket")) == ["Sprocket SA"]
+
+def test_refresh_reindexes_rows_updated_in_place(book, client_id):
+    widget = book.search(party="Northern")["agreements"][0]["id"]
+    repository.apply_reextraction("m2", [(widget, {}, {"lender": "Southern Trust", "currency": "GBP"})])
+    gadget = book.search(party="Gadget")["agreements"][0]["id"]
+    repository.set_agreement_values([("2020-01-01", "2030-01-01", "USD", 70000000.0, "7%", 7_000_000_000, 700, gadget)])
+    assert book.refresh() == 0
+    assert len(book) == 3
+    assert book.search(party="Northern")["total"] == 0
+    assert book.search(currency="EUR")["total"] == 1
+    assert _ids(book.search(party="Southern", currency="GBP")) == ["Widget Co"]
+    # the scanned text still matches after the re-index
+    assert _ids(book.search(text="bridge")) == ["Widget Co"]
+    assert book.search(ranges={"principal_minor": (5_000_000_000, None)})["agreements"][0]["interest_rate"] == "7%"
+    assert book.search(ranges={"rate_bps": (600, 600)})["total"] == 0
@@ -0,0 +1,70 @@
+import logging
+
+import pytest
+
+from util.values import canonical_agreement, parse_amount, to_date, to_minor_units, to_rate_bps
+
+@pytest.mark.parametrize("text, expected", [
+    ("2017-10-27", "2017-10-27"),
+    ("2017/10/27", "2017-10-27"),
+    ("27/10/2017", "2017-10-27"),
+    ("12/31/2020", "2020-12-31"),          # month-first when day-first can't be a date
+    ("October 27, 2017", "2017-10-27"),
+    ("27 October 2017", "2017-10-27"),
+    ("27th October 2017", "2017-10-27"),
+    ("Oct 27, 2017", "2017-10-27"),
+    ("2017-10-27 00:00:00", "2017-10-27"),
+])
+def test_to_date_formats(text, expected):
+    assert to_date(text).isoformat() == expected
+
+def test_slashed_dates_are_day_first_when_ambiguous():
+    assert to_date("03/04/2020").isoformat() == "2020-04-03"
+
+@pytest.mark.parametrize("text, expected", [
+    ("1000000", 100000000),
+    ("1,000,000.50", 100000050),
+    ("USD 3.4 million", 340000000),
+    ("EUR 5m", 500000000),
+    ("2.5bn", 250000000000),
+    ("1.000.000", 100000000),
+    ("USD 10,000,000 (ten million US Dollars)", 1000000000),
+    (1000000.5, 100000050),
+])
+def test_to_minor_units(text, expected):
+    assert to_minor_units(text) == expected
+
+def test_amounts_without_a_number_or_negative_are_rejected():
+    assert parse_amount("ten million") is None
+    assert to_minor_units("-5") is None
+
+def test_to_rate_bps():
+    assert to_rate_bps("5.125%") == 512.5
+    assert to_rate_bps("101%") is None
+    assert to_rate_bps("n/a") is None
+
+def test_canonical_agreement():
+    row = canonical_agreement({
+        "lender": "Acme Bank", "borrower": "Widget Co",
+        "original_date": "October 27, 2017", "maturity_date": "12/31/2022",
+        "currency": " usd ", "principal": "USD 3.4 million", "interest_rate": "5.25%",
+    })
+    assert row["original_date"] == "2017-10-27"
+    assert row["maturity_date"] == "2022-12-31"
+    assert row["currency"] == "USD"
+    assert row["principal_minor"] == 340000000
+    assert row["principal"] == 3400000.0
+    assert row["rate_bps"] == 525.0
+    assert row["interest_rate"] == "5.25%"
+    assert row["lender"] == "Acme Bank"
+
+def test_canonical_agreement_logs_values_it_cannot_parse(caplog):
+    with caplog.at_level(logging.WARNING, logger="util.values"):
+        row = canonical_agreement({"original_date": "sometime", "principal": "", "interest_rate": "floating"})
+    assert row["original_date"] is None
+    assert row["principal_minor"] is None
+    assert row["rate_bps"] is None
+    assert row["interest_rate"] == "floating"   # an unparseable rate keeps its text
+    logged = caplog.text
+    assert "original_date" in logged and "interest_rate" in logged
+    assert "principal" not in logged            # empty values aren't worth a warning
@@ -0,0 +1,112 @@
+"""
+Portfolio analytics for a client's loan book: maturity ladder,
+principal-weighted interest rates and exposure by currency.
+
+The book is loaded once into a typed frame (see util.frames) and every
+aggregate is a vectorized group-by over it. Results are cached per client
+and dropped when agreements are stored; the cached entry also carries the
+book's (count, max id, book version) stamp, so inserts made by another
+process, and in-place updates such as python -m scanner.reextract, are
+picked up on the next request.
+"""
+
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from . import repository
+from .frames import FRAME_COLUMNS, agreement_frame
+
+# (label, upper bound in years to maturity); matured and undated loans get their own rows
+MATURITY_BUCKETS = (("0-1y", 1), ("1-2y", 2), ("2-3y", 3), ("3-5y", 5), ("5-10y", 10), ("10y+", np.inf))
+DAYS_PER_YEAR = 365.25
+
+def _summarise(frame: pd.DataFrame, by) -> pd.DataFrame:
+    # Rates are weighted over the rows that have both a rate and a principal
+    weighted = frame["interest_rate"].notna() & frame["principal"].notna()
+    grouped = frame.assign(
+        weight=frame["principal"].where(weighted, 0.0),
+        rate_x_weight=(frame["interest_rate"] * frame["principal"]).where(weighted, 0.0),
+    ).groupby(by, sort=False)
+    summary = grouped.agg(count=("id", "size"), principal=("principal", "sum"),
+                          rate_x_weight=("rate_x_weight", "sum"), weight=("weight", "sum"))
+    summary["weighted_rate"] = summary["rate_x_weight"] / summary["weight"].replace(0, np.nan)
+    return summary.drop(columns=["rate_x_weight", "weight"])
+
+def _records(summary: pd.DataFrame, key: str) -> list:
+    records = []
+    for label, row in summary.iterrows():
+        records.append({
+            key: label,
+            "count": int(row["count"]),
+            "principal": round(float(row["principal"]), 2),
+            "weighted_rate": None if pd.isna(row["weighted_rate"]) else round(float(row["weighted_rate"]), 4),
+        })
+    return records
+
+def maturity_ladder(frame: pd.DataFrame, as_of: date) -> list:
+    years = (frame["maturity_date"] - pd.Timestamp(as_of)).dt.days / DAYS_PER_YEAR
+    labels = [label for label, _ in MATURITY_BUCKETS]
+    edges = [0] + [upper for _, upper in MATURITY_BUCKETS]
+    bucket = pd.cut(years, bins=edges, labels=labels, right=False).astype(object)
+    bucket = bucket.where(years >= 0, "matured").where(years.notna(), "no maturity date")
+    summary = _summarise(frame.assign(bucket=bucket), "bucket")
+    order = ["matured"] + labels + ["no maturity date"]
+    return _records(summary.reindex([b for b in order if b in summary.index]), "bucket")
+
+def currency_exposure(frame: pd.DataFrame, as_of: date) -> list:
+    """Principal per currency, split into outstanding (not yet matured) and total."""
+    outstanding = frame["maturity_date"].isna() | (frame["maturity_date"] >= pd.Timestamp(as_of))
+    currency = frame["currency"].where(frame["currency"].ne(""), "unknown")
+    frame = frame.assign(currency=currency,
+                         outstanding_principal=frame["principal"].where(outstanding, 0.0))
+    summary = _summarise(frame, "currency")
+    summary["outstanding_principal"] = frame.groupby("currency", sort=False)["outstanding_principal"].sum()
+    summary = summary.sort_values("principal", ascending=False)
+    records = _records(summary, "currency")
+    for record, value in zip(records, summary["outstanding_principal"]):
+        record["outstanding_principal"] = round(float(value), 2)
+    return records
+
+def weighted_rates(frame: pd.DataFrame) -> dict:
+    """
+    Principal-weighted average rate per currency. Amounts in different
+    currencies aren't comparable, so there is no portfolio-wide figure.
+    """
+    summary = _summarise(frame.assign(currency=frame["currency"].where(frame["currency"].ne(""), "unknown")),
+                         "currency")
+    return {currency: None if pd.isna(rate) else round(float(rate), 4)
+            for currency, rate in summary["weighted_rate"].items()}
+
+def portfolio_analytics(frame: pd.DataFrame, as_of: date) -> dict:
+    return {
+        "as_of": as_of.isoformat(),
+        "agreements": int(len(frame)),
+        "maturity_ladder": maturity_ladder(frame, as_of),
+        "currency_exposure": currency_exposure(frame, as_of),
+        "weighted_rates": weighted_rates(frame),
+    }
+
+# === Per-client cache ===
+_cache = {}
+_cache_lock = threading.Lock()
+
+def client_analytics(client_id: int, as_of: date = None) -> dict:
+    as_of = as_of or date.today()
+    stamp = repository.agreement_stamp(client_id)
+    with _cache_lock:
+        cached = _cache.get(client_id)
+    if cached and cached[0] == (stamp, as_of):
+        return cached[1]
+
+    frame = agreement_frame(repository.agreement_rows(client_id, FRAME_COLUMNS))
+    result = portfolio_analytics(frame, as_of)
+    with _cache_lock:
+        _cache[client_id] = ((stamp, as_of), result)
+    return result
+
+def invalidate(client_id: int) -> None:
+    with _cache_lock:
+        _cache.pop(client_id, None)
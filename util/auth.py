@@ -0,0 +1,119 @@
+"""
+Password hashing, login and the cached client list behind the dashboards.
+
+Passwords are stored as "pbkdf2_sha256$<iterations>$<salt>$<hash>" (PBKDF2
+from hashlib). LOANLENS_PBKDF2_ITERATIONS tunes the cost; a stored hash with
+another iteration count, or a plaintext password from before hashing, is
+rehashed the next time its user logs in.
+
+After login the user's id and name live in Flask's signed session cookie,
+and the client list is held here for CLIENT_CACHE_SECONDS, so page views
+after the first don't query the database. add_client invalidates it; other
+processes see a new client once their copy expires.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from . import repository
+
+# === CONFIGURATION ===
+HASH_ALGORITHM = "pbkdf2_sha256"
+PBKDF2_ITERATIONS = int(os.environ.get("LOANLENS_PBKDF2_ITERATIONS", 600000))
+SALT_BYTES = 16
+CLIENT_CACHE_SECONDS = float(os.environ.get("LOANLENS_CLIENT_CACHE_SECONDS", 300))
+
+# === Passwords ===
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+def hash_password(password: str) -> str:
+    salt = os.urandom(SALT_BYTES)
+    digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+    return f"{HASH_ALGORITHM}${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+def verify_password(stored: str, password: str) -> tuple:
+    """
+    Returns (matches, needs_rehash). Values without the hash prefix are
+    legacy plaintext passwords, compared in constant time.
+    """
+    parts = stored.split("$")
+    if len(parts) != 4 or parts[0] != HASH_ALGORITHM:
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")), True
+    iterations = int(parts[1])
+    expected = base64.b64decode(parts[3])
+    matches = hmac.compare_digest(_pbkdf2(password, base64.b64decode(parts[2]), iterations), expected)
+    return matches, iterations != PBKDF2_ITERATIONS
+
+_dummy_hash = None
+
+def authenticate(username: str, password: str):
+    """Returns {"id", "username"} for valid credentials, otherwise None."""
+    global _dummy_hash
+    user = repository.get_user(username)
+    if user is None:
+        # hash anyway so unknown usernames take as long as wrong passwords
+        _dummy_hash = _dummy_hash or hash_password("")
+        verify_password(_dummy_hash, password)
+        return None
+    matches, needs_rehash = verify_password(user["password"], password)
+    if not matches:
+        return None
+    if needs_rehash:
+        repository.set_password(user["id"], hash_password(password))
+    return {"id": user["id"], "username": user["username"]}
+
+# === Session ===
+def log_in(session, user: dict) -> None:
+    session.clear()
+    session["user_id"] = user["id"]
+    session["username"] = user["username"]
+
+def current_user(session):
+    if "user_id" not in session:
+        return None
+    return {"id": session["user_id"], "username": session["username"]}
+
+# === Client cache ===
+_clients = None
+_clients_loaded_at = 0.0
+# bumped by invalidate_clients so a load racing with it isn't cached
+_clients_generation = 0
+_clients_lock = threading.Lock()
+
+def clients() -> dict:
+    """{client_id: {"client_id", "client_name", "has_report"}}, reloaded after CLIENT_CACHE_SECONDS."""
+    global _clients, _clients_loaded_at
+    with _clients_lock:
+        if _clients is not None and time.monotonic() - _clients_loaded_at < CLIENT_CACHE_SECONDS:
+            return _clients
+        generation = _clients_generation
+    loaded = {row["client_id"]: row for row in repository.list_client_summaries()}
+    with _clients_lock:
+        if generation == _clients_generation:
+            _clients, _clients_loaded_at = loaded, time.monotonic()
+    return loaded
+
+def report_clients() -> list:
+    return [{"client_id": c["client_id"], "client_name": c["client_name"]}
+            for c in clients().values() if c["has_report"] == "YES"]
+
+def client_name(client_id: int):
+    client = clients().get(client_id)
+    if client is not None:
+        return client["client_name"]
+    # added by another process since the list was cached
+    return repository.get_client_name(client_id)
+
+def invalidate_clients() -> None:
+    global _clients, _clients_generation
+    with _clients_lock:
+        _clients = None
+        _clients_generation += 1
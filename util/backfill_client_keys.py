@@ -0,0 +1,42 @@
+"""
+One-shot backfill of clients.client_key for rows created before the column
+existed. Run between sql/002_add_client_key.sql and
+sql/003_client_key_unique_index.sql:
+
+    python -m util.backfill_client_keys
+
+Clients whose key is already taken by an earlier client are left without a
+key and listed, so the duplicates can be merged by hand.
+"""
+
+from .normalize import normalize_name
+from . import repository
+
+BATCH_SIZE = 500
+
+def backfill(batch_size: int = BATCH_SIZE) -> list:
+    taken = repository.list_client_keys()
+    duplicates = []
+    after_id = 0
+    while True:
+        batch = repository.clients_missing_key(after_id, batch_size)
+        if not batch:
+            break
+        keys = []
+        for client_id, client_name in batch:
+            client_key = normalize_name(client_name)
+            if not client_key or client_key in taken:
+                duplicates.append((client_id, client_name))
+                continue
+            taken.add(client_key)
+            keys.append((client_key, client_id))
+        if keys:
+            repository.set_client_keys(keys)
+        after_id = batch[-1][0]
+    return duplicates
+
+if __name__ == "__main__":
+    duplicates = backfill()
+    print(f"Backfill complete; {len(duplicates)} clients left without a key.")
+    for client_id, client_name in duplicates:
+        print(f"  {client_id}: {client_name}")
@@ -0,0 +1,46 @@
+"""
+One-shot conversion of existing agreements to canonical typed values
+(util/values.py). Run after sql/005_typed_values.sql:
+
+    python -m util.backfill_typed_values
+
+Rows are read and updated in id order, one batch per transaction, so the
+job can be stopped and re-run. Values that can't be parsed are left as
+they are, with NULL typed columns; their ids are listed so they can be
+corrected by hand.
+"""
+
+from . import repository
+from .values import canonical_agreement
+
+BATCH_SIZE = 1000
+VALUE_COLUMNS = ("original_date", "maturity_date", "currency", "principal", "interest_rate")
+
+def backfill(batch_size: int = BATCH_SIZE):
+    converted = 0
+    unparsed = []
+    after_id = 0
+    while True:
+        batch = repository.agreements_after(after_id, batch_size)
+        if not batch:
+            break
+        updates = []
+        for agreement_id, *raw in batch:
+            before = dict(zip(VALUE_COLUMNS, raw))
+            row = canonical_agreement(before)
+            failed = [col for col in VALUE_COLUMNS if before[col] not in (None, "") and row[col] is None]
+            if failed or (before["interest_rate"] not in (None, "") and row["rate_bps"] is None):
+                unparsed.append(agreement_id)
+                row.update((col, before[col]) for col in failed)
+            updates.append((row["original_date"], row["maturity_date"], row["currency"], row["principal"],
+                            row["interest_rate"], row["principal_minor"], row["rate_bps"], agreement_id))
+        repository.set_agreement_values(updates)
+        converted += len(updates)
+        after_id = batch[-1][0]
+    return converted, unparsed
+
+if __name__ == "__main__":
+    converted, unparsed = backfill()
+    print(f"Converted {converted} agreements; {len(unparsed)} had values that could not be parsed.")
+    for agreement_id in unparsed:
+        print(f"  {agreement_id}")
@@ -0,0 +1,367 @@
+"""
+Pooled database access for LoanLens.
+
+Connections come from a bounded, thread-safe pool instead of a new
+pyodbc.connect() per request. The backend is chosen with LOANLENS_DB_BACKEND:
+"sqlserver" (default, the production database) or "sqlite" for local runs
+and tests. Both drivers use qmark (?) parameters, so the same SQL runs on both.
+"""
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# === CONFIGURATION ===
+DB_BACKEND = os.environ.get("LOANLENS_DB_BACKEND", "sqlserver")
+SQLSERVER_CONN_STR = os.environ.get("LOANLENS_SQLSERVER_CONN_STR", (
+    "Driver={SQL Server};"
+    "Server=TROY\\SQLEXPRESS;"
+    "Database=LoanOrg;"
+    "Trusted_Connection=yes;"
+    ))
+SQLITE_PATH = os.environ.get("LOANLENS_SQLITE_PATH", "loanlens.sqlite3")
+POOL_SIZE = int(os.environ.get("LOANLENS_DB_POOL_SIZE", 10))
+POOL_TIMEOUT = float(os.environ.get("LOANLENS_DB_POOL_TIMEOUT", 10))
+# connections idle for longer than this are pinged before being handed out
+HEALTHCHECK_IDLE_SECONDS = float(os.environ.get("LOANLENS_DB_HEALTHCHECK_IDLE", 30))
+STATEMENT_CACHE_SIZE = 64
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    username  VARCHAR(50) NOT NULL UNIQUE,
+    password  VARCHAR(255) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clients (
+    client_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_name VARCHAR(100) NOT NULL,
+    client_key  VARCHAR(100) NULL,
+    has_report  VARCHAR(3) NOT NULL DEFAULT 'NO' CHECK (has_report IN ('YES', 'NO')),
+    book_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_clients_client_key ON clients(client_key) WHERE client_key IS NOT NULL;
+CREATE TABLE IF NOT EXISTS parties (
+    party_id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id      INTEGER NOT NULL REFERENCES clients(client_id),
+    canonical_name VARCHAR(255) NOT NULL,
+    party_key      VARCHAR(255) NOT NULL,
+    UNIQUE (client_id, party_key)
+);
+CREATE TABLE IF NOT EXISTS party_aliases (
+    alias_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+    party_id  INTEGER NOT NULL REFERENCES parties(party_id),
+    client_id INTEGER NOT NULL REFERENCES clients(client_id),
+    alias     VARCHAR(255) NOT NULL,
+    alias_key VARCHAR(255) NOT NULL,
+    UNIQUE (client_id, alias_key)
+);
+CREATE TABLE IF NOT EXISTS demo_loan_agreement (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id     INTEGER NOT NULL REFERENCES clients(client_id),
+    original_date DATE NULL,
+    maturity_date DATE NULL,
+    currency      VARCHAR(10) NULL,
+    principal     FLOAT NULL,
+    interest_rate VARCHAR(10) NULL,
+    lender        VARCHAR(255) NULL,
+    borrower      VARCHAR(255) NULL,
+    lender_party_id   INTEGER NULL REFERENCES parties(party_id),
+    borrower_party_id INTEGER NULL REFERENCES parties(party_id),
+    rate_bps          DECIMAL(9,2) NULL,
+    principal_minor   BIGINT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_loan_client_id ON demo_loan_agreement(client_id, id);
+CREATE INDEX IF NOT EXISTS ix_loan_client_original_date ON demo_loan_agreement(client_id, original_date, id);
+CREATE INDEX IF NOT EXISTS ix_loan_client_maturity_date ON demo_loan_agreement(client_id, maturity_date, id);
+CREATE INDEX IF NOT EXISTS ix_loan_client_principal_minor ON demo_loan_agreement(client_id, principal_minor, id);
+CREATE INDEX IF NOT EXISTS ix_loan_client_rate_bps ON demo_loan_agreement(client_id, rate_bps, id);
+CREATE INDEX IF NOT EXISTS ix_loan_client_currency ON demo_loan_agreement(client_id, currency, id);
+CREATE INDEX IF NOT EXISTS ix_loan_client_lender_party ON demo_loan_agreement(client_id, lender_party_id, id);
+CREATE INDEX IF NOT EXISTS ix_loan_client_borrower_party ON demo_loan_agreement(client_id, borrower_party_id, id);
+CREATE TABLE IF NOT EXISTS agreement_provenance (
+    agreement_id   INTEGER PRIMARY KEY REFERENCES demo_loan_agreement(id),
+    source_hash    CHAR(64) NOT NULL,
+    model_version  VARCHAR(100) NOT NULL,
+    extracted_text TEXT NOT NULL,
+    entities       TEXT NOT NULL,
+    extracted_at   DATETIME NOT NULL,
+    job_id         CHAR(32) NULL
+);
+CREATE INDEX IF NOT EXISTS ix_provenance_model_version ON agreement_provenance(model_version, agreement_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_provenance_job_id ON agreement_provenance(job_id) WHERE job_id IS NOT NULL;
+"""
+
+class PoolTimeout(Exception):
+    pass
+
+# === Backends ===
+class SqlServerBackend:
+    name = "sqlserver"
+
+    def __init__(self, conn_str: str = SQLSERVER_CONN_STR):
+        import pyodbc
+        self.driver = pyodbc
+        self.conn_str = conn_str
+        self.integrity_error = pyodbc.IntegrityError
+
+    def connect(self):
+        return self.driver.connect(self.conn_str)
+
+    def prepare_bulk_cursor(self, cursor) -> None:
+        cursor.fast_executemany = True
+
+    def limit(self, select_sql: str, n: int) -> str:
+        return select_sql.replace("SELECT", f"SELECT TOP ({int(n)})", 1)
+
+    def returning(self, insert_sql: str, column: str) -> str:
+        # the id comes back as the INSERT's own result set, so no second statement can see another insert's id
+        return re.sub(r"\bVALUES\b", f"OUTPUT INSERTED.{column} VALUES", insert_sql, count=1)
+
+    def init_schema(self, conn) -> None:
+        # The SQL Server schema is managed in SSMS (see README)
+        pass
+
+class SqliteBackend:
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self.integrity_error = sqlite3.IntegrityError
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def prepare_bulk_cursor(self, cursor) -> None:
+        pass
+
+    def limit(self, select_sql: str, n: int) -> str:
+        return f"{select_sql} LIMIT {int(n)}"
+
+    def returning(self, insert_sql: str, column: str) -> str:
+        # RETURNING needs SQLite 3.35+
+        return f"{insert_sql.rstrip()} RETURNING {column}"
+
+    def init_schema(self, conn) -> None:
+        conn.executescript(SQLITE_SCHEMA)
+        conn.commit()
+
+def make_backend(name: str = DB_BACKEND):
+    if name == "sqlserver":
+        return SqlServerBackend()
+    elif name == "sqlite":
+        return SqliteBackend()
+    raise ValueError(f"Unknown database backend: {name}")
+
+# === Pooled Connections ===
+class Result:
+    """
+    The fully fetched rows of one statement, with the cursor-like
+    description, fetchone(), fetchall() and iteration callers use.
+    """
+
+    def __init__(self, description, rows: list):
+        self.description = description
+        self._rows = rows
+        self._position = 0
+
+    def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def fetchall(self) -> list:
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+class PooledConnection:
+    """
+    A pooled DB-API connection. execute() keeps one cursor per SQL string
+    (LRU bounded); re-executing the same SQL on the same pyodbc cursor reuses
+    the prepared statement instead of preparing it again. Every result set is
+    read in full before execute() returns, so no cached cursor is left with
+    pending results (SQL Server without MARS allows only one active result
+    set per connection). Use cursor() to stream a large result instead.
+    """
+
+    def __init__(self, raw, backend):
+        self.raw = raw
+        self.backend = backend
+        self.last_used = time.monotonic()
+        self._statements = OrderedDict()
+
+    def execute(self, sql: str, params=()):
+        cursor = self._statements.pop(sql, None) or self.raw.cursor()
+        self._statements[sql] = cursor
+        if len(self._statements) > STATEMENT_CACHE_SIZE:
+            _, old = self._statements.popitem(last=False)
+            old.close()
+        cursor.execute(sql, params)
+        description = cursor.description
+        rows = cursor.fetchall() if description is not None else []
+        # drain any further result sets (e.g. row counts) so the connection is free; sqlite3 has no nextset
+        if hasattr(cursor, "nextset"):
+            while cursor.nextset():
+                pass
+        return Result(description, rows)
+
+    def executemany(self, sql: str, rows) -> None:
+        cursor = self.raw.cursor()
+        self.backend.prepare_bulk_cursor(cursor)
+        try:
+            cursor.executemany(sql, rows)
+        finally:
+            cursor.close()
+
+    def cursor(self):
+        return self.raw.cursor()
+
+    def commit(self) -> None:
+        self.raw.commit()
+
+    def rollback(self) -> None:
+        self.raw.rollback()
+
+    def ping(self) -> bool:
+        try:
+            cursor = self.raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        for cursor in self._statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self._statements.clear()
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    def __init__(self, backend, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.backend = backend
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._schema_ready = False
+
+    def _new_connection(self) -> PooledConnection:
+        conn = PooledConnection(self.backend.connect(), self.backend)
+        if not self._schema_ready:
+            self.backend.init_schema(conn.raw)
+            self._schema_ready = True
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        return self._new_connection()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+            idle_for = time.monotonic() - conn.last_used
+            if idle_for < HEALTHCHECK_IDLE_SECONDS or conn.ping():
+                return conn
+            self._discard(conn)
+
+    def release(self, conn: PooledConnection) -> None:
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        conn.last_used = time.monotonic()
+        self._idle.put(conn)
+
+    def _discard(self, conn: PooledConnection) -> None:
+        conn.close()
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(make_backend())
+    return _pool
+
+def configure(backend) -> ConnectionPool:
+    """Replaces the process-wide pool, e.g. with a SqliteBackend in tests."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool(backend)
+    return _pool
+
+def connection():
+    return get_pool().connection()
+
+def integrity_error():
+    return get_pool().backend.integrity_error
+
+def returning(insert_sql: str, column: str) -> str:
+    """
+    Makes a single-row INSERT return its generated column as a one-row
+    result, in the backend's dialect (OUTPUT INSERTED or RETURNING).
+    """
+    return get_pool().backend.returning(insert_sql, column)
+
+def limit(select_sql: str, n: int) -> str:
+    """Adds a row limit to a SELECT in the backend's dialect (TOP or LIMIT)."""
+    return get_pool().backend.limit(select_sql, n)
@@ -0,0 +1,91 @@
+"""
+Duplicate and amendment detection for a client's agreements.
+
+Following the matching order in TextFile1.txt, agreements are blocked on
+original_date, then on lender and borrower (party ids where resolved,
+normalized names otherwise), then compared on principal and the other terms.
+All comparisons are vectorized over pandas/NumPy columns, so a whole book is
+a self-join plus a few array operations rather than an O(n^2) Python loop.
+
+  duplicate: same date and parties, and principal, maturity, rate and currency agree
+  amendment: same date and parties, but at least one of those terms differs
+"""
+
+import numpy as np
+import pandas as pd
+
+from . import repository
+from .frames import FRAME_COLUMNS, agreement_frame
+
+PRINCIPAL_TOLERANCE = 0.005
+RATE_TOLERANCE = 1e-6
+BLOCK_COLUMNS = ["original_date", "lender_key", "borrower_key"]
+COMPARED_TERMS = ("principal", "maturity_date", "interest_rate", "currency")
+
+def _comparable(frame: pd.DataFrame) -> pd.DataFrame:
+    return frame[frame["original_date"].notna() & frame["lender_key"].ne("") & frame["borrower_key"].ne("")]
+
+def classify_pairs(pairs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Takes candidate pairs with *_a / *_b columns and adds a boolean column per
+    term (True where the term differs) and a kind column.
+    """
+    principal_a, principal_b = pairs["principal_a"].to_numpy(), pairs["principal_b"].to_numpy()
+    rate_a, rate_b = pairs["interest_rate_a"].to_numpy(), pairs["interest_rate_b"].to_numpy()
+    maturity_a, maturity_b = pairs["maturity_date_a"], pairs["maturity_date_b"]
+
+    differs = pd.DataFrame(index=pairs.index)
+    differs["principal"] = ~np.isclose(principal_a, principal_b, rtol=PRINCIPAL_TOLERANCE, atol=0.5, equal_nan=True)
+    differs["interest_rate"] = ~np.isclose(rate_a, rate_b, rtol=0, atol=RATE_TOLERANCE, equal_nan=True)
+    differs["maturity_date"] = ~((maturity_a == maturity_b) | (maturity_a.isna() & maturity_b.isna())).to_numpy()
+    differs["currency"] = (pairs["currency_a"] != pairs["currency_b"]).to_numpy()
+
+    result = pairs[["id_a", "id_b"]].copy()
+    for term in COMPARED_TERMS:
+        result[f"{term}_differs"] = differs[term].to_numpy()
+    result["kind"] = np.where(differs.any(axis=1).to_numpy(), "amendment", "duplicate")
+    return result
+
+def _to_matches(classified: pd.DataFrame) -> list:
+    matches = []
+    for row in classified.itertuples(index=False):
+        matches.append({
+            "agreement_id": int(row.id_b),
+            "matches_id": int(row.id_a),
+            "kind": row.kind,
+            "differs": [term for term in COMPARED_TERMS if getattr(row, f"{term}_differs")],
+        })
+    return matches
+
+def find_duplicates(client_id: int) -> list:
+    """
+    Re-checks a client's whole book. Each match pairs a later agreement with
+    an earlier one it duplicates or amends.
+    """
+    frame = _comparable(agreement_frame(repository.agreement_rows(client_id, FRAME_COLUMNS)))
+    pairs = frame.merge(frame, on=BLOCK_COLUMNS, suffixes=("_a", "_b"))
+    pairs = pairs[pairs["id_a"] < pairs["id_b"]]
+    if pairs.empty:
+        return []
+    return _to_matches(classify_pairs(pairs).sort_values(["id_b", "id_a"]))
+
+def find_matches(client_id: int, row: dict) -> list:
+    """
+    Checks one new agreement (before it is inserted) against the client's
+    existing agreements with the same lender and borrower parties. row must
+    be in stored form (values.canonical_agreement), so it is compared on the
+    same values as the agreements already in the book.
+    """
+    if row.get("lender_party_id") is None or row.get("borrower_party_id") is None:
+        return []
+    existing = agreement_frame(repository.agreement_rows(
+        client_id, FRAME_COLUMNS, lender_party_id=row["lender_party_id"], borrower_party_id=row["borrower_party_id"]))
+    candidate = agreement_frame([(0,) + tuple(row.get(col) for col in FRAME_COLUMNS[1:])])
+    existing, candidate = _comparable(existing), _comparable(candidate)
+    if existing.empty or candidate.empty:
+        return []
+    pairs = existing.merge(candidate, on=BLOCK_COLUMNS, suffixes=("_a", "_b"))
+    if pairs.empty:
+        return []
+    return [{"matches_id": m["matches_id"], "kind": m["kind"], "differs": m["differs"]}
+            for m in _to_matches(classify_pairs(pairs))]
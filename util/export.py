@@ -0,0 +1,202 @@
+"""
+Streaming export of loan books. The rows are read off the database in
+fetchmany() chunks into a spool (memory, spilling to a temp file past
+SPOOL_MAX_BYTES), so the pooled connection goes back to the pool before
+the first byte is sent and a slow download never holds it. The spool is
+then written out as CSV or XLSX a chunk at a time, so memory use doesn't
+grow with the size of the book.
+
+XLSX is written directly as the zip of SpreadsheetML parts Excel reads,
+one worksheet row at a time, instead of building a workbook first.
+"""
+
+import csv
+import io
+import pickle
+import re
+import tempfile
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from .db import connection
+
+EXPORT_COLUMNS = ("client_name", "lender", "borrower", "original_date", "maturity_date",
+                  "currency", "principal", "interest_rate")
+FETCH_SIZE = 1000
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+XLSX_CHUNK_BYTES = 64 * 1024
+
+def spool_agreement_rows(client_id=None):
+    """
+    Reads agreement rows (as tuples in EXPORT_COLUMNS order) for one client,
+    or for every client when client_id is None, and returns an iterator over
+    them. The connection is released before this returns; the spool is
+    closed when the iterator is exhausted or closed.
+    """
+    sql = """
+        SELECT c.client_name, a.lender, a.borrower, a.original_date, a.maturity_date,
+               a.currency, a.principal, a.interest_rate
+        FROM demo_loan_agreement a
+        JOIN clients c ON c.client_id = a.client_id
+    """
+    params = ()
+    if client_id is not None:
+        sql += " WHERE a.client_id = ?"
+        params = (client_id,)
+    sql += " ORDER BY a.client_id, a.id"
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(FETCH_SIZE)
+                    if not rows:
+                        break
+                    pickle.dump([tuple(row) for row in rows], spool, pickle.HIGHEST_PROTOCOL)
+            finally:
+                cursor.close()
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return _read_spool(spool)
+
+def _read_spool(spool):
+    with spool:
+        while True:
+            try:
+                rows = pickle.load(spool)
+            except EOFError:
+                return
+            yield from rows
+
+def iter_csv(rows, header=EXPORT_COLUMNS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % FETCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# === XLSX ===
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Loans" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # style 1 is the built-in short date format, for date cells
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'),
+}
+SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+              '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+SHEET_TAIL = '</sheetData></worksheet>'
+EXCEL_EPOCH = date(1899, 12, 30)
+# characters XML 1.0 doesn't allow, even escaped
+_XML_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+class _ChunkSink:
+    """Write-only file for zipfile that hands back what was written so far."""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def _cell(ref: str, value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, date):
+        day = value.date() if isinstance(value, datetime) else value
+        return f'<c r="{ref}" s="1"><v>{(day - EXCEL_EPOCH).days}</v></c>'
+    text = escape(_XML_ILLEGAL.sub("", str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _sheet_row(number: int, values, columns: list) -> str:
+    cells = "".join(_cell(f"{column}{number}", value) for column, value in zip(columns, values))
+    return f'<row r="{number}">{cells}</row>'
+
+def iter_xlsx(rows, header=EXPORT_COLUMNS):
+    """
+    Writes the workbook zip to an in-memory sink and yields whatever has
+    been compressed each time it passes XLSX_CHUNK_BYTES, so the first
+    bytes go out before the last row is read.
+    """
+    columns = [_column_letter(i) for i in range(len(header))]
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(SHEET_HEAD.encode("utf-8"))
+            sheet.write(_sheet_row(1, header, columns).encode("utf-8"))
+            for number, row in enumerate(rows, start=2):
+                sheet.write(_sheet_row(number, row, columns).encode("utf-8"))
+                if sink.size >= XLSX_CHUNK_BYTES:
+                    yield sink.take()
+            sheet.write(SHEET_TAIL.encode("utf-8"))
+    yield sink.take()
@@ -0,0 +1,51 @@
+"""
+Columnar (pandas/NumPy) views of a client's agreements for bulk work such
+as duplicate detection. They are built from the typed columns written by
+util.values.canonical_agreement, so nothing is parsed on read: principal
+comes from principal_minor, the rate from rate_bps and dates are the
+stored ISO dates.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .values import MINOR_UNITS
+
+FRAME_COLUMNS = ("id", "original_date", "maturity_date", "currency", "principal_minor", "rate_bps",
+                 "lender", "borrower", "lender_party_id", "borrower_party_id")
+
+def stored_dates(values: pd.Series) -> pd.Series:
+    # ISO strings from SQLite, dates from SQL Server
+    return pd.to_datetime(values, format="ISO8601", errors="coerce").astype("datetime64[ns]")
+
+def scaled(values: pd.Series, divisor: float) -> pd.Series:
+    # DECIMAL columns come back as Decimal from SQL Server
+    return pd.to_numeric(values, errors="coerce").astype("float64") / divisor
+
+def normalized_names(values: pd.Series) -> pd.Series:
+    return values.fillna("").astype(str).str.lower().str.replace(r"[^a-z0-9]", "", regex=True)
+
+def agreement_frame(rows) -> pd.DataFrame:
+    """Builds a typed frame from rows in FRAME_COLUMNS order."""
+    raw = pd.DataFrame.from_records(list(rows), columns=list(FRAME_COLUMNS))
+    frame = pd.DataFrame({
+        "id": raw["id"].astype("int64"),
+        "original_date": stored_dates(raw["original_date"]),
+        "maturity_date": stored_dates(raw["maturity_date"]),
+        "currency": raw["currency"].fillna("").astype(str),
+        # in currency units and percent, as the analytics report them
+        "principal": scaled(raw["principal_minor"], MINOR_UNITS),
+        "interest_rate": scaled(raw["rate_bps"], 100),
+        "lender": raw["lender"],
+        "borrower": raw["borrower"],
+    })
+    frame["lender_key"] = _party_keys(raw["lender_party_id"], raw["lender"])
+    frame["borrower_key"] = _party_keys(raw["borrower_party_id"], raw["borrower"])
+    return frame
+
+def _party_keys(party_ids: pd.Series, names: pd.Series) -> pd.Series:
+    # Resolved party ids when present, otherwise the normalized name ("" if unknown)
+    ids = pd.to_numeric(party_ids, errors="coerce")
+    names = normalized_names(names)
+    keys = np.where(ids.notna(), "p" + ids.fillna(0).astype("int64").astype(str), "n" + names)
+    return pd.Series(np.where(names.eq("") & ids.isna(), "", keys), index=party_ids.index)
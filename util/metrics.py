@@ -0,0 +1,156 @@
+"""
+In-process timing metrics in the Prometheus text format.
+
+Each timed block is recorded in a summary keyed by metric name and labels:
+a count, a sum, an error count and a window of the most recent durations
+used for the p50/p95/p99 quantiles. Timers work as context managers or
+decorators:
+
+    with metrics.timed(metrics.SCANNER_STAGE_SECONDS, stage="ocr"):
+        ...
+
+    @metrics.timed_call(metrics.DB_CALL_SECONDS)   # labelled call=<function name>
+    def list_clients(): ...
+
+Metrics are per process: work done in ProcessPoolExecutor children (batch
+extraction, parallel OCR pages) is only seen through the parent's wait.
+
+While a trace is active for the current request (see start_trace), every
+timer also adds its duration to the trace, which the web app returns as a
+Server-Timing header.
+"""
+
+import functools
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+HTTP_REQUEST_SECONDS = "loanlens_http_request_seconds"
+SCANNER_STAGE_SECONDS = "loanlens_scanner_stage_seconds"
+DB_CALL_SECONDS = "loanlens_db_call_seconds"
+METRIC_HELP = {
+    HTTP_REQUEST_SECONDS: "Time spent handling web requests, by endpoint",
+    SCANNER_STAGE_SECONDS: "Time spent in each scanner stage",
+    DB_CALL_SECONDS: "Time spent in each repository database call",
+}
+# Server-Timing entries are named <prefix>.<label values>, e.g. db.page_agreements or scan.ocr
+TRACE_PREFIX = {SCANNER_STAGE_SECONDS: "scan", DB_CALL_SECONDS: "db"}
+QUANTILES = (0.5, 0.95, 0.99)
+# durations kept per series for the quantiles
+WINDOW_SIZE = 1024
+
+class _Series:
+    __slots__ = ("count", "total", "errors", "window")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.window = deque(maxlen=WINDOW_SIZE)
+
+_series = {}
+_lock = threading.Lock()
+_trace = ContextVar("loanlens_trace", default=None)
+
+def observe(metric: str, seconds: float, error: bool = False, **labels) -> None:
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = _Series()
+        series.count += 1
+        series.total += seconds
+        series.errors += error
+        series.window.append(seconds)
+    trace = _trace.get()
+    if trace is not None and metric in TRACE_PREFIX:
+        name = ".".join([TRACE_PREFIX[metric]] + [str(value) for _, value in key[1]])
+        entry = trace.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+class _Timer:
+    def __init__(self, metric: str, labels: dict):
+        self.metric = metric
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.metric, time.perf_counter() - self.started, error=exc_type is not None, **self.labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.metric, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+def timed(metric: str, **labels) -> _Timer:
+    return _Timer(metric, labels)
+
+def timed_call(metric: str):
+    """Decorator timing a function under metric, labelled with its name."""
+    def decorate(func):
+        return timed(metric, call=func.__name__)(func)
+    return decorate
+
+# === Request traces ===
+def start_trace(enabled: bool = True):
+    """
+    Starts (or, with enabled=False, explicitly switches off) tracing in the
+    current context. Returns a token for end_trace.
+    """
+    return _trace.set({} if enabled else None)
+
+def end_trace(token):
+    """Returns {name: (calls, seconds)} recorded since start_trace, or None if tracing was off."""
+    trace = _trace.get()
+    _trace.reset(token)
+    if trace is None:
+        return None
+    return {name: (calls, seconds) for name, (calls, seconds) in trace.items()}
+
+def server_timing(trace: dict, total_seconds: float) -> str:
+    entries = [f'{name};desc="calls={calls}";dur={seconds * 1000:.1f}' for name, (calls, seconds) in trace.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+# === Exposition ===
+def _quantile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _label_text(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def render() -> str:
+    """All series in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        snapshot = [(metric, labels, series.count, series.total, series.errors, sorted(series.window))
+                    for (metric, labels), series in _series.items()]
+    snapshot.sort(key=lambda item: (item[0], item[1]))
+
+    lines = []
+    for metric in sorted({item[0] for item in snapshot}):
+        rows = [item for item in snapshot if item[0] == metric]
+        lines.append(f"# HELP {metric} {METRIC_HELP.get(metric, metric)}")
+        lines.append(f"# TYPE {metric} summary")
+        for _, labels, count, total, _, window in rows:
+            for q in QUANTILES:
+                lines.append(f"{metric}{_label_text(labels, [('quantile', q)])} {_quantile(window, q):.6f}")
+            lines.append(f"{metric}_sum{_label_text(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_label_text(labels)} {count}")
+        errors = metric.replace("_seconds", "_errors_total")
+        lines.append(f"# HELP {errors} Failed calls counted in {metric}")
+        lines.append(f"# TYPE {errors} counter")
+        for _, labels, _, _, error_count, _ in rows:
+            lines.append(f"{errors}{_label_text(labels)} {error_count}")
+    return "\n".join(lines) + "\n"
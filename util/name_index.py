@@ -0,0 +1,137 @@
+"""
+In-memory trigram index for spotting near-duplicate names, such as
+"Acme Holdings Ltd" and "ACME Holding Limited". Exact duplicates are caught
+by the unique client_key column; this index only produces suggestions.
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Legal forms carry no identity, and plural/long spellings are folded together
+LEGAL_FORMS = {"ltd", "limited", "inc", "incorporated", "llc", "plc", "gmbh", "bv", "nv", "sa", "ag",
+               "spa", "sarl", "srl", "corp", "corporation", "co", "company", "lp", "llp"}
+TOKEN_ALIASES = {"holdings": "holding", "intl": "international", "grp": "group", "&": "and"}
+# trigrams shared by more names than this (e.g. "ing") are not used to find candidates
+MAX_CANDIDATE_POSTING = 1000
+# how stale the client index may get before clients added by other processes are loaded
+REFRESH_SECONDS = float(os.environ.get("LOANLENS_CLIENT_INDEX_REFRESH_SECONDS", 5))
+
+def similarity_key(name: str) -> str:
+    tokens = re.findall(r"[a-z0-9&]+", name.lower().replace(".", ""))
+    tokens = [TOKEN_ALIASES.get(t, t) for t in tokens]
+    kept = [t for t in tokens if t not in LEGAL_FORMS]
+    return " ".join(kept or tokens)
+
+def trigrams(key: str) -> frozenset:
+    padded = f"  {key} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class TrigramIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._names = {}
+        self._grams = {}
+        self._postings = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, item_id, name: str) -> None:
+        with self._lock:
+            if item_id in self._names:
+                self.remove(item_id)
+            grams = trigrams(similarity_key(name))
+            self._names[item_id] = name
+            self._grams[item_id] = grams
+            for gram in grams:
+                self._postings[gram].add(item_id)
+
+    def items(self) -> list:
+        """(item_id, name) pairs currently indexed."""
+        with self._lock:
+            return list(self._names.items())
+
+    def remove(self, item_id) -> None:
+        with self._lock:
+            for gram in self._grams.pop(item_id, ()):
+                posting = self._postings[gram]
+                posting.discard(item_id)
+                if not posting:
+                    del self._postings[gram]
+            self._names.pop(item_id, None)
+
+    def search(self, name: str, limit: int = 5, threshold: float = 0.6) -> list:
+        """
+        Returns up to limit (item_id, name, score) tuples whose Dice
+        similarity on trigrams is at least threshold, best first.
+        """
+        query = trigrams(similarity_key(name))
+        if not query:
+            return []
+        # A name scoring >= threshold shares at least min_shared trigrams with the
+        # query. After skipping the common postings it must still be in `needed`
+        # of the remaining ones, which prunes most candidates before scoring.
+        min_shared = max(1, math.ceil(threshold * len(query) / (2 - threshold)))
+        with self._lock:
+            postings = [self._postings.get(g, ()) for g in query]
+            selective = [p for p in postings if len(p) <= MAX_CANDIDATE_POSTING]
+            if not selective:
+                selective = sorted(postings, key=len)[:3]
+            needed = max(1, min_shared - (len(postings) - len(selective)))
+            counts = Counter()
+            for posting in selective:
+                counts.update(posting)
+            candidates = [item_id for item_id, hits in counts.items() if hits >= needed]
+
+            results = []
+            for item_id in candidates:
+                grams = self._grams[item_id]
+                score = 2 * len(query & grams) / (len(query) + len(grams))
+                if score >= threshold:
+                    results.append((item_id, self._names[item_id], round(score, 3)))
+        results.sort(key=lambda r: r[2], reverse=True)
+        return results[:limit]
+
+class ClientIndex(TrigramIndex):
+    """Client names, loaded incrementally: refresh() adds clients with an id above the last one indexed."""
+
+    def __init__(self, load_clients):
+        super().__init__()
+        self.load_clients = load_clients
+        self.last_client_id = 0
+        self.refreshed_at = 0.0
+
+    def refresh(self) -> int:
+        with self._lock:
+            added = 0
+            for client_id, client_name in self.load_clients(self.last_client_id):
+                self.add(client_id, client_name)
+                self.last_client_id = max(self.last_client_id, client_id)
+                added += 1
+            self.refreshed_at = time.monotonic()
+            return added
+
+_client_index = None
+_client_index_lock = threading.Lock()
+
+def client_index(load_clients, refresh: bool = False) -> ClientIndex:
+    """
+    The process-wide index of client names. load_clients(after_client_id)
+    returns (client_id, client_name) pairs for clients with a higher id, in
+    id order. They are loaded on first use and then at most every
+    REFRESH_SECONDS, or at once with refresh=True, so clients created by
+    other processes are suggested too.
+    """
+    global _client_index
+    with _client_index_lock:
+        if _client_index is None:
+            _client_index = ClientIndex(load_clients)
+            _client_index.refresh()
+        index = _client_index
+    if refresh or time.monotonic() - index.refreshed_at > REFRESH_SECONDS:
+        index.refresh()
+    return index
@@ -0,0 +1,167 @@
+"""
+Per-client registry of lender/borrower parties.
+
+Each party has a canonical name and any number of aliases. Extracted names
+are resolved in memory by exact normalized key only; the key keeps legal
+form and jurisdiction, so "Acme Holdings (US) Inc" and "Acme Holdings (UK)
+Ltd" stay separate parties. Anything without an exact match becomes a new
+party. Names that are merely similar (trigram similarity over the client's
+aliases) are offered by merge_suggestions() and only merged once someone
+confirms them with merge_parties(). Agreements carry
+lender_party_id/borrower_party_id, so grouping and search by party are
+indexed equality lookups.
+
+Run `python -m util.party_registry` to resolve parties for existing rows.
+"""
+
+import os
+import threading
+import time
+
+from . import repository
+from .db import integrity_error
+from .name_index import TrigramIndex
+from .normalize import normalize_name
+
+# === CONFIGURATION ===
+# Similar names are only suggested, never merged, so this can be looser than an auto-merge would allow
+SUGGESTION_THRESHOLD = 0.75
+# aliases added or moved by other processes (e.g. a merge) are picked up at least this often
+REFRESH_SECONDS = float(os.environ.get("LOANLENS_PARTY_REFRESH_SECONDS", 5))
+BACKFILL_BATCH_SIZE = 500
+
+class ClientParties:
+    def __init__(self, client_id: int):
+        self.client_id = client_id
+        self.lock = threading.RLock()
+        self.party_by_key = {}
+        self.index = TrigramIndex()
+        self.last_alias_id = 0
+        self.refreshed_at = 0.0
+
+    def _add_alias(self, party_id: int, alias: str, alias_key: str) -> None:
+        self.party_by_key[alias_key] = party_id
+        self.index.add(alias_key, alias)
+
+    def refresh(self) -> None:
+        """Loads aliases added since the last refresh, including other processes' inserts."""
+        with self.lock:
+            for alias_id, party_id, alias, alias_key in repository.list_party_aliases(self.client_id, self.last_alias_id):
+                self._add_alias(party_id, alias, alias_key)
+                self.last_alias_id = alias_id
+            self.refreshed_at = time.monotonic()
+
+    def resolve(self, name: str):
+        """Returns the party id for name's exact key, registering a new party if there is none."""
+        key = normalize_name(name or "")
+        if not key:
+            return None
+        with self.lock:
+            if key not in self.party_by_key or time.monotonic() - self.refreshed_at > REFRESH_SECONDS:
+                self.refresh()
+            if key in self.party_by_key:
+                return self.party_by_key[key]
+            try:
+                party_id = repository.create_party(self.client_id, name.strip(), key)
+            except integrity_error():
+                # another process registered the same key first
+                self.refresh()
+                return self.party_by_key.get(key)
+            self.refresh()
+            return party_id
+
+    def suggestions(self, name: str, limit: int = 5) -> list:
+        """
+        Parties with an alias similar to name, other than name's own party,
+        as (party_id, alias, score) best first. For confirmation only.
+        """
+        with self.lock:
+            own = self.party_by_key.get(normalize_name(name or ""))
+            found = {}
+            for alias_key, alias, score in self.index.search(name, limit=limit * 4, threshold=SUGGESTION_THRESHOLD):
+                party_id = self.party_by_key[alias_key]
+                if party_id != own and party_id not in found:
+                    found[party_id] = (party_id, alias, score)
+            return list(found.values())[:limit]
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def client_parties(client_id: int) -> ClientParties:
+    with _registries_lock:
+        registry = _registries.get(client_id)
+        if registry is None:
+            registry = _registries[client_id] = ClientParties(client_id)
+            registry.refresh()
+    return registry
+
+def register_party(client_id: int, canonical_name: str, aliases=()) -> int:
+    """Registers a known party (e.g. entered by the client) together with its aliases."""
+    registry = client_parties(client_id)
+    with registry.lock:
+        party_id = registry.resolve(canonical_name)
+        for alias in aliases:
+            key = normalize_name(alias or "")
+            if key and key not in registry.party_by_key:
+                repository.add_party_alias(client_id, party_id, alias.strip(), key)
+        registry.refresh()
+    return party_id
+
+def merge_suggestions(client_id: int) -> list:
+    """
+    Pairs of the client's parties whose names look alike, for someone to
+    confirm with merge_parties, as {"party_id", "name", "similar_party_id",
+    "similar_name", "score"} best first. Each pair is listed once.
+    """
+    registry = client_parties(client_id)
+    with registry.lock:
+        registry.refresh()
+        aliases = registry.index.items()
+        pairs = {}
+        for alias_key, alias in aliases:
+            party_id = registry.party_by_key[alias_key]
+            for other_id, other_alias, score in registry.suggestions(alias):
+                pair = (min(party_id, other_id), max(party_id, other_id))
+                if pair not in pairs or pairs[pair]["score"] < score:
+                    pairs[pair] = {"party_id": party_id, "name": alias,
+                                   "similar_party_id": other_id, "similar_name": other_alias, "score": score}
+    return sorted(pairs.values(), key=lambda pair: pair["score"], reverse=True)
+
+def merge_parties(client_id: int, party_id: int, into_party_id: int) -> int:
+    """
+    Confirms a suggestion: party_id's aliases and agreements move to
+    into_party_id and party_id is deleted. Returns into_party_id.
+    """
+    if party_id == into_party_id:
+        raise ValueError("A party can't be merged into itself")
+    registry = client_parties(client_id)
+    with registry.lock:
+        repository.merge_parties(client_id, party_id, into_party_id)
+        registry.refresh()
+    return into_party_id
+
+def attach_party_ids(client_id: int, row: dict) -> dict:
+    """Adds lender_party_id and borrower_party_id to an agreement row before it is inserted."""
+    registry = client_parties(client_id)
+    row["lender_party_id"] = registry.resolve(row.get("lender"))
+    row["borrower_party_id"] = registry.resolve(row.get("borrower"))
+    return row
+
+def backfill(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    updated = 0
+    after_id = 0
+    while True:
+        batch = repository.agreements_missing_parties(after_id, batch_size)
+        if not batch:
+            break
+        updates = []
+        for agreement_id, client_id, lender, borrower in batch:
+            registry = client_parties(client_id)
+            updates.append((registry.resolve(lender), registry.resolve(borrower), agreement_id))
+        repository.set_agreement_parties(updates)
+        updated += len(updates)
+        after_id = batch[-1][0]
+    return updated
+
+if __name__ == "__main__":
+    print(f"Resolved parties for {backfill()} agreements.")
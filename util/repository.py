@@ -0,0 +1,465 @@
+"""
+Repository functions for the LoanLens tables. Routes call these instead of
+writing SQL inline; every function borrows a connection from util.db's pool.
+"""
+
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from .db import connection, integrity_error, limit, returning
+from .metrics import DB_CALL_SECONDS, timed_call
+from .values import canonical_agreement, to_minor_units, to_rate_bps
+
+AGREEMENT_COLUMNS = ("lender", "borrower", "original_date", "currency", "principal", "interest_rate", "maturity_date",
+                     "lender_party_id", "borrower_party_id", "rate_bps", "principal_minor")
+# API sort name -> typed column it sorts on
+AGREEMENT_SORT_COLUMNS = {"id": "id", "original_date": "original_date", "maturity_date": "maturity_date",
+                          "principal": "principal_minor", "interest_rate": "rate_bps"}
+
+def _rows_to_dicts(cursor) -> list:
+    cols = [col[0] for col in cursor.description]
+    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
+# === Users ===
+@timed_call(DB_CALL_SECONDS)
+def get_user(username: str):
+    """The user's id, username and stored password hash (see util.auth), or None."""
+    with connection() as conn:
+        rows = _rows_to_dicts(conn.execute("SELECT id, username, password FROM users WHERE username = ?", (username,)))
+        return rows[0] if rows else None
+
+@timed_call(DB_CALL_SECONDS)
+def set_password(user_id: int, password_hash: str) -> None:
+    with connection() as conn:
+        conn.execute("UPDATE users SET password = ? WHERE id = ?", (password_hash, user_id))
+        conn.commit()
+
+@timed_call(DB_CALL_SECONDS)
+def username_exists(username: str) -> bool:
+    with connection() as conn:
+        cursor = conn.execute("SELECT COUNT(*) FROM users WHERE username = ?", (username,))
+        return cursor.fetchone()[0] > 0
+
+@timed_call(DB_CALL_SECONDS)
+def create_user(username: str, password_hash: str) -> None:
+    with connection() as conn:
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password_hash))
+        conn.commit()
+
+# === Clients ===
+@timed_call(DB_CALL_SECONDS)
+def client_key_exists(client_key: str) -> bool:
+    with connection() as conn:
+        return conn.execute("SELECT 1 FROM clients WHERE client_key = ?", (client_key,)).fetchone() is not None
+
+@timed_call(DB_CALL_SECONDS)
+def create_client(client_name: str, client_key: str, has_report: str):
+    """
+    Inserts a client and returns its id, or None when another client
+    already has the same client_key (enforced by the unique index).
+    """
+    with connection() as conn:
+        try:
+            client_id = conn.execute(
+                returning("INSERT INTO clients(client_name, client_key, has_report) VALUES(?,?,?)", "client_id"),
+                (client_name, client_key, has_report)).fetchone()[0]
+            conn.commit()
+        except integrity_error():
+            return None
+        return client_id
+
+@timed_call(DB_CALL_SECONDS)
+def list_client_summaries() -> list:
+    with connection() as conn:
+        return _rows_to_dicts(conn.execute("SELECT client_id, client_name, has_report FROM clients"))
+
+@timed_call(DB_CALL_SECONDS)
+def list_clients(after_client_id: int = 0) -> list:
+    with connection() as conn:
+        cursor = conn.execute(
+            "SELECT client_id, client_name FROM clients WHERE client_id > ? ORDER BY client_id", (after_client_id,))
+        return [tuple(row) for row in cursor.fetchall()]
+
+@timed_call(DB_CALL_SECONDS)
+def list_client_keys() -> set:
+    with connection() as conn:
+        return {row[0] for row in conn.execute("SELECT client_key FROM clients WHERE client_key IS NOT NULL").fetchall()}
+
+@timed_call(DB_CALL_SECONDS)
+def clients_missing_key(after_id: int, batch_size: int) -> list:
+    with connection() as conn:
+        cursor = conn.execute(
+            limit("SELECT client_id, client_name FROM clients WHERE client_key IS NULL AND client_id > ? ORDER BY client_id",
+                  batch_size), (after_id,))
+        return [tuple(row) for row in cursor.fetchall()]
+
+@timed_call(DB_CALL_SECONDS)
+def set_client_keys(keys: list) -> None:
+    """keys is a list of (client_key, client_id) pairs."""
+    with connection() as conn:
+        conn.executemany("UPDATE clients SET client_key = ? WHERE client_id = ?", keys)
+        conn.commit()
+
+@timed_call(DB_CALL_SECONDS)
+def get_client_name(client_id: int):
+    with connection() as conn:
+        row = conn.execute("SELECT client_name FROM clients WHERE client_id = ?", (client_id,)).fetchone()
+        return row[0] if row else None
+
+# === Agreements ===
+INSERT_AGREEMENT_SQL = """
+    INSERT INTO demo_loan_agreement(
+        client_id, original_date, maturity_date, currency, principal, interest_rate, lender, borrower,
+        lender_party_id, borrower_party_id, rate_bps, principal_minor
+        )
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+"""
+
+def _agreement_params(client_id: int, row: dict) -> tuple:
+    return (client_id,
+            row.get("original_date"),
+            row.get("maturity_date"),
+            row.get("currency"),
+            row.get("principal"),
+            row.get("interest_rate"),
+            row.get("lender"),
+            row.get("borrower"),
+            row.get("lender_party_id"),
+            row.get("borrower_party_id"),
+            row.get("rate_bps"),
+            row.get("principal_minor"))
+
+# Run for every agreement updated in place, so cached analytics of its client are recomputed
+BUMP_BOOK_VERSION_SQL = """
+    UPDATE clients SET book_version = book_version + 1
+        WHERE client_id = (SELECT client_id FROM demo_loan_agreement WHERE id = ?)
+"""
+
+INSERT_PROVENANCE_SQL = """
+    INSERT INTO agreement_provenance(agreement_id, source_hash, model_version, extracted_text, entities, extracted_at,
+                                     job_id)
+        VALUES (?,?,?,?,?,?,?)
+"""
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+@timed_call(DB_CALL_SECONDS)
+def insert_agreements(client_id: int, rows: list, provenance=None) -> int:
+    """
+    provenance, for scanned rows, has one dict per row as returned by
+    scanner_interface.scan_document, plus the scan job's "job_id" when it
+    came from the job queue. Those rows are inserted one at a time so each
+    provenance record can take its agreement's id. A job id that was already
+    stored raises the integrity error and nothing is inserted.
+    """
+    rows = [canonical_agreement(row) for row in rows]
+    with connection() as conn:
+        if provenance is None:
+            conn.executemany(INSERT_AGREEMENT_SQL, [_agreement_params(client_id, row) for row in rows])
+        else:
+            extracted_at = _utc_now()
+            for row, source in zip(rows, provenance):
+                agreement_id = conn.execute(returning(INSERT_AGREEMENT_SQL, "id"),
+                                            _agreement_params(client_id, row)).fetchone()[0]
+                conn.execute(INSERT_PROVENANCE_SQL, (
+                    agreement_id, source["source_hash"], source["model_version"], source["text"],
+                    json.dumps(source["entities"]), extracted_at, source.get("job_id")))
+        conn.commit()
+    return len(rows)
+
+@timed_call(DB_CALL_SECONDS)
+def agreement_rows(client_id: int, columns, lender_party_id=None, borrower_party_id=None) -> list:
+    """All of a client's agreements as tuples in columns order, optionally for one lender/borrower pair."""
+    where = ["client_id = ?"]
+    params = [client_id]
+    if lender_party_id is not None:
+        where.append("lender_party_id = ?")
+        params.append(lender_party_id)
+    if borrower_party_id is not None:
+        where.append("borrower_party_id = ?")
+        params.append(borrower_party_id)
+    with connection() as conn:
+        cursor = conn.execute(
+            f"SELECT {', '.join(columns)} FROM demo_loan_agreement WHERE {' AND '.join(where)} ORDER BY id",
+            tuple(params))
+        return [tuple(row) for row in cursor.fetchall()]
+
+@timed_call(DB_CALL_SECONDS)
+def agreement_stamp(client_id: int) -> tuple:
+    """
+    (count, max id, book version) of a client's agreements; changes whenever
+    agreements are added or removed, or updated in place (see BUMP_BOOK_VERSION_SQL).
+    """
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*), MAX(a.id), (SELECT book_version FROM clients WHERE client_id = ?) "
+            "FROM demo_loan_agreement a WHERE a.client_id = ?", (client_id, client_id)).fetchone()
+        return (row[0], row[1], row[2])
+
+def _keyset_condition(sort: str, descending: bool, after_value, after_id: int):
+    """
+    WHERE clause for the rows after (after_value, after_id) in
+    ORDER BY sort, id. NULLs sort first ascending and last descending,
+    as both SQL Server and SQLite do.
+    """
+    if sort == "id":
+        return ("id < ?" if descending else "id > ?"), [after_id]
+    if after_value is None:
+        if descending:
+            return f"({sort} IS NULL AND id < ?)", [after_id]
+        return f"(({sort} IS NULL AND id > ?) OR {sort} IS NOT NULL)", [after_id]
+    if descending:
+        return (f"({sort} < ? OR ({sort} = ? AND id < ?) OR {sort} IS NULL)",
+                [after_value, after_value, after_id])
+    return f"({sort} > ? OR ({sort} = ? AND id > ?))", [after_value, after_value, after_id]
+
+@timed_call(DB_CALL_SECONDS)
+def page_agreements(client_id: int, filters: dict, columns=AGREEMENT_COLUMNS, sort: str = "id",
+                    descending: bool = False, after=None, page_size: int = 100) -> list:
+    """
+    One page of a client's agreements using keyset pagination on (sort, id).
+    after is the (sort_key, id) of the last row of the previous page.
+    Returns up to page_size + 1 rows, each with a sort_key, so the caller
+    can tell if more exist. Range filters are in API units (ISO dates,
+    percent, major currency units) and run against the typed columns.
+    """
+    if sort not in AGREEMENT_SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort column: {sort}")
+    sort = AGREEMENT_SORT_COLUMNS[sort]
+    if any(col not in AGREEMENT_COLUMNS for col in columns):
+        raise ValueError("Unsupported column requested")
+
+    where = ["client_id = ?"]
+    params = [client_id]
+    if filters.get("date_from"):
+        where.append("original_date >= ?")
+        params.append(filters["date_from"].isoformat())
+    if filters.get("date_to"):
+        where.append("original_date <= ?")
+        params.append(filters["date_to"].isoformat())
+    if filters.get("currency"):
+        where.append("currency = ?")
+        params.append(filters["currency"])
+    for key, column, operator, convert in (("principal_min", "principal_minor", ">=", to_minor_units),
+                                           ("principal_max", "principal_minor", "<=", to_minor_units),
+                                           ("rate_min", "rate_bps", ">=", to_rate_bps),
+                                           ("rate_max", "rate_bps", "<=", to_rate_bps)):
+        if filters.get(key) is not None:
+            value = convert(filters[key])
+            if value is None:
+                raise ValueError(f"{key} is out of range")
+            where.append(f"{column} {operator} ?")
+            params.append(value)
+    for party_column in ("lender_party_id", "borrower_party_id"):
+        if filters.get(party_column) is not None:
+            where.append(f"{party_column} = ?")
+            params.append(filters[party_column])
+    for party in ("lender", "borrower"):
+        if filters.get(party):
+            escaped = filters[party].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append(f"{party} LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+    if after is not None:
+        condition, condition_params = _keyset_condition(sort, descending, after[0], after[1])
+        where.append(condition)
+        params.extend(condition_params)
+
+    direction = "DESC" if descending else "ASC"
+    order_by = f"id {direction}" if sort == "id" else f"{sort} {direction}, id {direction}"
+    select_cols = ["id"] + [col for col in columns if col != "id"] + [f"{sort} AS sort_key"]
+    sql = limit(f"SELECT {', '.join(select_cols)} FROM demo_loan_agreement "
+                f"WHERE {' AND '.join(where)} ORDER BY {order_by}", page_size + 1)
+
+    with connection() as conn:
+        return _rows_to_dicts(conn.execute(sql, tuple(params)))
+
+@timed_call(DB_CALL_SECONDS)
+def search_rows(after_id: int, batch_size: int, client_id: int = None) -> list:
+    """
+    The next batch of agreements across all clients, or of one client, with
+    the scanned text where there is one, for building util.search_index.
+    """
+    where, params = "a.id > ?", [after_id]
+    if client_id is not None:
+        where, params = where + " AND a.client_id = ?", params + [client_id]
+    with connection() as conn:
+        cursor = conn.execute(
+            limit("SELECT a.id, a.client_id, a.lender, a.borrower, a.currency, a.principal_minor, a.rate_bps, "
+                  "a.original_date, a.maturity_date, p.extracted_text "
+                  "FROM demo_loan_agreement a LEFT JOIN agreement_provenance p ON p.agreement_id = a.id "
+                  f"WHERE {where} ORDER BY a.id", batch_size), tuple(params))
+        return _rows_to_dicts(cursor)
+
+@timed_call(DB_CALL_SECONDS)
+def book_versions() -> dict:
+    """Each client's book version (see BUMP_BOOK_VERSION_SQL), by client id."""
+    with connection() as conn:
+        return {client_id: version for client_id, version in
+                conn.execute("SELECT client_id, book_version FROM clients").fetchall()}
+
+# === Provenance ===
+@timed_call(DB_CALL_SECONDS)
+def stale_provenance(model_version: str, after_id: int, batch_size: int) -> list:
+    """
+    The next batch of scanned agreements extracted by a model other than
+    model_version, as (agreement id, client id, extracted text, entities).
+    """
+    with connection() as conn:
+        cursor = conn.execute(
+            limit("SELECT p.agreement_id, a.client_id, p.extracted_text, p.entities "
+                  "FROM agreement_provenance p JOIN demo_loan_agreement a ON a.id = p.agreement_id "
+                  "WHERE p.agreement_id > ? AND p.model_version <> ? ORDER BY p.agreement_id", batch_size),
+            (after_id, model_version))
+        return [(row[0], row[1], row[2], json.loads(row[3])) for row in cursor.fetchall()]
+
+@timed_call(DB_CALL_SECONDS)
+def agreement_for_job(job_id: str):
+    """The id and stored fields of the agreement a scan job inserted, or None if it hasn't."""
+    with connection() as conn:
+        rows = _rows_to_dicts(conn.execute(
+            "SELECT a.id, a.lender, a.borrower, a.original_date, a.maturity_date, a.currency, a.principal, "
+            "a.interest_rate FROM agreement_provenance p JOIN demo_loan_agreement a ON a.id = p.agreement_id "
+            "WHERE p.job_id = ?", (job_id,)))
+        return rows[0] if rows else None
+
+@timed_call(DB_CALL_SECONDS)
+def apply_reextraction(model_version: str, results: list) -> None:
+    """
+    results is a list of (agreement id, entities, {column: new value}). Writes
+    the changed columns and records the new entities and model version, in
+    one transaction.
+    """
+    by_columns = defaultdict(list)
+    for agreement_id, _, values in results:
+        if not set(values) <= set(AGREEMENT_COLUMNS):
+            raise ValueError(f"Unknown agreement columns: {sorted(set(values) - set(AGREEMENT_COLUMNS))}")
+        columns = tuple(sorted(values))
+        if columns:
+            by_columns[columns].append(tuple(values[c] for c in columns) + (agreement_id,))
+    extracted_at = _utc_now()
+    with connection() as conn:
+        for columns, params in by_columns.items():
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            conn.executemany(f"UPDATE demo_loan_agreement SET {assignments} WHERE id = ?", params)
+        changed = [(agreement_id,) for agreement_id, _, values in results if values]
+        if changed:
+            conn.executemany(BUMP_BOOK_VERSION_SQL, changed)
+        conn.executemany(
+            "UPDATE agreement_provenance SET model_version = ?, entities = ?, extracted_at = ? WHERE agreement_id = ?",
+            [(model_version, json.dumps(entities), extracted_at, agreement_id) for agreement_id, entities, _ in results])
+        conn.commit()
+
+# === Parties ===
+@timed_call(DB_CALL_SECONDS)
+def list_party_aliases(client_id: int, after_alias_id: int = 0) -> list:
+    with connection() as conn:
+        cursor = conn.execute(
+            "SELECT alias_id, party_id, alias, alias_key FROM party_aliases "
+            "WHERE client_id = ? AND alias_id > ? ORDER BY alias_id", (client_id, after_alias_id))
+        return [tuple(row) for row in cursor.fetchall()]
+
+@timed_call(DB_CALL_SECONDS)
+def create_party(client_id: int, canonical_name: str, party_key: str) -> int:
+    """Inserts a party and its canonical name as the first alias; returns the party id."""
+    with connection() as conn:
+        party_id = conn.execute(
+            returning("INSERT INTO parties (client_id, canonical_name, party_key) VALUES (?, ?, ?)", "party_id"),
+            (client_id, canonical_name, party_key)).fetchone()[0]
+        conn.execute("INSERT INTO party_aliases (party_id, client_id, alias, alias_key) VALUES (?, ?, ?, ?)",
+                     (party_id, client_id, canonical_name, party_key))
+        conn.commit()
+    return party_id
+
+@timed_call(DB_CALL_SECONDS)
+def add_party_alias(client_id: int, party_id: int, alias: str, alias_key: str) -> None:
+    with connection() as conn:
+        conn.execute("INSERT INTO party_aliases (party_id, client_id, alias, alias_key) VALUES (?, ?, ?, ?)",
+                     (party_id, client_id, alias, alias_key))
+        conn.commit()
+
+@timed_call(DB_CALL_SECONDS)
+def merge_parties(client_id: int, party_id: int, into_party_id: int) -> None:
+    """
+    Moves a party's aliases and agreements to another party of the same
+    client and deletes it, in one transaction. The aliases are inserted
+    again rather than updated, so registries in other processes see them
+    as new aliases on their next refresh.
+    """
+    with connection() as conn:
+        found = conn.execute("SELECT COUNT(*) FROM parties WHERE client_id = ? AND party_id IN (?, ?)",
+                             (client_id, party_id, into_party_id)).fetchone()[0]
+        if found != 2:
+            raise ValueError("Both parties must belong to the client")
+        aliases = conn.execute("SELECT alias, alias_key FROM party_aliases WHERE client_id = ? AND party_id = ? "
+                               "ORDER BY alias_id", (client_id, party_id)).fetchall()
+        conn.execute("DELETE FROM party_aliases WHERE client_id = ? AND party_id = ?", (client_id, party_id))
+        conn.executemany("INSERT INTO party_aliases (party_id, client_id, alias, alias_key) VALUES (?, ?, ?, ?)",
+                         [(into_party_id, client_id, alias, alias_key) for alias, alias_key in aliases])
+        for column in ("lender_party_id", "borrower_party_id"):
+            conn.execute(f"UPDATE demo_loan_agreement SET {column} = ? WHERE client_id = ? AND {column} = ?",
+                         (into_party_id, client_id, party_id))
+        conn.execute("DELETE FROM parties WHERE client_id = ? AND party_id = ?", (client_id, party_id))
+        conn.commit()
+
+@timed_call(DB_CALL_SECONDS)
+def list_parties(client_id: int) -> list:
+    """Parties with their aliases and how many agreements name them as lender or borrower."""
+    with connection() as conn:
+        parties = _rows_to_dicts(conn.execute(
+            "SELECT party_id, canonical_name FROM parties WHERE client_id = ? ORDER BY canonical_name", (client_id,)))
+        aliases = conn.execute(
+            "SELECT party_id, alias FROM party_aliases WHERE client_id = ? ORDER BY alias_id", (client_id,)).fetchall()
+        lender_counts = dict(conn.execute(
+            "SELECT lender_party_id, COUNT(*) FROM demo_loan_agreement "
+            "WHERE client_id = ? AND lender_party_id IS NOT NULL GROUP BY lender_party_id", (client_id,)).fetchall())
+        borrower_counts = dict(conn.execute(
+            "SELECT borrower_party_id, COUNT(*) FROM demo_loan_agreement "
+            "WHERE client_id = ? AND borrower_party_id IS NOT NULL GROUP BY borrower_party_id", (client_id,)).fetchall())
+    by_party = {}
+    for party_id, alias in aliases:
+        by_party.setdefault(party_id, []).append(alias)
+    for party in parties:
+        party["aliases"] = by_party.get(party["party_id"], [])
+        party["as_lender"] = lender_counts.get(party["party_id"], 0)
+        party["as_borrower"] = borrower_counts.get(party["party_id"], 0)
+    return parties
+
+@timed_call(DB_CALL_SECONDS)
+def agreements_missing_parties(after_id: int, batch_size: int) -> list:
+    with connection() as conn:
+        cursor = conn.execute(
+            limit("SELECT id, client_id, lender, borrower FROM demo_loan_agreement "
+                  "WHERE id > ? AND ((lender IS NOT NULL AND lender_party_id IS NULL) "
+                  "OR (borrower IS NOT NULL AND borrower_party_id IS NULL)) ORDER BY id", batch_size), (after_id,))
+        return [tuple(row) for row in cursor.fetchall()]
+
+@timed_call(DB_CALL_SECONDS)
+def agreements_after(after_id: int, batch_size: int) -> list:
+    """Raw value columns of the next batch of agreements, for the typed-value backfill."""
+    with connection() as conn:
+        cursor = conn.execute(
+            limit("SELECT id, original_date, maturity_date, currency, principal, interest_rate "
+                  "FROM demo_loan_agreement WHERE id > ? ORDER BY id", batch_size), (after_id,))
+        return [tuple(row) for row in cursor.fetchall()]
+
+@timed_call(DB_CALL_SECONDS)
+def set_agreement_values(updates: list) -> None:
+    """
+    updates is a list of (original_date, maturity_date, currency, principal,
+    interest_rate, principal_minor, rate_bps, agreement id).
+    """
+    with connection() as conn:
+        conn.executemany(
+            "UPDATE demo_loan_agreement SET original_date = ?, maturity_date = ?, currency = ?, principal = ?, "
+            "interest_rate = ?, principal_minor = ?, rate_bps = ? WHERE id = ?", updates)
+        conn.executemany(BUMP_BOOK_VERSION_SQL, [(update[-1],) for update in updates])
+        conn.commit()
+
+@timed_call(DB_CALL_SECONDS)
+def set_agreement_parties(updates: list) -> None:
+    """updates is a list of (lender_party_id, borrower_party_id, agreement id)."""
+    with connection() as conn:
+        conn.executemany("UPDATE demo_loan_agreement SET lender_party_id = ?, borrower_party_id = ? WHERE id = ?", updates)
+        conn.commit()
@@ -0,0 +1,267 @@
+"""
+In-memory search index over every client's agreements, for finding
+comparable transactions ("EUR loans, 3-7 year tenor, 10-50m, 4-6%").
+
+Keyword filters use an inverted index from tokens to agreement ids:
+party names (lender and borrower, legal forms dropped), currency codes and
+the words of the scanned agreement text. Principal, rate and tenor (maturity
+minus original date) are kept in sorted arrays, so a range is two bisects.
+A query intersects the id sets of its conditions, smallest first, so it
+never walks the whole book.
+
+The index is built once from the database and then grows incrementally:
+refresh() loads only agreements with an id above the last one indexed, and
+is called after every insert and, at most every REFRESH_SECONDS, before a
+search so rows added by other processes show up. Rows rewritten in place
+(re-extraction, the typed-value backfill) bump their client's book_version,
+so refresh() also re-indexes the agreements of any client whose version
+moved since the last refresh.
+"""
+
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from itertools import chain
+
+from . import repository
+from .name_index import similarity_key
+from .values import principal_amount, rate_text
+
+# === CONFIGURATION ===
+REFRESH_SECONDS = float(os.environ.get("LOANLENS_SEARCH_REFRESH_SECONDS", 5))
+LOAD_BATCH_SIZE = 5000
+# more new values than this are merged by re-sorting instead of inserted one by one
+BULK_INSERT_THRESHOLD = 64
+MIN_TEXT_TOKEN_LENGTH = 3
+DAYS_PER_YEAR = 365.25
+NUMERIC_FIELDS = ("principal_minor", "rate_bps", "tenor_days")
+
+def text_tokens(text: str) -> set:
+    return {t for t in re.findall(r"[a-z0-9]+", (text or "").lower())
+            if len(t) >= MIN_TEXT_TOKEN_LENGTH and not t.isdigit()}
+
+def party_tokens(name: str) -> set:
+    return set(similarity_key(name or "").split())
+
+def _stored_date(value):
+    # stored dates are canonical ISO strings (SQLite) or dates (SQL Server)
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+def tenor_days(original_date, maturity_date):
+    start, end = _stored_date(original_date), _stored_date(maturity_date)
+    if start is None or end is None or end < start:
+        return None
+    return (end - start).days
+
+class SortedValues:
+    """(value, id) pairs kept in value order; ranges are found by bisecting."""
+
+    def __init__(self):
+        self.values = []
+        self.ids = []
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value, item_id: int) -> None:
+        position = bisect.bisect_right(self.values, value)
+        self.values.insert(position, value)
+        self.ids.insert(position, item_id)
+
+    def add_many(self, pairs: list) -> None:
+        if len(pairs) <= BULK_INSERT_THRESHOLD:
+            for value, item_id in pairs:
+                self.add(value, item_id)
+            return
+        merged = sorted(chain(zip(self.values, self.ids), pairs))
+        self.values = [value for value, _ in merged]
+        self.ids = [item_id for _, item_id in merged]
+
+    def remove(self, value, item_id: int) -> None:
+        start, end = self.span(value, value)
+        position = self.ids.index(item_id, start, end)
+        del self.values[position]
+        del self.ids[position]
+
+    def span(self, low=None, high=None) -> tuple:
+        start = 0 if low is None else bisect.bisect_left(self.values, low)
+        end = len(self.values) if high is None else bisect.bisect_right(self.values, high)
+        return start, max(start, end)
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._records = {}
+        self._postings = defaultdict(set)
+        self._numbers = {field: SortedValues() for field in NUMERIC_FIELDS}
+        self._last_id = 0
+        self._book_versions = None
+        self._refreshed_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add_many(self, rows: list) -> None:
+        """Indexes agreement rows as returned by repository.search_rows."""
+        with self._lock:
+            numbers = {field: [] for field in NUMERIC_FIELDS}
+            for row in rows:
+                record = self._add_record(row)
+                for field in NUMERIC_FIELDS:
+                    if record is not None and record[field] is not None:
+                        numbers[field].append((record[field], record["id"]))
+            for field, pairs in numbers.items():
+                self._numbers[field].add_many(pairs)
+
+    def _add_record(self, row: dict):
+        agreement_id = row["id"]
+        if agreement_id in self._records:
+            return None
+        record = dict(row, tenor_days=tenor_days(row["original_date"], row["maturity_date"]))
+        record.pop("extracted_text", None)
+        if record["rate_bps"] is not None:
+            record["rate_bps"] = float(record["rate_bps"])  # DECIMAL comes back as Decimal from SQL Server
+        self._records[agreement_id] = record
+        tokens = _field_tokens(record) | {f"text:{t}" for t in text_tokens(row.get("extracted_text"))}
+        for token in tokens:
+            self._postings[token].add(agreement_id)
+        self._last_id = max(self._last_id, agreement_id)
+        return record
+
+    def _remove_record(self, agreement_id: int) -> None:
+        record = self._records.pop(agreement_id)
+        # the scanned text is never rewritten in place, so its tokens are kept
+        for token in _field_tokens(record):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(agreement_id)
+                if not postings:
+                    del self._postings[token]
+        for field in NUMERIC_FIELDS:
+            if record[field] is not None:
+                self._numbers[field].remove(record[field], agreement_id)
+
+    def _reindex_client(self, client_id: int) -> None:
+        after_id = 0
+        while True:
+            rows = repository.search_rows(after_id, LOAD_BATCH_SIZE, client_id=client_id)
+            for row in rows:
+                if row["id"] in self._records:
+                    self._remove_record(row["id"])
+            self.add_many(rows)
+            if len(rows) < LOAD_BATCH_SIZE:
+                break
+            after_id = rows[-1]["id"]
+
+    def refresh(self) -> int:
+        """
+        Indexes agreements inserted since the last refresh and re-indexes
+        those of clients whose book changed in place; returns how many
+        agreements were new.
+        """
+        with self._lock:
+            # read before loading, so a change made during the load is picked up next time
+            versions = repository.book_versions()
+            added = 0
+            while True:
+                rows = repository.search_rows(self._last_id, LOAD_BATCH_SIZE)
+                self.add_many(rows)
+                added += len(rows)
+                if len(rows) < LOAD_BATCH_SIZE:
+                    break
+            if self._book_versions is not None:
+                for client_id, version in versions.items():
+                    if version != self._book_versions.get(client_id, 0):
+                        self._reindex_client(client_id)
+            self._book_versions = versions
+            self._refreshed_at = time.monotonic()
+            return added
+
+    def _keyword_sets(self, currency=None, party=None, text=None) -> list:
+        sets = []
+        if currency:
+            sets.append(self._postings.get(f"currency:{currency.upper()}", set()))
+        for token in party_tokens(party) if party else ():
+            sets.append(self._postings.get(f"party:{token}", set()))
+        for token in text_tokens(text) if text else ():
+            # a word may appear in a party name or in the agreement text
+            sets.append(self._postings.get(f"party:{token}", set()) | self._postings.get(f"text:{token}", set()))
+        return sets
+
+    def search(self, currency=None, party=None, text=None, ranges=None, limit: int = 100) -> dict:
+        """
+        ranges maps principal_minor, rate_bps or tenor_days to (low, high),
+        either end None for open. Returns {"total", "agreements"} with the
+        newest limit matches first.
+        """
+        if time.monotonic() - self._refreshed_at > REFRESH_SECONDS:
+            self.refresh()
+        with self._lock:
+            matching = self._keyword_sets(currency, party, text)
+            for field, (low, high) in (ranges or {}).items():
+                if low is not None or high is not None:
+                    numbers = self._numbers[field]
+                    start, end = numbers.span(low, high)
+                    matching.append(set(numbers.ids[start:end]))
+            if matching:
+                # smallest first, so each intersection step stays small
+                matching.sort(key=len)
+                matches = matching[0].intersection(*matching[1:])
+            else:
+                matches = self._records.keys()
+            newest = heapq.nlargest(limit, matches)
+            return {"total": len(matches), "agreements": [self._result(item_id) for item_id in newest]}
+
+    def _result(self, item_id: int) -> dict:
+        record = self._records[item_id]
+        return {
+            "id": record["id"],
+            "client_id": record["client_id"],
+            "lender": record["lender"],
+            "borrower": record["borrower"],
+            "currency": record["currency"],
+            "principal": principal_amount(record["principal_minor"]),
+            "interest_rate": rate_text(record["rate_bps"]),
+            "original_date": _iso(record["original_date"]),
+            "maturity_date": _iso(record["maturity_date"]),
+            "tenor_years": round(record["tenor_days"] / DAYS_PER_YEAR, 2) if record["tenor_days"] is not None else None,
+        }
+
+def _field_tokens(record: dict) -> set:
+    tokens = {f"party:{t}" for t in party_tokens(record["lender"]) | party_tokens(record["borrower"])}
+    if record["currency"]:
+        tokens.add(f"currency:{record['currency'].upper()}")
+    return tokens
+
+def _iso(value):
+    parsed = _stored_date(value)
+    return parsed.isoformat() if parsed else None
+
+def years_to_days(years):
+    return None if years is None else round(years * DAYS_PER_YEAR)
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index() -> SearchIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+            _index.refresh()
+    return _index
+
+def refresh() -> None:
+    """Brings the index up to date with the database, if it has been built yet."""
+    if _index is not None:
+        _index.refresh()
@@ -0,0 +1,140 @@
+"""
+Canonical typed values for agreement fields.
+
+The scanner's normalize_value gives dates as YYYY/MM/DD or DD/MM/YYYY, rates
+as "5.25%" and principal as the span the model found ("USD 3.4 million"),
+and the entry form gives whatever was typed. Everything is converted here
+once, before it is stored:
+
+  original_date / maturity_date  ISO dates (DATE columns)
+  rate_bps                       interest rate in basis points, 2 decimals ("5.125%" -> 512.5)
+  principal_minor                principal in hundredths of the currency unit, as an integer
+
+interest_rate and principal keep a readable copy ("5.125%", 1000000.5).
+Queries filter and sort on the typed columns. A non-empty value that can't
+be parsed is logged, since its typed column is left NULL.
+"""
+
+import logging
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+logger = logging.getLogger(__name__)
+
+# normalize_value writes YYYY/MM/DD or DD/MM/YYYY; the entry form and SQL Server give YYYY-MM-DD.
+# Day-first wins for slashed dates; month-first is tried when that can't be a date (12/31/2020).
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%m/%d/%Y",
+                "%B %d, %Y", "%B %d %Y", "%d %B %Y", "%b %d, %Y", "%b %d %Y", "%d %b %Y")
+MINOR_UNITS = 100
+MAX_RATE_BPS = Decimal(10000)
+AMOUNT_MULTIPLIERS = {"thousand": 10 ** 3, "k": 10 ** 3,
+                      "million": 10 ** 6, "mn": 10 ** 6, "mm": 10 ** 6, "m": 10 ** 6,
+                      "billion": 10 ** 9, "bn": 10 ** 9, "b": 10 ** 9}
+# the first number in an amount span: 1.000.000, 3,400,000.50, 1 000 000 or 3.4, then an optional scale word
+_AMOUNT = re.compile(r"(-?)(\d{1,3}(?:\.\d{3}){2,}|\d{1,3}(?:[, ]\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)"
+                     r"(?:\s*(thousand|million|billion|mn|mm|bn|k|m|b)(?![a-z]))?", re.IGNORECASE)
+_ORDINAL = re.compile(r"(?<=\d)(st|nd|rd|th)\b", re.IGNORECASE)
+
+def to_date(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _ORDINAL.sub("", " ".join(str(value).split()))
+    # the whole text, then its first 10 characters for "2020-12-31 00:00:00"
+    for candidate in (text, text[:10]):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, fmt).date()
+            except ValueError:
+                continue
+    return None
+
+def _decimal(value):
+    if value is None:
+        return None
+    try:
+        number = Decimal(str(value).replace(",", "").replace("%", "").strip())
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
+
+def to_rate_bps(value):
+    """"5.25%", "5.25" or 5.25 -> 525.0; None when unparseable or outside 0-100%."""
+    percent = _decimal(value)
+    if percent is None:
+        return None
+    bps = (percent * 100).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    if bps < 0 or bps > MAX_RATE_BPS:
+        return None
+    return float(bps)
+
+def parse_amount(value):
+    """
+    "USD 3.4 million", "3,400,000.00", "EUR 5m" or 3400000 -> Decimal("3400000");
+    None when there is no number. Takes the first number in the text.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return _decimal(value)
+    match = _AMOUNT.search(str(value))
+    if match is None:
+        return None
+    sign, number, scale = match.groups()
+    if number.count(".") > 1:
+        number = number.replace(".", "")
+    amount = Decimal(sign + number.replace(",", "").replace(" ", ""))
+    if scale:
+        amount *= AMOUNT_MULTIPLIERS[scale.lower()]
+    return amount
+
+def to_minor_units(value):
+    """"1000000", "1,000,000.50", "3.4 million" or 1000000.5 -> 100000050; None when unparseable or negative."""
+    amount = parse_amount(value)
+    if amount is None or amount < 0:
+        return None
+    return int((amount * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def rate_text(rate_bps):
+    if rate_bps is None:
+        return None
+    percent = (Decimal(str(rate_bps)) / 100).normalize()
+    return f"{percent:f}%"
+
+def principal_amount(principal_minor):
+    return None if principal_minor is None else principal_minor / MINOR_UNITS
+
+def _iso(value):
+    parsed = to_date(value)
+    return parsed.isoformat() if parsed else None
+
+def _unparsed(field: str, value, parsed):
+    if parsed is None and value is not None and str(value).strip():
+        logger.warning("Could not parse %s %r; storing NULL", field, value)
+    return parsed
+
+def canonical_agreement(row: dict) -> dict:
+    """
+    Returns a copy of an agreement row with canonical dates, rate and
+    principal plus the rate_bps and principal_minor columns. Dates and
+    amounts that can't be parsed become NULL (their columns are typed) and
+    are logged; a scanned row's raw spans stay in its provenance. An
+    unparseable rate keeps its text but gets no rate_bps.
+    """
+    row = dict(row)
+    rate_bps = _unparsed("interest_rate", row.get("interest_rate"), to_rate_bps(row.get("interest_rate")))
+    principal_minor = _unparsed("principal", row.get("principal"), to_minor_units(row.get("principal")))
+    row.update(
+        original_date=_unparsed("original_date", row.get("original_date"), _iso(row.get("original_date"))),
+        maturity_date=_unparsed("maturity_date", row.get("maturity_date"), _iso(row.get("maturity_date"))),
+        currency=(row.get("currency") or "").strip().upper() or None,
+        rate_bps=rate_bps,
+        interest_rate=rate_text(rate_bps) if rate_bps is not None else row.get("interest_rate"),
+        principal_minor=principal_minor,
+        principal=principal_amount(principal_minor),
+    )
+    return row